@@ -11,6 +11,8 @@ LOGGER = logging.getLogger(__name__)
 
 # Shared Configuration
 BACKUP_DIR = Path(__file__).parent.parent / "backupManager" / "history_backups"
+# Local classifier trained from earlier model answers (see classifier/local_model.py), kept with the backups
+LOCAL_MODEL_PATH = BACKUP_DIR / "local_model.npz"
 
 # CLASSIFIER CONFIGURATION
 import django
@@ -42,6 +44,35 @@ def load_initial_settings():
         'temperature': 0.1,  # Float value
         'max_tokens': 1000,  # Integer value
         'current_model': "",
+        'classification_batch_size': 20,  # History entries classified per model request
+        'llm_endpoints': [{'url': 'http://localhost:1234/v1', 'weight': 1, 'max_concurrency': 16}],  # Model servers, see classifier/endpoints.py
+        'classification_concurrency': 4,  # Classification requests in flight at first, adapted to the server
+        'classification_retry_attempts': 4,  # Tries per request on 429/5xx/timeouts, with backoff
+        'classification_request_timeout': 120,  # Seconds before a model request times out
+        'classification_short_answers': True,  # Answer with category numbers and a tight token budget
+        'model_thinking': False,  # The model reasons in a <think> block first (e.g. Qwen3): asked to skip it, with room for it
+        'classification_logprobs': False,  # Ask for token logprobs to score answers (if the server supports it)
+        'classification_min_confidence': 0.5,  # Less confident answers aren't cached or used for training
+        'classification_group_duplicates': True,  # Classify URLs differing only by tracking/session/page parameters once
+        'classification_ignored_params': [],  # Query parameters to drop besides those in classifier/canonical.py
+        'classification_rules': {},  # Extra url_patterns/domains/title_keywords rules, see classifier/rules.py
+        'classification_order': 'visit_count',  # 'visit_count', 'recent_visits' (ingested visits in range) or 'backup'
+        'classification_time_budget_seconds': 0,  # Stop a classification run after this long (0 = no limit)
+        'classification_request_budget': 0,  # Stop a classification run after this many model requests (0 = no limit)
+        'classification_sample_size': 300,  # Entries per browser classified by a Quick Estimate (sampling) job
+        'classification_sample_days': 90,  # Days covered by a Quick Estimate
+        'dashboard_estimate_categories': True,  # Extrapolate the category mix of a period from a Quick Estimate's sample
+        'classification_checkpoint_size': 500,  # Entries saved per job checkpoint
+        'classification_write_batch_size': 2000,  # Classified entries merged into one database write
+        'classification_job_timeout_seconds': 120,  # A running job without heartbeat for this long is interrupted
+        'local_model_enabled': True,  # Decide confident entries with the local classifier
+        'local_model_threshold': 0.2,  # Minimum confidence margin for a local decision
+        'local_model_audit_rate': 0.05,  # Share of confident entries still checked by the model
+        'incremental_backup': True,  # Only extract history changed since the last backup
+        'backup_format': 'ndjson',  # 'ndjson' or 'columnar' (memory-mapped, compressed)
+        'backup_retention_count': 10,  # Backup versions to keep per browser (0 = no count rule)
+        'backup_retention_days': 30,  # Keep versions younger than this many days (0 = no age rule)
+        'backup_interval_minutes': 60,  # Interval of the backup_scheduler management command
         'settings_loaded': True,
     }
 
@@ -90,6 +90,14 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        # Classification jobs write while the web server runs: writers wait for the lock instead of failing
+        'OPTIONS': {
+            'transaction_mode': 'IMMEDIATE',
+            'timeout': 20,
+            'init_command': 'PRAGMA journal_mode=WAL;',
+        },
+        # A file for tests too: the in-memory test database fails writes from other threads (the history writer)
+        'TEST': {'NAME': BASE_DIR / 'test_db.sqlite3'},
     }
 }
 
@@ -0,0 +1,198 @@
+"""
+Columnar backup format.
+
+A backup is a directory (<browser>_history.columnar/) with one file per column:
+
+- last_visit.npy   int64 epoch seconds (UTC), MISSING_TIME when unknown
+- visit_count.npy  int64
+- title_codes.npy / domain_codes.npy / profile_codes.npy  int32 indexes into the matching dictionary
+- title_dict.json.gz / domain_dict.json.gz / profile_dict.json.gz / url.json.gz  gzip-compressed string columns
+- meta.json        format version and row count
+
+Numeric columns are stored uncompressed so they can be memory-mapped: date range
+filters and min-date scans only touch last_visit.npy and never decode the strings.
+"""
+import gzip
+import json
+import os
+import shutil
+from array import array
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import numpy as np
+
+FORMAT_VERSION = 1
+SUFFIX = ".columnar"
+MISSING_TIME = np.iinfo(np.int64).min
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _to_epoch(last_visit: Optional[str]) -> int:
+    """Convert a 'YYYY-MM-DD HH:MM:SS' (UTC) string to epoch seconds"""
+    if not last_visit:
+        return MISSING_TIME
+    try:
+        return int((datetime.strptime(last_visit, "%Y-%m-%d %H:%M:%S") - _EPOCH).total_seconds())
+    except (ValueError, TypeError):
+        return MISSING_TIME
+
+
+def _write_strings(path: Path, values) -> None:
+    # No timestamp in the gzip header: the same strings always give the same file
+    with gzip.GzipFile(path, 'wb', mtime=0) as f:
+        f.write(json.dumps(values, ensure_ascii=False).encode('utf-8'))
+
+
+def _read_strings(path: Path) -> list:
+    with gzip.open(path, 'rt', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _codes_from_oldest(codes: array, values: Dict[str, int]) -> Tuple[np.ndarray, List[str]]:
+    """
+    Renumber dictionary codes by first appearance from the last row. Backups list the
+    newest rows first, so new rows at the front of the next backup append to the
+    dictionary rather than shift the codes of the rows it shares with this one.
+    """
+    codes = np.frombuffer(codes, dtype=np.int32)
+    _, first_from_end = np.unique(codes[::-1], return_index=True)
+    order = np.argsort(first_from_end)
+    remap = np.empty(len(order), dtype=np.int32)
+    remap[order] = np.arange(len(order), dtype=np.int32)
+    names = list(values)
+    return remap[codes], [names[i] for i in order]
+
+
+def write_columnar(rows: Iterable[Dict], path: Path) -> int:
+    """
+    Write rows to a columnar backup directory.
+    The directory is built under a temporary name and swapped into place once
+    complete. Nothing is written if there are no rows.
+    Returns the number of rows written.
+    """
+    last_visit = array('q')
+    visit_count = array('q')
+    title_codes = array('i')
+    domain_codes = array('i')
+    profile_codes = array('i')
+    urls = []
+    titles: Dict[str, int] = {}
+    domains: Dict[str, int] = {}
+    profiles: Dict[str, int] = {}
+
+    for row in rows:
+        url = row.get('url') or ''
+        urls.append(url)
+        last_visit.append(_to_epoch(row.get('last_visit')))
+        visit_count.append(int(row.get('visit_count') or 0))
+        title_codes.append(titles.setdefault(row.get('title') or '', len(titles)))
+        try:
+            domain = urlparse(url).netloc
+        except ValueError:
+            domain = ''
+        domain_codes.append(domains.setdefault(domain, len(domains)))
+        profile_codes.append(profiles.setdefault(row.get('profile') or '', len(profiles)))
+
+    if not urls:
+        return 0
+
+    title_codes, title_dict = _codes_from_oldest(title_codes, titles)
+    domain_codes, domain_dict = _codes_from_oldest(domain_codes, domains)
+    profile_codes, profile_dict = _codes_from_oldest(profile_codes, profiles)
+
+    tmp_path = path.with_name(path.name + ".tmp")
+    old_path = path.with_name(path.name + ".old")
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    tmp_path.mkdir(parents=True)
+    try:
+        np.save(tmp_path / "last_visit.npy", np.frombuffer(last_visit, dtype=np.int64))
+        np.save(tmp_path / "visit_count.npy", np.frombuffer(visit_count, dtype=np.int64))
+        np.save(tmp_path / "title_codes.npy", title_codes)
+        np.save(tmp_path / "domain_codes.npy", domain_codes)
+        np.save(tmp_path / "profile_codes.npy", profile_codes)
+        _write_strings(tmp_path / "title_dict.json.gz", title_dict)
+        _write_strings(tmp_path / "domain_dict.json.gz", domain_dict)
+        _write_strings(tmp_path / "profile_dict.json.gz", profile_dict)
+        _write_strings(tmp_path / "url.json.gz", urls)
+        with open(tmp_path / "meta.json", 'w', encoding='utf-8') as f:
+            json.dump({'version': FORMAT_VERSION, 'rows': len(urls)}, f)
+
+        # Directories can't be atomically replaced, so keep the old one until the swap is done
+        if path.exists():
+            os.replace(path, old_path)
+        os.replace(tmp_path, path)
+        shutil.rmtree(old_path, ignore_errors=True)
+    finally:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+    return len(urls)
+
+
+def load_visit_times(path: Path) -> np.ndarray:
+    """Memory-map the last_visit column (epoch seconds, MISSING_TIME when unknown)"""
+    return np.load(path / "last_visit.npy", mmap_mode='r')
+
+
+def visit_time_range(path: Path, exclude: Optional[datetime] = None) -> Tuple[Optional[datetime], Optional[datetime]]:
+    """Oldest and newest known last_visit of a backup, optionally ignoring one sentinel date"""
+    times = load_visit_times(path)
+    valid = times != MISSING_TIME
+    if exclude is not None:
+        valid &= times != int((exclude - _EPOCH).total_seconds())
+    if not valid.any():
+        return None, None
+    valid_times = times[valid]
+    return (_EPOCH + timedelta(seconds=int(valid_times.min())),
+            _EPOCH + timedelta(seconds=int(valid_times.max())))
+
+
+def read_profiles(path: Path) -> List[str]:
+    """Profiles present in a backup (empty for backups written before profiles were stored)"""
+    profile_dict = path / "profile_dict.json.gz"
+    return [p for p in _read_strings(profile_dict) if p] if profile_dict.exists() else []
+
+
+def iter_columnar(path: Path, start: Optional[datetime] = None, end: Optional[datetime] = None) -> Iterator[Dict]:
+    """
+    Stream the rows of a columnar backup, optionally only those whose last_visit
+    falls within [start, end]. The range is evaluated on the memory-mapped
+    timestamp column; string columns are only decoded if any row matches.
+    """
+    times = load_visit_times(path)
+    if start is None and end is None:
+        selected = np.arange(len(times))
+    else:
+        mask = times != MISSING_TIME
+        if start is not None:
+            mask &= times >= int((start - _EPOCH).total_seconds())
+        if end is not None:
+            mask &= times <= int((end - _EPOCH).total_seconds())
+        selected = np.flatnonzero(mask)
+    if not len(selected):
+        return
+
+    visit_counts = np.load(path / "visit_count.npy", mmap_mode='r')
+    title_codes = np.load(path / "title_codes.npy", mmap_mode='r')
+    titles = _read_strings(path / "title_dict.json.gz")
+    urls = _read_strings(path / "url.json.gz")
+    has_profiles = (path / "profile_codes.npy").exists()
+    if has_profiles:
+        profile_codes = np.load(path / "profile_codes.npy", mmap_mode='r')
+        profiles = _read_strings(path / "profile_dict.json.gz")
+
+    selected_times = np.asarray(times[selected])
+    dates = np.datetime_as_string(selected_times.astype('datetime64[s]'))
+    missing = selected_times == MISSING_TIME
+
+    for i, idx in enumerate(selected):
+        entry = {
+            'url': urls[idx],
+            'title': titles[title_codes[idx]],
+            'visit_count': int(visit_counts[idx]),
+            'last_visit': None if missing[i] else dates[i].replace('T', ' '),
+        }
+        if has_profiles and profiles[profile_codes[idx]]:
+            entry['profile'] = profiles[profile_codes[idx]]
+        yield entry
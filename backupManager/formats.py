@@ -0,0 +1,209 @@
+import hashlib
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from backupManager import columnar
+
+# Backup files in order of preference: columnar and line-delimited JSON first, legacy JSON arrays last
+BACKUP_SUFFIXES = (columnar.SUFFIX, ".ndjson", ".json")
+
+# Formats a backup can be written in, by setting value
+BACKUP_FORMATS = {
+    'ndjson': ".ndjson",
+    'columnar': columnar.SUFFIX,
+}
+
+
+def backup_globs() -> List[str]:
+    """Glob patterns matching every supported backup file"""
+    return [f"*_history{suffix}" for suffix in BACKUP_SUFFIXES]
+
+
+def find_backup_files(backup_dir: Path, browser: Optional[str] = None) -> List[Path]:
+    """
+    List the backup files in a directory, optionally only those of one browser.
+    When a browser has both an NDJSON and a legacy JSON backup, only the NDJSON one is returned.
+    """
+    found = {}
+    for suffix in BACKUP_SUFFIXES:
+        pattern = f"{browser.lower()}_history{suffix}" if browser else f"*_history{suffix}"
+        for path in backup_dir.glob(pattern):
+            found.setdefault(path.name[:-len(suffix)], path)
+    return list(found.values())
+
+
+# Placeholder date Chrome reports for URLs without a real visit time
+SUSPICIOUS_EPOCH = "1601-01-01 00:00:00"
+
+
+def backup_browser(path: Path) -> str:
+    """Browser name a backup belongs to, e.g. 'edge' for edge_history.ndjson"""
+    return path.name.rsplit("_history", 1)[0]
+
+
+def write_ndjson(rows: Iterable[Dict], path: Path) -> int:
+    """
+    Stream rows to a line-delimited JSON file, one object per line.
+    The file is written to a temporary name and renamed into place once complete,
+    so readers never see a partial backup. Nothing is written if there are no rows.
+    Returns the number of rows written.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    count = 0
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            for row in rows:
+                f.write(json.dumps(row, ensure_ascii=False))
+                f.write("\n")
+                count += 1
+        if count:
+            os.replace(tmp_path, path)
+    finally:
+        if tmp_path.exists():
+            tmp_path.unlink()
+    return count
+
+
+def write_backup(rows: Iterable[Dict], path: Path) -> int:
+    """Write a backup in the format given by the path's suffix, returns the number of rows written"""
+    if path.suffix == columnar.SUFFIX:
+        return columnar.write_columnar(rows, path)
+    return write_ndjson(rows, path)
+
+
+def _in_range(entry: Dict, start: Optional[str], end: Optional[str]) -> bool:
+    """Range check on 'last_visit' strings, which sort chronologically as text"""
+    last_visit = entry.get('last_visit') if isinstance(entry, dict) else None
+    if not isinstance(last_visit, str):
+        return False
+    return (start is None or last_visit >= start) and (end is None or last_visit <= end)
+
+
+def iter_backup_entries(path: Path, start: Optional[datetime] = None,
+                        end: Optional[datetime] = None) -> Iterator[Dict]:
+    """
+    Stream the entries of a backup, optionally only those whose 'last_visit'
+    falls within [start, end].
+    Columnar backups evaluate the range on their memory-mapped timestamp column,
+    NDJSON files are read line by line, and legacy indented JSON arrays are
+    still supported but have to be loaded in one go.
+    Raises json.JSONDecodeError / OSError on unreadable files.
+    """
+    if path.suffix == columnar.SUFFIX:
+        yield from columnar.iter_columnar(path, start, end)
+        return
+
+    filtered = start is not None or end is not None
+    start_str = start.strftime("%Y-%m-%d %H:%M:%S") if start is not None else None
+    end_str = end.strftime("%Y-%m-%d %H:%M:%S") if end is not None else None
+
+    if path.suffix == ".ndjson":
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    entry = json.loads(line)
+                    if not filtered or _in_range(entry, start_str, end_str):
+                        yield entry
+        return
+
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if not isinstance(data, list):
+        raise ValueError(f"Backup file {path} does not contain a JSON list")
+    for entry in data:
+        if not filtered or _in_range(entry, start_str, end_str):
+            yield entry
+
+
+def new_backup_stats() -> Dict:
+    """Empty statistics for track_backup_stats"""
+    return {'rows': 0, 'min_visit': None, 'max_visit': None, 'profiles': set()}
+
+
+def track_backup_stats(rows: Iterable[Dict], stats: Dict) -> Iterator[Dict]:
+    """
+    Pass rows through while collecting manifest statistics into `stats`:
+    row count, oldest/newest 'last_visit' (ignoring the 1601 placeholder) and profiles.
+    """
+    for row in rows:
+        stats['rows'] += 1
+        last_visit = row.get('last_visit')
+        if isinstance(last_visit, str) and last_visit != SUSPICIOUS_EPOCH:
+            if stats['min_visit'] is None or last_visit < stats['min_visit']:
+                stats['min_visit'] = last_visit
+            if stats['max_visit'] is None or last_visit > stats['max_visit']:
+                stats['max_visit'] = last_visit
+        if row.get('profile'):
+            stats['profiles'].add(row['profile'])
+        yield row
+
+
+def _backup_files(path: Path) -> List[Path]:
+    """Files making up a backup (a columnar backup is a directory)"""
+    return sorted(f for f in path.iterdir() if f.is_file()) if path.is_dir() else [path]
+
+
+def backup_checksum(path: Path) -> str:
+    """SHA-256 over the content of a backup"""
+    digest = hashlib.sha256()
+    for file in _backup_files(path):
+        digest.update(file.name.encode('utf-8'))
+        with open(file, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def backup_size(path: Path) -> int:
+    """Size of a backup on disk in bytes"""
+    return sum(file.stat().st_size for file in _backup_files(path))
+
+
+def manifest_path(backup_path: Path) -> Path:
+    """Sidecar manifest of a backup, e.g. chrome.manifest.json for chrome_history.ndjson"""
+    return backup_path.with_name(f"{backup_browser(backup_path)}.manifest.json")
+
+
+def write_manifest(backup_path: Path, stats: Dict, created_at: Optional[datetime] = None) -> Dict:
+    """
+    Write the manifest of a freshly written backup: row count, visit date range,
+    source browser/profiles, checksum, size and creation time (now, unless given).
+    Returns the manifest.
+    """
+    manifest = {
+        'browser': backup_browser(backup_path),
+        'file': backup_path.name,
+        'format': backup_path.suffix.lstrip('.'),
+        'rows': stats['rows'],
+        'min_visit': stats['min_visit'],
+        'max_visit': stats['max_visit'],
+        'profiles': sorted(stats['profiles']),
+        'sha256': backup_checksum(backup_path),
+        'bytes': backup_size(backup_path),
+        'created_at': (created_at or datetime.now()).strftime("%Y-%m-%d %H:%M:%S"),
+    }
+    path = manifest_path(backup_path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+    return manifest
+
+
+def read_manifest(backup_path: Path) -> Optional[Dict]:
+    """
+    Read the manifest of a backup. Returns None when it is missing, unreadable
+    or doesn't describe the backup currently on disk (other file or size).
+    """
+    path = manifest_path(backup_path)
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+        if manifest.get('file') != backup_path.name or manifest.get('bytes') != backup_size(backup_path):
+            return None
+        return manifest
+    except (OSError, json.JSONDecodeError, AttributeError):
+        return None
@@ -2,9 +2,12 @@ import json
 import logging
 from pathlib import Path
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional
 
 from HistoryApp import app_settings # Assuming this module exists and has BACKUP_DIR defined
+from backupManager import columnar
+from backupManager.formats import (find_backup_files, iter_backup_entries, new_backup_stats,
+                                   read_manifest, track_backup_stats, write_manifest)
 
 
 def check_backup_existence(backup_dir: Path) -> list[Path] | None:
@@ -15,7 +18,8 @@ def check_backup_existence(backup_dir: Path) -> list[Path] | None:
         backup_dir: The Path object representing the backup directory.
 
     Returns:
-        A list of Path objects for existing backup files (*_history.json),
+        A list of Path objects for existing backup files (*_history.ndjson,
+        or legacy *_history.json),
         or None if an error occurs during directory creation or listing.
         Returns an empty list if the directory exists but contains no backups.
     """
@@ -25,7 +29,7 @@ def check_backup_existence(backup_dir: Path) -> list[Path] | None:
         print(f"Checked/created backup directory: {backup_dir}")
 
         # Find backup files
-        backups = list(backup_dir.glob("*_history.json"))
+        backups = find_backup_files(backup_dir)
 
         if not backups:
             print("No backup files found.")
@@ -67,10 +71,11 @@ def check_backup_freshness(
 
     try:
         # Find the most recent backup file
-        latest_backup = max(backup_files, key=lambda f: f.stat().st_mtime)
+        backup_times = {backup_file: get_backup_time(backup_file) for backup_file in backup_files}
+        latest_backup = max(backup_times, key=backup_times.get)
 
         # Calculate its age
-        backup_time = datetime.fromtimestamp(latest_backup.stat().st_mtime)
+        backup_time = backup_times[latest_backup]
         current_time = datetime.now()
         backup_age = current_time - backup_time
 
@@ -119,14 +124,85 @@ def setup_and_validate_backup():
 # Define the suspicious date constant (naive datetime for comparison)
 SUSPICIOUS_EPOCH_DATE = datetime(1601, 1, 1, 0, 0, 0)
 
+def _valid_entries(backup_file_path: Path):
+    """Stream the entries of a backup, skipping malformed ones and dropping unparsable dates"""
+    for entry in iter_backup_entries(backup_file_path):
+        if not isinstance(entry, dict):
+            logging.warning(f"Skipping non-dictionary item in {backup_file_path}: {type(entry)}")
+            continue
+        last_visit = entry.get('last_visit')
+        if last_visit is not None:
+            try:
+                datetime.strptime(last_visit, '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                logging.warning(f"Could not parse date format for 'last_visit' ('{last_visit}') in {backup_file_path}. Entry: {entry.get('url', 'N/A')}")
+                entry = {**entry, 'last_visit': None}
+            except TypeError:
+                logging.warning(f"'last_visit' field is not a string ('{last_visit}') in {backup_file_path}. Entry: {entry.get('url', 'N/A')}")
+                entry = {**entry, 'last_visit': None}
+        yield entry
+
+
+def _scan_backup(backup_file_path: Path) -> Dict:
+    """Compute manifest statistics of a backup that was written without one"""
+    stats = new_backup_stats()
+    if backup_file_path.suffix == columnar.SUFFIX:
+        # Only the timestamp column is needed for the date range
+        min_visit, max_visit = columnar.visit_time_range(backup_file_path, exclude=SUSPICIOUS_EPOCH_DATE)
+        stats['rows'] = len(columnar.load_visit_times(backup_file_path))
+        stats['min_visit'] = min_visit.strftime('%Y-%m-%d %H:%M:%S') if min_visit else None
+        stats['max_visit'] = max_visit.strftime('%Y-%m-%d %H:%M:%S') if max_visit else None
+        stats['profiles'].update(columnar.read_profiles(backup_file_path))
+        return stats
+    for _ in track_backup_stats(_valid_entries(backup_file_path), stats):
+        pass
+    return stats
+
+
+def load_backup_manifest(backup_file_path: Path) -> Optional[Dict]:
+    """
+    Returns the manifest of a backup. Backups without a valid manifest (written
+    before manifests existed, or changed since) are scanned once and a fresh
+    manifest is written for them, dated with the file's modification time.
+
+    Returns:
+        Optional[Dict]: The manifest, or None if the backup can't be read.
+    """
+    manifest = read_manifest(backup_file_path)
+    if manifest is not None:
+        return manifest
+
+    logging.info(f"No valid manifest for {backup_file_path}, rebuilding it")
+    try:
+        stats = _scan_backup(backup_file_path)
+        created_at = datetime.fromtimestamp(backup_file_path.stat().st_mtime)
+        return write_manifest(backup_file_path, stats, created_at=created_at)
+    except json.JSONDecodeError as json_err:
+        logging.error(f"Error decoding JSON from file {backup_file_path}: {json_err}")
+    except FileNotFoundError:
+        logging.error(f"Backup file {backup_file_path} was not found during processing (unexpected).")
+    except IOError as io_err:
+        logging.error(f"IOError reading backup file {backup_file_path}: {io_err}")
+    except Exception as e:
+        logging.error(f"Unexpected error processing file {backup_file_path}: {e}", exc_info=True)
+    return None
+
+
+def get_backup_time(backup_file_path: Path) -> datetime:
+    """Creation time of a backup from its manifest, falling back to the file's modification time"""
+    manifest = load_backup_manifest(backup_file_path)
+    if manifest and manifest.get('created_at'):
+        return datetime.strptime(manifest['created_at'], '%Y-%m-%d %H:%M:%S')
+    return datetime.fromtimestamp(backup_file_path.stat().st_mtime)
+
+
 def get_oldest_entry_in_backups() -> Optional[datetime]:
     """
     Retrieves the oldest valid entry timestamp ('last_visit') across all backup
-    JSON files, ignoring the suspicious 1601-01-01 epoch date.
+    files, ignoring the suspicious 1601-01-01 epoch date.
 
-    Scans all .json files in the configured BACKUP_DIR, reads each entry,
-    parses the 'last_visit' field, finds the earliest datetime object,
-    explicitly skipping entries dated exactly 1601-01-01 00:00:00.
+    Answered from the manifest written next to each backup; backups without
+    a manifest are scanned once (see load_backup_manifest).
 
     Returns:
         Optional[datetime]: The datetime object of the oldest valid entry found,
@@ -141,61 +217,14 @@ def get_oldest_entry_in_backups() -> Optional[datetime]:
     oldest_valid_entry_date: Optional[datetime] = None # Initialize with type hint
 
     for backup_file_path in backup_files:
-        try:
-            with open(backup_file_path, 'r', encoding='utf-8') as f:
-                try:
-                    data = json.load(f)
-                except json.JSONDecodeError as json_err:
-                    logging.error(f"Error decoding JSON from file {backup_file_path}: {json_err}")
-                    continue
-
-                if not isinstance(data, list):
-                    logging.warning(f"Backup file {backup_file_path} does not contain a JSON list. Skipping.")
-                    continue
-
-                for entry in data:
-                    if not isinstance(entry, dict):
-                        logging.warning(f"Skipping non-dictionary item in {backup_file_path}: {type(entry)}")
-                        continue
-                    if 'last_visit' not in entry:
-                        logging.warning(f"Skipping entry without 'last_visit' key in {backup_file_path}. Entry: {entry.get('url', 'N/A')}")
-                        continue
-
-                    try:
-                        entry_date_str = entry['last_visit']
-                        # DEBUG: Log the string being parsed if issues persist
-                        # logging.debug(f"Attempting to parse date string: '{entry_date_str}' from {backup_file_path}")
-
-                        current_entry_date = datetime.strptime(entry_date_str, '%Y-%m-%d %H:%M:%S')
-
-                        # *** Filter out the suspicious 1601 date ***
-                        if current_entry_date == SUSPICIOUS_EPOCH_DATE:
-                            logging.debug(f"Ignoring suspicious epoch date ({SUSPICIOUS_EPOCH_DATE}) found in {backup_file_path}. Entry: {entry.get('url', 'N/A')}")
-                            continue # Skip this entry
-
-                        # Compare valid dates to find the oldest
-                        if oldest_valid_entry_date is None or current_entry_date < oldest_valid_entry_date:
-                            oldest_valid_entry_date = current_entry_date
-
-                    except ValueError:
-                        logging.warning(f"Could not parse date format for 'last_visit' ('{entry.get('last_visit', '')}') in {backup_file_path}. Entry: {entry.get('url', 'N/A')}")
-                        continue
-                    except TypeError:
-                         logging.warning(f"'last_visit' field is not a string ('{entry.get('last_visit', '')}') in {backup_file_path}. Entry: {entry.get('url', 'N/A')}")
-                         continue
-
-        except FileNotFoundError:
-             logging.error(f"Backup file {backup_file_path} was not found during processing (unexpected).")
-             continue
-        except IOError as io_err:
-            logging.error(f"IOError reading backup file {backup_file_path}: {io_err}")
-            continue
-        except Exception as e:
-            logging.error(f"Unexpected error processing file {backup_file_path}: {e}", exc_info=True)
+        manifest = load_backup_manifest(backup_file_path)
+        if not manifest or not manifest.get('min_visit'):
             continue
+        current_entry_date = datetime.strptime(manifest['min_visit'], '%Y-%m-%d %H:%M:%S')
+        if oldest_valid_entry_date is None or current_entry_date < oldest_valid_entry_date:
+            oldest_valid_entry_date = current_entry_date
 
     if oldest_valid_entry_date is None:
         logging.info(f"No valid, non-epoch entries with parsable 'last_visit' dates found in {app_settings.BACKUP_DIR}.")
 
     return oldest_valid_entry_date
-
@@ -1,21 +1,84 @@
 import sqlite3
 import platform
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import closing, contextmanager
+from datetime import datetime
 from pathlib import Path
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Iterator, Iterable, Tuple, Set
 import json
 
-
-
+from backupManager.formats import (
+    BACKUP_FORMATS, find_backup_files, iter_backup_entries, new_backup_stats, track_backup_stats,
+    write_backup, write_manifest, write_ndjson,
+)
+from backupManager.store import BackupStore
+
+
+# Seconds between the Chrome/WebKit epoch (1601-01-01) and the Unix epoch
+CHROME_EPOCH_OFFSET = 11644473600
+
+# Chromium-based browsers share Chrome's History schema. Paths are the
+# "User Data" directories (relative to home) holding one folder per profile.
+CHROMIUM_BROWSERS = {
+    'chrome': {
+        'Windows': 'AppData/Local/Google/Chrome/User Data',
+        'Darwin': 'Library/Application Support/Google/Chrome',
+        'Linux': '.config/google-chrome',
+    },
+    'chromium': {
+        'Windows': 'AppData/Local/Chromium/User Data',
+        'Darwin': 'Library/Application Support/Chromium',
+        'Linux': '.config/chromium',
+    },
+    'edge': {
+        'Windows': 'AppData/Local/Microsoft/Edge/User Data',
+        'Darwin': 'Library/Application Support/Microsoft Edge',
+        'Linux': '.config/microsoft-edge',
+    },
+    'brave': {
+        'Windows': 'AppData/Local/BraveSoftware/Brave-Browser/User Data',
+        'Darwin': 'Library/Application Support/BraveSoftware/Brave-Browser',
+        'Linux': '.config/BraveSoftware/Brave-Browser',
+    },
+    'vivaldi': {
+        'Windows': 'AppData/Local/Vivaldi/User Data',
+        'Darwin': 'Library/Application Support/Vivaldi',
+        'Linux': '.config/vivaldi',
+    },
+}
+
+# Firefox directories holding profiles.ini, relative to home
+FIREFOX_DIRS = {
+    'Windows': 'AppData/Roaming/Mozilla/Firefox',
+    'Darwin': 'Library/Application Support/Firefox',
+    'Linux': '.mozilla/firefox',
+}
 
 
 class BrowserHistoryReader:
-    def __init__(self):
+    def __init__(self, backup_format: str = "ndjson", retention_count: int = 10, retention_days: int = 30):
         self.system = platform.system()
         self.home = Path.home()
         from HistoryApp import app_settings
         self.app_settings = app_settings
 
         self.logger = app_settings.LOGGER
+        if backup_format not in BACKUP_FORMATS:
+            self.logger.warning(f"Unknown backup format '{backup_format}', using ndjson")
+            backup_format = "ndjson"
+        self.backup_format = backup_format
+        # Every written backup is also kept as a deduplicated version, pruned by these rules
+        self.store = BackupStore(app_settings.BACKUP_DIR / "store")
+        self.retention_count = retention_count
+        self.retention_days = retention_days
+        # Timing of every database snapshot taken by this reader
+        self.snapshot_stats: List[Dict] = []
+        # Snapshots kept for reuse inside shared_snapshots(), by database path
+        self._shared_snapshots: Optional[Dict] = None
 
     def _create_backup_dir(self) -> bool:
         """Create backup directory if it doesn't exist"""
@@ -26,27 +89,33 @@ class BrowserHistoryReader:
             self.logger.error(f"Failed to create backup directory: {e}")
             return False
 
-    def _get_chrome_path(self) -> Optional[Path]:
-        """Get Chrome history file path for current OS"""
-        paths = {
-            'Windows': self.home / 'AppData' / 'Local' / 'Google' / 'Chrome' / 'User Data' / 'Default' / 'History',
-            'Darwin': self.home / 'Library' / 'Application Support' / 'Google' / 'Chrome' / 'Default' / 'History',
-            'Linux': self.home / '.config' / 'google-chrome' / 'Default' / 'History'
-        }
+    @staticmethod
+    def _is_chromium(browser_name: str) -> bool:
+        """Whether a browser uses the Chromium History schema and epoch"""
+        return browser_name.lower() in CHROMIUM_BROWSERS
 
-        path = paths.get(self.system)
+    def _get_chrome_path(self) -> Optional[Path]:
+        """Get Chrome history file path (Default profile) for current OS"""
+        user_data = CHROMIUM_BROWSERS['chrome'].get(self.system)
+        path = self.home / user_data / 'Default' / 'History' if user_data else None
         if not path or not path.exists():
             self.logger.error(f"Chrome history path not found: {path}")
             return None
         return path
 
-    def _get_firefox_profile(self) -> Optional[Path]:
-        """Handle UTF-16 encoded profiles.ini files"""
-        base_path = self.home / 'AppData' / 'Roaming' / 'Mozilla' / 'Firefox'
+    def _get_firefox_profiles(self) -> List[Path]:
+        """
+        All Firefox profile directories with a history database, the
+        default-release profile first. Handles UTF-16 encoded profiles.ini files
+        """
+        firefox_dir = FIREFOX_DIRS.get(self.system)
+        if not firefox_dir:
+            return []
+        base_path = self.home / firefox_dir
         profiles_ini = base_path / 'profiles.ini'
 
         if not profiles_ini.exists():
-            return None
+            return []
 
         try:
             # Detect encoding using BOM
@@ -71,27 +140,192 @@ class BrowserHistoryReader:
                         key, value = line.split('=', 1)
                         profile_data[current_section][key.strip()] = value.strip()
 
-            # Find default profile
+            profiles = []
             for section, data in profile_data.items():
-                if data.get('Name').__contains__('default-release') and 'Path' in data:
-                    profile_path = base_path / data['Path']
-                    if (profile_path / 'places.sqlite').exists():
-                        self.logger.debug(f"Found Firefox profile: {profile_path}")
-                        return profile_path
-            return None
+                if 'Path' not in data:
+                    continue
+                is_relative = data.get('IsRelative', '1') == '1'
+                profile_path = base_path / data['Path'] if is_relative else Path(data['Path'])
+                if (profile_path / 'places.sqlite').exists():
+                    self.logger.debug(f"Found Firefox profile: {profile_path}")
+                    if 'default-release' in data.get('Name', ''):
+                        profiles.insert(0, profile_path)
+                    else:
+                        profiles.append(profile_path)
+            return profiles
 
         except UnicodeDecodeError as e:
             self.logger.error(f"Encoding error in {profiles_ini}: {e}")
-            return None
+            return []
+
+    def _get_firefox_profile(self) -> Optional[Path]:
+        """Get the default Firefox profile directory"""
+        profiles = self._get_firefox_profiles()
+        return profiles[0] if profiles else None
+
+    def discover_sources(self) -> List[Dict]:
+        """
+        Enumerate every profile of every supported browser that has a history database.
+        Each source is a dict with 'browser', 'profile' (profile folder name),
+        'profile_dir' and 'path' (the history database).
+        """
+        sources = []
+        for browser, user_data_dirs in CHROMIUM_BROWSERS.items():
+            user_data = user_data_dirs.get(self.system)
+            if not user_data or not (self.home / user_data).is_dir():
+                continue
+            for profile_dir in sorted((self.home / user_data).iterdir()):
+                history = profile_dir / 'History'
+                if profile_dir.is_dir() and history.is_file():
+                    sources.append({
+                        'browser': browser,
+                        'profile': profile_dir.name,
+                        'profile_dir': profile_dir,
+                        'path': history,
+                    })
+
+        for profile_dir in self._get_firefox_profiles():
+            sources.append({
+                'browser': 'firefox',
+                'profile': profile_dir.name,
+                'profile_dir': profile_dir,
+                'path': profile_dir / 'places.sqlite',
+            })
+
+        names = ', '.join(f"{source['browser']}/{source['profile']}" for source in sources)
+        self.logger.info(f"Discovered {len(sources)} history sources: {names}")
+        return sources
+
+    @staticmethod
+    def source_fingerprint(source: Dict) -> List[List]:
+        """
+        Cheap change marker of a source: modification time and size of its history
+        database and of its -wal/-journal files. Equal fingerprints mean the browser
+        hasn't written any history since, so there is nothing new to back up.
+        """
+        fingerprint = []
+        for suffix in ("", "-wal", "-journal"):
+            path = source['path'].with_name(source['path'].name + suffix)
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            fingerprint.append([path.name, stat.st_mtime_ns, stat.st_size])
+        return fingerprint
+
+    @staticmethod
+    def _backup_database(source_uri: str, target: Path, timeout: float = 1.0) -> None:
+        """Copy a database with the SQLite online backup API (includes committed WAL content)"""
+        with closing(sqlite3.connect(source_uri, uri=True, timeout=timeout)) as src:
+            # Connection.backup retries forever on a locked source, so fail fast here instead
+            src.execute("SELECT count(*) FROM sqlite_master").fetchone()
+            with closing(sqlite3.connect(str(target))) as dst:
+                src.backup(dst)
+
+    def _take_snapshot(self, path: Path, directory: Path) -> Path:
+        """
+        Take a consistent, private copy of a (possibly live) browser database in `directory`.
+
+        Tries, in order:
+        - online backup from a read-only connection (works while the browser runs
+          unless it holds an exclusive lock)
+        - raw copy of the database plus its -wal/-journal files, then an online
+          backup of that copy so the WAL is folded in
+        - online backup from an `immutable` connection, which ignores locks and the WAL
+
+        Returns the path of the snapshot.
+        """
+        start = time.perf_counter()
+        target = directory / f"{path.name}.snapshot"
+        method = None
+        try:
+            self._backup_database(f"{path.as_uri()}?mode=ro", target)
+            method = "online-backup"
+        except sqlite3.OperationalError as e:
+            self.logger.debug(f"Online backup of {path} failed ({e}), copying files instead")
+            target.unlink(missing_ok=True)
+
+        if method is None:
+            raw_dir = directory / "raw"
+            try:
+                raw_dir.mkdir()
+                for suffix in ("", "-wal", "-journal"):
+                    source = path.with_name(path.name + suffix)
+                    if source.exists():
+                        shutil.copy2(source, raw_dir / source.name)
+                self._backup_database((raw_dir / path.name).as_uri(), target)
+                method = "file-copy"
+            except (OSError, sqlite3.Error) as e:
+                self.logger.debug(f"File copy of {path} failed ({e}), reading it as immutable")
+                target.unlink(missing_ok=True)
+            finally:
+                shutil.rmtree(raw_dir, ignore_errors=True)
+
+        if method is None:
+            self._backup_database(f"{path.as_uri()}?mode=ro&immutable=1", target)
+            method = "immutable"
+
+        elapsed = time.perf_counter() - start
+        stats = {
+            'source': str(path),
+            'method': method,
+            'bytes': target.stat().st_size,
+            'seconds': round(elapsed, 4),
+        }
+        self.snapshot_stats.append(stats)
+        self.logger.info(f"Snapshot of {path} via {method}: {stats['bytes']} bytes in {elapsed:.3f}s")
+        return target
 
-    def _read_sqlite(self, path: Path, query: str) -> List[Dict]:
-        """Generic SQLite reader with error handling"""
+    @contextmanager
+    def _snapshot(self, path: Path) -> Iterator[Path]:
+        """
+        Snapshot of a browser database to read from (see _take_snapshot), deleted on exit.
+        Inside shared_snapshots() the database's snapshot is taken once and then reused.
+        """
+        shared = self._shared_snapshots
+        if shared is None:
+            with tempfile.TemporaryDirectory(prefix="history_snapshot_") as tmp:
+                yield self._take_snapshot(path, Path(tmp))
+            return
+
+        with shared['lock']:
+            entry = shared['snapshots'].setdefault(path, {
+                'lock': threading.Lock(),
+                'dir': shared['dir'] / str(len(shared['snapshots'])),
+                'path': None,
+            })
+        # Locked per database, so different databases are still snapshotted concurrently
+        with entry['lock']:
+            if entry['path'] is None:
+                entry['dir'].mkdir(exist_ok=True)
+                entry['path'] = self._take_snapshot(path, entry['dir'])
+        yield entry['path']
+
+    @contextmanager
+    def shared_snapshots(self) -> Iterator[None]:
+        """
+        Within the block, every read of a database uses one snapshot of it: a run that
+        backs up sources and then ingests their history and visits copies each database
+        once, and all three see the same data. The snapshots are deleted on exit.
+        """
+        with tempfile.TemporaryDirectory(prefix="history_snapshot_") as tmp:
+            self._shared_snapshots = {'dir': Path(tmp), 'snapshots': {}, 'lock': threading.Lock()}
+            try:
+                yield
+            finally:
+                self._shared_snapshots = None
+
+    def _read_sqlite(self, path: Path, query: str, params: tuple = ()) -> List[Dict]:
+        """Generic SQLite reader with error handling, reads from a snapshot of the database"""
         try:
-            with sqlite3.connect(str(path)) as conn:
+            with self._snapshot(path) as snapshot, closing(sqlite3.connect(str(snapshot))) as conn:
                 conn.row_factory = sqlite3.Row
                 cursor = conn.cursor()
-                cursor.execute(query)
-                return [dict(row) for row in cursor.fetchall()]
+                start = time.perf_counter()
+                cursor.execute(query, params)
+                rows = [dict(row) for row in cursor.fetchall()]
+                self.logger.info(f"Read {len(rows)} rows from {path.name} in {time.perf_counter() - start:.3f}s")
+                return rows
         except sqlite3.OperationalError as e:
             self.logger.error(f"Database error: {e}")
             return []
@@ -99,92 +333,401 @@ class BrowserHistoryReader:
             self.logger.error(f"Unexpected error reading {path}: {e}")
             return []
 
-    def get_chrome_history(self, max_results: int = 99999) -> List[Dict]:
-        """Get Chrome browsing history"""
-        path = self._get_chrome_path()
-        if not path:
-            return []
+    def _iter_sqlite(self, path: Path, query: str, params: tuple = (), batch_size: int = 5000,
+                     raise_errors: bool = False) -> Iterator[Dict]:
+        """
+        Stream query results from a snapshot of the database in `fetchmany` batches,
+        so memory stays bounded regardless of the number of rows.
+        Errors are logged and end the stream, unless `raise_errors` is set.
+        """
+        try:
+            with self._snapshot(path) as snapshot, closing(sqlite3.connect(str(snapshot))) as conn:
+                conn.row_factory = sqlite3.Row
+                cursor = conn.cursor()
+                start = time.perf_counter()
+                count = 0
+                cursor.execute(query, params)
+                while True:
+                    rows = cursor.fetchmany(batch_size)
+                    if not rows:
+                        break
+                    count += len(rows)
+                    for row in rows:
+                        yield dict(row)
+                self.logger.info(f"Streamed {count} rows from {path.name} in {time.perf_counter() - start:.3f}s")
+        except sqlite3.OperationalError as e:
+            self.logger.error(f"Database error: {e}")
+            if raise_errors:
+                raise
+        except Exception as e:
+            self.logger.error(f"Unexpected error reading {path}: {e}")
+            if raise_errors:
+                raise
 
+    def _history_query(self, browser_name: str, max_results: int = 99999,
+                       since: Optional[int] = None) -> Tuple[str, tuple]:
+        """
+        Build the per-URL history query for a browser's schema.
+        If `since` (browser native time, microseconds) is given, only rows
+        visited after it are selected.
+        Returns (query, params)
+        """
+        params = (since,) if since is not None else ()
+
+        if self._is_chromium(browser_name):
+            where = "WHERE last_visit_time > ?" if since is not None else ""
+            query = f"""
+                SELECT url, title, visit_count, 
+                       datetime((last_visit_time/1000000) - {CHROME_EPOCH_OFFSET}, 'unixepoch') as last_visit
+                FROM urls
+                {where}
+                ORDER BY last_visit_time DESC
+                LIMIT {max_results}
+            """
+            return query, params
+
+        where = "WHERE last_visit_date > ?" if since is not None else ""
         query = f"""
             SELECT url, title, visit_count, 
-                   datetime((last_visit_time/1000000) - 11644473600, 'unixepoch') as last_visit
-            FROM urls
-            ORDER BY last_visit_time DESC
+                   datetime(last_visit_date/1000000, 'unixepoch') as last_visit
+            FROM moz_places
+            {where}
+            ORDER BY last_visit_date DESC
             LIMIT {max_results}
         """
+        return query, params
 
-        return self._read_sqlite(path, query)
+    def _history_source(self, browser_name: str, max_results: int = 99999,
+                        since: Optional[int] = None) -> Optional[Tuple[Path, str, tuple]]:
+        """
+        Build the per-URL history query for the default profile of Chrome or Firefox.
+        Returns (database path, query, params), or None if the browser isn't found.
+        """
+        if browser_name.lower() == "chrome":
+            path = self._get_chrome_path()
+            if not path:
+                return None
+            return (path, *self._history_query(browser_name, max_results, since))
 
-    def get_firefox_history(self, max_results: int = 99999) -> List[Dict]:
-        """Get Firefox browsing history"""
         profile_dir = self._get_firefox_profile()
         if not profile_dir:
-            return []
+            return None
 
         path = profile_dir / 'places.sqlite' if profile_dir.is_dir() else profile_dir
         if not path.exists():
             self.logger.error(f"Firefox history file not found: {path}")
-            return []
+            return None
 
-        query = f"""
-            SELECT url, title, visit_count, 
-                   datetime(last_visit_date/1000000, 'unixepoch') as last_visit
-            FROM moz_places
-            ORDER BY last_visit_date DESC
-            LIMIT {max_results}
+        return (path, *self._history_query(browser_name, max_results, since))
+
+    def get_chrome_history(self, max_results: int = 99999, since: Optional[int] = None) -> List[Dict]:
+        """
+        Get Chrome browsing history.
+        If `since` (Chrome time, microseconds since 1601) is given, only rows
+        visited after it are returned.
+        """
+        source = self._history_source("chrome", max_results, since)
+        return self._read_sqlite(*source) if source else []
+
+    def get_firefox_history(self, max_results: int = 99999, since: Optional[int] = None) -> List[Dict]:
+        """
+        Get Firefox browsing history.
+        If `since` (PRTime, microseconds since 1970) is given, only rows
+        visited after it are returned.
+        """
+        source = self._history_source("firefox", max_results, since)
+        return self._read_sqlite(*source) if source else []
+
+    def iter_history(self, browser_name: str, max_results: int = 99999, since: Optional[int] = None,
+                     batch_size: int = 5000) -> Iterator[Dict]:
+        """Stream browsing history straight from the database cursor, see get_chrome_history"""
+        source = self._history_source(browser_name, max_results, since)
+        if source:
+            path, query, params = source
+            yield from self._iter_sqlite(path, query, params, batch_size)
+
+    def iter_source_history(self, source: Dict, since_visit: Optional[str] = None,
+                            batch_size: int = 5000) -> Iterator[Dict]:
+        """
+        Stream the history of one discovered source (see discover_sources) from a
+        snapshot of its database. If `since_visit` ('YYYY-MM-DD HH:MM:SS') is given,
+        only rows visited since then are read.
+        """
+        since = self._to_browser_time(since_visit, source['browser'])
+        query, params = self._history_query(source['browser'], since=since)
+        yield from self._iter_sqlite(source['path'], query, params, batch_size)
+
+    def get_profile_dir(self, browser_name: str) -> Optional[Path]:
+        """Return the default profile directory of Chrome or Firefox"""
+        if browser_name.lower() == "chrome":
+            path = self._get_chrome_path()
+            return path.parent if path else None
+        return self._get_firefox_profile()
+
+    def iter_visits(self, browser_name: str, profile_dir: Optional[Path] = None,
+                    since_id: Optional[int] = None, batch_size: int = 5000) -> Iterator[Dict]:
+        """
+        Stream individual visit events (one row per visit, not per URL) joined with
+        their URL and title, ordered by visit id.
+        If `since_id` is given, only visits with a greater id are returned.
+        """
+        browser = browser_name.lower()
+        profile_dir = profile_dir or self.get_profile_dir(browser)
+        if not profile_dir:
+            return
+
+        where = "WHERE v.id > ?" if since_id is not None else ""
+        if self._is_chromium(browser):
+            path = profile_dir / 'History'
+            query = f"""
+                SELECT v.id AS visit_id, u.url, COALESCE(u.title, '') AS title,
+                       datetime((v.visit_time/1000000) - {CHROME_EPOCH_OFFSET}, 'unixepoch') AS visit_time
+                FROM visits v
+                JOIN urls u ON u.id = v.url
+                {where}
+                ORDER BY v.id
+            """
+        else:
+            path = profile_dir / 'places.sqlite'
+            query = f"""
+                SELECT v.id AS visit_id, p.url, COALESCE(p.title, '') AS title,
+                       datetime(v.visit_date/1000000, 'unixepoch') AS visit_time
+                FROM moz_historyvisits v
+                JOIN moz_places p ON p.id = v.place_id
+                {where}
+                ORDER BY v.id
+            """
+
+        if not path.exists():
+            self.logger.error(f"{browser_name} history file not found: {path}")
+            return
+
+        yield from self._iter_sqlite(path, query, (since_id,) if since_id is not None else (), batch_size)
+
+    def _load_watermarks(self) -> Dict[str, int]:
+        """Load the per browser/profile incremental extraction watermarks"""
+        path = self.app_settings.BACKUP_DIR / "watermarks.json"
+        if not path.exists():
+            return {}
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, json.JSONDecodeError) as e:
+            self.logger.error(f"Failed to load watermarks, falling back to full extraction: {e}")
+            return {}
+
+    def _save_watermarks(self, watermarks: Dict[str, int]) -> None:
+        """Persist the incremental extraction watermarks"""
+        try:
+            with open(self.app_settings.BACKUP_DIR / "watermarks.json", 'w', encoding='utf-8') as f:
+                json.dump(watermarks, f, indent=2)
+        except OSError as e:
+            self.logger.error(f"Failed to save watermarks: {e}")
+
+    @staticmethod
+    def _to_browser_time(last_visit: Optional[str], browser_name: str) -> Optional[int]:
+        """
+        Convert a backup 'last_visit' string back to the browser's native timestamp.
+        The string only has second precision, so the watermark is floored to the
+        second: rows from that second are read again and deduplicated on merge.
+        """
+        if not last_visit:
+            return None
+        try:
+            epoch = int((datetime.strptime(last_visit, "%Y-%m-%d %H:%M:%S") - datetime(1970, 1, 1)).total_seconds())
+        except ValueError:
+            return None
+        if BrowserHistoryReader._is_chromium(browser_name):
+            epoch += CHROME_EPOCH_OFFSET
+        return epoch * 1000000
+
+    def _current_backup(self, browser_name: str) -> Optional[Path]:
+        """Path of the current backup of a browser, None if there is none"""
+        backups = find_backup_files(self.app_settings.BACKUP_DIR, browser_name)
+        return backups[0] if backups else None
+
+    @staticmethod
+    def _merge_history(existing: Iterable[Dict], new_rows: Iterable[Dict],
+                       new_keys: Set[Tuple[Optional[str], str]]) -> Iterator[Dict]:
+        """
+        Merge newly extracted rows into a stream of backup entries, newer rows
+        replace older ones with the same (profile, URL). Entries from backups
+        written before rows were tagged with their profile are matched by URL.
+        New rows come first, so the most-recent-first order of the backup is
+        kept without loading it.
+        """
+        new_urls = {url for _, url in new_keys}
+        yield from new_rows
+        for entry in existing:
+            profile = entry.get('profile')
+            if (profile, entry.get('url')) in new_keys or (profile is None and entry.get('url') in new_urls):
+                continue
+            yield entry
+
+    def _extract_source(self, source: Dict, since: Optional[int], spool_path: Path) -> Dict:
         """
+        Stream the (new) history rows of one source into a spool file, tagging each
+        row with its profile and tracking the newest visit as the next watermark.
+        Runs in a worker thread; errors are reported in the returned stats.
+        """
+        start = time.perf_counter()
+        stats = {
+            'browser': source['browser'],
+            'profile': source['profile'],
+            'key': f"{source['browser']}:{source['profile_dir']}",
+            'incremental': since is not None,
+            'rows': 0,
+            'watermark': since,
+            'spool': None,
+            'error': None,
+        }
+        query, params = self._history_query(source['browser'], since=since)
 
-        return self._read_sqlite(path, query)
+        def tagged_rows():
+            for row in self._iter_sqlite(source['path'], query, params, raise_errors=True):
+                row['profile'] = source['profile']
+                visit_time = self._to_browser_time(row.get('last_visit'), source['browser'])
+                if visit_time and (stats['watermark'] is None or visit_time > stats['watermark']):
+                    stats['watermark'] = visit_time
+                yield row
 
-    def _clean_old_backups(self, browser_name: str) -> None:
-        """Delete previous backups for the specified browser"""
+        try:
+            stats['rows'] = write_ndjson(tagged_rows(), spool_path)
+            stats['spool'] = spool_path if stats['rows'] else None
+        except Exception as e:
+            stats['error'] = str(e)
+            self.logger.error(f"Extraction of {source['browser']}/{source['profile']} failed: {e}")
+
+        stats['seconds'] = round(time.perf_counter() - start, 4)
+        return stats
+
+    def backup_sources(self, sources: Optional[List[Dict]] = None, incremental: bool = True,
+                       max_workers: int = 4) -> Dict:
+        """
+        Back up every discovered browser profile (or the given sources), snapshotting
+        and reading them concurrently in a thread pool, then writing one backup per
+        browser with the rows of all its profiles.
+
+        In incremental mode only rows changed since each source's watermark are read
+        and merged into the existing backup; a source without a watermark (or a
+        browser without a backup) gets a full extraction.
+
+        Returns a summary with the total duration, per-source stats (rows, seconds,
+        errors) and the number of entries written per browser.
+        """
+        start = time.perf_counter()
+        sources = self.discover_sources() if sources is None else sources
+        summary = {'seconds': 0.0, 'sources': [], 'browsers': {}}
+        if not sources:
+            self.logger.warning("No browser history sources found, nothing to back up")
+            return summary
+
+        if not self._create_backup_dir():
+            return summary
+
+        watermarks = self._load_watermarks() if incremental else {}
+        browsers = list(dict.fromkeys(source['browser'] for source in sources))
+        existing = {browser: self._current_backup(browser) if incremental else None for browser in browsers}
+
+        with tempfile.TemporaryDirectory(prefix="history_spool_") as spool_dir:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as pool:
+                futures = []
+                for i, source in enumerate(sources):
+                    key = f"{source['browser']}:{source['profile_dir']}"
+                    since = watermarks.get(key) if existing[source['browser']] is not None else None
+                    futures.append(pool.submit(self._extract_source, source, since, Path(spool_dir) / f"{i}.ndjson"))
+                results = [future.result() for future in futures]
+
+            for browser in browsers:
+                browser_results = [r for r in results if r['browser'] == browser]
+                if not incremental and any(r['error'] for r in browser_results):
+                    self.logger.error(f"Keeping previous {browser} backup, a profile failed during full extraction")
+                    continue
+                spools = [r['spool'] for r in browser_results if r['spool']]
+                if not spools:
+                    self.logger.info(f"No new {browser} history since last backup")
+                    continue
+
+                new_keys = {(row.get('profile'), row.get('url')) for spool in spools for row in iter_backup_entries(spool)}
+                new_rows = (row for spool in spools for row in iter_backup_entries(spool))
+                existing_entries = iter_backup_entries(existing[browser]) if existing[browser] is not None else ()
+                if self.backup_history(self._merge_history(existing_entries, new_rows, new_keys), browser):
+                    summary['browsers'][browser] = len(new_keys)
+                    for r in browser_results:
+                        if not r['error'] and r['watermark'] is not None:
+                            watermarks[r['key']] = r['watermark']
+
+        self._save_watermarks(watermarks)
+
+        for r in results:
+            r.pop('spool')
+            r.pop('watermark')
+        summary['sources'] = results
+        summary['seconds'] = round(time.perf_counter() - start, 4)
+        slowest = max(r['seconds'] for r in results)
+        self.logger.info(f"Backed up {len(results)} sources in {summary['seconds']:.3f}s "
+                         f"(slowest source {slowest:.3f}s, sum {sum(r['seconds'] for r in results):.3f}s)")
+        return summary
+
+    def _clean_old_backups(self, browser_name: str, keep: Optional[Path] = None) -> None:
+        """Delete previous backups for the specified browser, except `keep`"""
         try:
             pattern = f"{browser_name.lower()}_history.*"
             for old_file in self.app_settings.BACKUP_DIR.glob(pattern):
-                if old_file.is_file():
+                if old_file == keep:
+                    continue
+                if old_file.is_dir():
+                    shutil.rmtree(old_file)
+                    self.logger.debug(f"Deleted old backup: {old_file}")
+                elif old_file.is_file():
                     old_file.unlink()
                     self.logger.debug(f"Deleted old backup: {old_file}")
         except Exception as e:
             self.logger.error(f"Failed to clean old backups: {e}")
 
-    def backup_history(self, history_data: List[Dict], browser_name: str) -> Optional[Path]:
+    def _store_version(self, backup_path: Path, browser_name: str) -> None:
+        """Commit a written backup to the version store and apply the retention policy"""
+        try:
+            version = self.store.commit(backup_path)
+            pruned = self.store.prune(browser_name, keep_count=self.retention_count, keep_days=self.retention_days)
+            deleted = self.store.collect_garbage() if pruned else 0
+            self.logger.info(f"Stored {browser_name} backup version {version['id']} "
+                             f"(pruned {pruned} versions, {deleted} chunks, store size {self.store.size()} bytes)")
+        except Exception as e:
+            self.logger.error(f"Failed to store {browser_name} backup version: {e}")
+
+    def backup_history(self, history_data: Iterable[Dict], browser_name: str) -> Optional[Path]:
         """
-        Save history data to JSON and CSV files, deleting previous backups
+        Stream history data (a list or any iterator, e.g. straight from the
+        database cursor) to a backup in the configured format (line-delimited
+        JSON or columnar), replacing previous backups. The new backup is also
+        committed to the version store, so earlier runs stay available.
         Returns path to backup directory if successful
         """
-        if not history_data:
-            self.logger.warning(f"No {browser_name} history to backup")
-            return None
-
         if not self._create_backup_dir():
             return None
 
         try:
-            # Clean previous backups first
-            self._clean_old_backups(browser_name)
-
             # Create fixed filename without timestamp
             base_name = f"{browser_name.lower()}_history"
 
-            if browser_name.lower() == "chrome":
-                # pprint(history_data)
-                pass
-
-            # JSON Backup
-            json_path = self.app_settings.BACKUP_DIR / f"{base_name}.json"
-            with open(json_path, 'w', encoding='utf-8') as f:
-                json.dump(history_data, f, indent=2, ensure_ascii=False)
-            '''
-            # CSV Backup
-            csv_path = self.backup_dir / f"{base_name}.csv"
-            with open(csv_path, 'w', newline='', encoding='utf-8') as f:
-                writer = csv.DictWriter(f, fieldnames=history_data[0].keys())
-                writer.writeheader()
-                writer.writerows(history_data)
-            '''
-
-            self.logger.info(f"Backup created at {self.backup_dir}\n")
-            return self.backup_dir
+            # Written under a temp name and swapped into place
+            backup_path = self.app_settings.BACKUP_DIR / f"{base_name}{BACKUP_FORMATS[self.backup_format]}"
+            stats = new_backup_stats()
+            count = write_backup(track_backup_stats(history_data, stats), backup_path)
+            if not count:
+                self.logger.warning(f"No {browser_name} history to backup")
+                return None
+
+            # Small sidecar so freshness/date-range checks never re-read the backup
+            write_manifest(backup_path, stats)
+
+            # Only drop previous backups (other formats, legacy .json) once the new one is in place
+            self._clean_old_backups(browser_name, keep=backup_path)
+            self._store_version(backup_path, browser_name)
+
+            self.logger.info(f"Backup of {count} {browser_name} entries created at {self.app_settings.BACKUP_DIR}\n")
+            return self.app_settings.BACKUP_DIR
 
         except Exception as e:
             self.logger.error(f"Backup failed: {e}")
@@ -195,12 +738,6 @@ class BrowserHistoryReader:
 if __name__ == "__main__":
     reader = BrowserHistoryReader()
 
-    print("Chrome History:")
-    chrome_history = reader.get_chrome_history(10000)
-    if chrome_history:
-        reader.backup_history(chrome_history, "Chrome")
-
-    print("\nFirefox History:")
-    firefox_history = reader.get_firefox_history(10000)
-    if firefox_history:
-        reader.backup_history(firefox_history, "Firefox")
+    summary = reader.backup_sources()
+    for source in summary['sources']:
+        print(f"{source['browser']}/{source['profile']}: {source['rows']} rows in {source['seconds']}s")
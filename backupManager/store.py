@@ -0,0 +1,291 @@
+"""
+Versioned, append-only store of backups.
+
+Every backup written by BrowserHistoryReader is committed here as a new version.
+Versions don't copy the backup: its files are split into chunks that are stored
+once, by content hash, and a version is only a small JSON list of chunk hashes.
+Consecutive backups share almost all of their chunks, so the store grows with
+new history rather than with the number of versions kept.
+
+Layout under <BACKUP_DIR>/store:
+- chunks/<2 hex>/<sha256>.gz          gzip-compressed chunk content
+- versions/<browser>/<version id>.json  files of one backup and their chunk hashes
+
+Text backups (ndjson, legacy json) are cut on content-defined row boundaries,
+so an inserted or changed row only produces new chunks around it. Columnar
+backups are cut on rows too: numeric columns in blocks of rows counted from
+the oldest one, string columns after content-defined elements. Their gzip
+files are chunked decompressed, since the compressed bytes change entirely
+with any edit, and compressed again on restore.
+"""
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+import zlib
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+
+from backupManager.formats import read_manifest
+
+# A row ends a chunk when the low bits of its checksum are zero (~1 row in 256)
+CHUNK_BOUNDARY_MASK = 0xFF
+# Upper bound for a chunk
+MAX_CHUNK_SIZE = 1 << 20
+# Rows per chunk of a columnar array (8 KiB of int64); the newest block is stored
+# again with each version, so this bounds what a version costs beyond its new rows
+ARRAY_BLOCK_ROWS = 1 << 10
+TEXT_SUFFIXES = {'.ndjson', '.json'}
+VERSION_TIME_FORMAT = "%Y%m%dT%H%M%S%f"
+# Chunks and temp files younger than this are left alone by garbage collection: a commit
+# running at the same time may be writing them or about to reference them
+GC_GRACE_SECONDS = 3600
+
+
+def _iter_text_chunks(path: Path) -> Iterator[bytes]:
+    """Content-defined chunks of a line-oriented file, cut after boundary rows"""
+    chunk = []
+    size = 0
+    with open(path, 'rb') as f:
+        for line in f:
+            chunk.append(line)
+            size += len(line)
+            if (zlib.crc32(line) & CHUNK_BOUNDARY_MASK) == 0 or size >= MAX_CHUNK_SIZE:
+                yield b"".join(chunk)
+                chunk = []
+                size = 0
+    if chunk:
+        yield b"".join(chunk)
+
+
+def _array_cut_points(data: bytes) -> Optional[List[int]]:
+    """
+    Chunk end offsets of a .npy column: its header, then blocks of ARRAY_BLOCK_ROWS rows
+    counted from the last row. Backups list the newest rows first, so the rows a newer
+    backup adds only change the first block. None if the data isn't a 1-d array.
+    """
+    stream = io.BytesIO(data)
+    try:
+        version = np.lib.format.read_magic(stream)
+        if version == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(stream)
+        elif version == (2, 0):
+            shape, _, dtype = np.lib.format.read_array_header_2_0(stream)
+        else:
+            return None
+    except ValueError:
+        return None
+    header_size = stream.tell()
+    if len(shape) != 1 or dtype.hasobject or len(data) - header_size != shape[0] * dtype.itemsize:
+        return None
+    block_ends = range(len(data), header_size, -ARRAY_BLOCK_ROWS * dtype.itemsize)
+    return [header_size, *reversed(block_ends)]
+
+
+def _string_list_cut_points(data: bytes) -> Optional[List[int]]:
+    """
+    Chunk end offsets of a JSON list of strings (string columns and their dictionaries),
+    cut after boundary elements like the rows of text backups. None if the data isn't
+    a list written by json.dump.
+    """
+    try:
+        values = json.loads(data)
+    except ValueError:
+        return None
+    if not isinstance(values, list) or not all(isinstance(value, str) for value in values):
+        return None
+    parts = [json.dumps(value, ensure_ascii=False).encode('utf-8') for value in values]
+    if b"[" + b", ".join(parts) + b"]" != data:
+        return None
+
+    cuts = []
+    end = 1
+    for i, part in enumerate(parts):
+        # Each element with the separator (or closing bracket) after it
+        end += len(part) + (2 if i < len(parts) - 1 else 1)
+        if (zlib.crc32(part) & CHUNK_BOUNDARY_MASK) == 0 or end - (cuts[-1] if cuts else 0) >= MAX_CHUNK_SIZE:
+            cuts.append(end)
+    if not cuts or cuts[-1] < len(data):
+        cuts.append(len(data))
+    return cuts
+
+
+def _iter_binary_chunks(name: str, data: bytes) -> Iterator[bytes]:
+    """Chunks of a columnar file (decompressed), fixed-size if its content isn't recognised"""
+    cuts = None
+    if name.endswith('.npy'):
+        cuts = _array_cut_points(data)
+    elif name.endswith('.json.gz'):
+        cuts = _string_list_cut_points(data)
+    if cuts is None:
+        cuts = [*range(MAX_CHUNK_SIZE, len(data), MAX_CHUNK_SIZE), len(data)]
+    start = 0
+    for end in cuts:
+        if end > start:
+            yield data[start:end]
+        start = end
+
+
+def _modified_before(path: Path, cutoff: float) -> bool:
+    try:
+        return path.stat().st_mtime < cutoff
+    except FileNotFoundError:
+        return False
+
+
+class BackupStore:
+    def __init__(self, root: Path):
+        self.root = root
+        self.chunks_dir = root / "chunks"
+        self.versions_dir = root / "versions"
+
+    def _chunk_path(self, digest: str) -> Path:
+        return self.chunks_dir / digest[:2] / f"{digest}.gz"
+
+    def _put_chunk(self, data: bytes) -> str:
+        """Store a chunk unless it already exists, returns its hash"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._chunk_path(digest)
+        if path.exists():
+            # Reused chunks count as new for garbage collection until the version referencing them is written
+            os.utime(path)
+        else:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+            with open(tmp_path, 'wb') as f:
+                f.write(gzip.compress(data, compresslevel=6))
+            os.replace(tmp_path, path)
+        return digest
+
+    def _file_chunks(self, file: Path) -> Dict:
+        """Chunk hashes of one backup file, and whether they hold its decompressed content"""
+        if file.suffix in TEXT_SUFFIXES:
+            return {'chunks': [self._put_chunk(chunk) for chunk in _iter_text_chunks(file)]}
+        with open(file, 'rb') as f:
+            data = f.read()
+        is_gzip = file.suffix == '.gz'
+        if is_gzip:
+            data = gzip.decompress(data)
+        return {'chunks': [self._put_chunk(chunk) for chunk in _iter_binary_chunks(file.name, data)], 'gzip': is_gzip}
+
+    def commit(self, backup_path: Path) -> Dict:
+        """
+        Record the backup at `backup_path` (a file or a columnar directory) as a new version.
+        Returns the version record.
+        """
+        browser = backup_path.name.rsplit("_history", 1)[0]
+        files = sorted(f for f in backup_path.iterdir() if f.is_file()) if backup_path.is_dir() else [backup_path]
+
+        entries = []
+        for file in files:
+            entries.append({
+                'name': file.relative_to(backup_path).as_posix() if backup_path.is_dir() else "",
+                'bytes': file.stat().st_size,
+                **self._file_chunks(file),
+            })
+
+        created_at = datetime.now()
+        version = {
+            'id': created_at.strftime(VERSION_TIME_FORMAT),
+            'browser': browser,
+            'backup': backup_path.name,
+            'is_dir': backup_path.is_dir(),
+            'created_at': created_at.strftime("%Y-%m-%d %H:%M:%S"),
+            'manifest': read_manifest(backup_path),
+            'files': entries,
+        }
+        version_path = self.versions_dir / browser / f"{version['id']}.json"
+        version_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = version_path.with_name(version_path.name + ".tmp")
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(version, f)
+        os.replace(tmp_path, version_path)
+        return version
+
+    def list_versions(self, browser: str) -> List[Dict]:
+        """Versions of a browser's backup, newest first"""
+        versions = []
+        for path in sorted((self.versions_dir / browser).glob("*.json"), reverse=True):
+            with open(path, 'r', encoding='utf-8') as f:
+                versions.append(json.load(f))
+        return versions
+
+    def get_version(self, browser: str, version_id: str) -> Optional[Dict]:
+        path = self.versions_dir / browser / f"{version_id}.json"
+        if not path.exists():
+            return None
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def restore(self, browser: str, version_id: str, target_dir: Path) -> Optional[Path]:
+        """
+        Rebuild a stored version under `target_dir` with its original name.
+        Returns the restored backup path (readable with iter_backup_entries), or None if unknown.
+        """
+        version = self.get_version(browser, version_id)
+        if version is None:
+            return None
+
+        target = target_dir / version['backup']
+        target_dir.mkdir(parents=True, exist_ok=True)
+        if version['is_dir']:
+            target.mkdir(exist_ok=True)
+        for entry in version['files']:
+            file_path = target / entry['name'] if version['is_dir'] else target
+            # Files chunked decompressed are compressed again (same content, not the same bytes)
+            opener = gzip.GzipFile(file_path, 'wb', mtime=0) if entry.get('gzip') else open(file_path, 'wb')
+            with opener as out:
+                for digest in entry['chunks']:
+                    with open(self._chunk_path(digest), 'rb') as f:
+                        out.write(gzip.decompress(f.read()))
+        return target
+
+    def prune(self, browser: str, keep_count: int = 0, keep_days: int = 0) -> int:
+        """
+        Apply the retention policy to a browser's versions: a version is kept when it
+        is among the newest `keep_count` or younger than `keep_days` days (0 disables
+        a rule). The newest version is always kept. Returns the number of versions removed.
+        """
+        paths = sorted((self.versions_dir / browser).glob("*.json"), reverse=True)
+        cutoff = datetime.now() - timedelta(days=keep_days)
+        removed = 0
+        for index, path in enumerate(paths):
+            if index == 0 or (keep_count and index < keep_count):
+                continue
+            if keep_days and datetime.strptime(path.stem, VERSION_TIME_FORMAT) >= cutoff:
+                continue
+            path.unlink()
+            removed += 1
+        return removed
+
+    def collect_garbage(self) -> int:
+        """
+        Delete chunks no longer referenced by any version, returns the number deleted.
+        Files touched in the last GC_GRACE_SECONDS are kept, as a commit in progress
+        (in this or another process) may not have written its version yet.
+        """
+        cutoff = time.time() - GC_GRACE_SECONDS
+        referenced = set()
+        for path in self.versions_dir.glob("*/*.json"):
+            with open(path, 'r', encoding='utf-8') as f:
+                for entry in json.load(f)['files']:
+                    referenced.update(entry['chunks'])
+
+        deleted = 0
+        for chunk in self.chunks_dir.glob("*/*.gz"):
+            if chunk.name[:-len(".gz")] not in referenced and _modified_before(chunk, cutoff):
+                chunk.unlink(missing_ok=True)
+                deleted += 1
+        for tmp in self.chunks_dir.glob("*/*.tmp"):
+            if _modified_before(tmp, cutoff):
+                tmp.unlink(missing_ok=True)
+        return deleted
+
+    def size(self) -> int:
+        """Bytes used by the stored chunks"""
+        return sum(f.stat().st_size for f in self.chunks_dir.glob("*/*.gz"))
@@ -0,0 +1,200 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from django.test import SimpleTestCase
+
+from backupManager.formats import write_backup
+from backupManager.main import BrowserHistoryReader
+from backupManager.store import BackupStore, GC_GRACE_SECONDS, VERSION_TIME_FORMAT
+
+WORDS = [''.join(random.Random(i).choices('abcdefghij', k=3 + i % 7)) for i in range(2000)]
+
+
+def _rows(start: int, count: int):
+    """History rows `start` to `start + count` (one a minute), newest first as in backups"""
+    rng = random.Random(start)
+    rows = []
+    for i in range(start, start + count):
+        rows.append({
+            'url': f"https://site{rng.randint(0, 500)}.com/{rng.choice(WORDS)}/{i}",
+            'title': ' '.join(rng.choices(WORDS, k=4)) if rng.random() < 0.7 else rng.choice(WORDS[:100]),
+            'visit_count': rng.choice([1, 1, 1, 2, 3, 5, 12]),
+            'last_visit': (datetime(2025, 1, 1) + timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S"),
+            'profile': "Default",
+        })
+    return rows[::-1]
+
+
+class BackupStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.store = BackupStore(self.tmp / "store")
+
+    def chunk_files(self):
+        return set(self.store.chunks_dir.glob("*/*.gz"))
+
+    def commit_versions(self, suffix: str, versions: int = 4, rows: int = 30000, added: int = 200):
+        """Commit a backup, then `versions - 1` backups each with `added` newer rows; returns the store sizes"""
+        path = self.tmp / f"chrome_history{suffix}"
+        history = _rows(0, rows)
+        sizes = []
+        for version in range(versions):
+            if version:
+                history = _rows(rows + (version - 1) * added, added) + history
+            write_backup(history, path)
+            self.store.commit(path)
+            sizes.append(self.store.size())
+        return path, sizes
+
+    def assert_small_growth(self, sizes):
+        for before, after in zip(sizes, sizes[1:]):
+            # 200 new rows are under 1% of the first version, plus the chunks cut around them
+            self.assertLess(after - before, 0.05 * sizes[0])
+
+    def test_ndjson_growth_per_version(self):
+        _, sizes = self.commit_versions(".ndjson")
+        self.assert_small_growth(sizes)
+
+    def test_columnar_growth_per_version(self):
+        _, sizes = self.commit_versions(".columnar")
+        self.assert_small_growth(sizes)
+
+    def test_unchanged_backup_reuses_chunks(self):
+        path = self.tmp / "chrome_history.ndjson"
+        write_backup(_rows(0, 2000), path)
+        first = self.store.commit(path)
+        chunks = self.chunk_files()
+        second = self.store.commit(path)
+        self.assertEqual(self.chunk_files(), chunks)
+        self.assertEqual(first['files'], second['files'])
+        self.assertEqual(len(self.store.list_versions("chrome")), 2)
+
+    def test_restore_ndjson(self):
+        path, _ = self.commit_versions(".ndjson", versions=2, rows=3000)
+        newest = self.store.list_versions("chrome")[0]
+        restored = self.store.restore("chrome", newest['id'], self.tmp / "restored")
+        self.assertEqual(restored.name, path.name)
+        self.assertEqual(restored.read_bytes(), path.read_bytes())
+
+    def test_restore_columnar(self):
+        path, _ = self.commit_versions(".columnar", versions=2, rows=3000)
+        newest = self.store.list_versions("chrome")[0]
+        restored = self.store.restore("chrome", newest['id'], self.tmp / "restored")
+        self.assertEqual(sorted(f.name for f in restored.iterdir()), sorted(f.name for f in path.iterdir()))
+        for file in path.iterdir():
+            self.assertEqual((restored / file.name).read_bytes(), file.read_bytes(), file.name)
+
+    def test_restore_unknown_version(self):
+        self.assertIsNone(self.store.restore("chrome", "20000101T000000000000", self.tmp / "restored"))
+
+    def age_versions(self, days):
+        """Rename the browser's versions to the given ages in days, newest first"""
+        paths = sorted((self.store.versions_dir / "chrome").glob("*.json"), reverse=True)
+        for path, age in zip(paths, days):
+            version_id = (datetime.now() - timedelta(days=age)).strftime(VERSION_TIME_FORMAT)
+            path.rename(path.with_name(f"{version_id}.json"))
+
+    def commit_small_versions(self, count: int):
+        path = self.tmp / "chrome_history.ndjson"
+        for version in range(count):
+            write_backup(_rows(version * 100, 300), path)
+            self.store.commit(path)
+            # Version ids are timestamps
+            time.sleep(0.001)
+
+    def test_prune_keep_count(self):
+        self.commit_small_versions(5)
+        newest = [v['id'] for v in self.store.list_versions("chrome")[:2]]
+        self.assertEqual(self.store.prune("chrome", keep_count=2), 3)
+        self.assertEqual([v['id'] for v in self.store.list_versions("chrome")], newest)
+
+    def test_prune_keep_days(self):
+        self.commit_small_versions(4)
+        self.age_versions([0, 3, 10, 40])
+        self.assertEqual(self.store.prune("chrome", keep_days=7), 2)
+        self.assertEqual(len(self.store.list_versions("chrome")), 2)
+
+    def test_prune_either_rule_keeps(self):
+        self.commit_small_versions(4)
+        self.age_versions([20, 30, 40, 50])
+        # The second newest is kept by count, the others are all older than 7 days
+        self.assertEqual(self.store.prune("chrome", keep_count=2, keep_days=7), 2)
+
+    def test_prune_keeps_newest(self):
+        self.commit_small_versions(3)
+        self.age_versions([100, 200, 300])
+        self.assertEqual(self.store.prune("chrome", keep_days=7), 2)
+        self.assertEqual(self.store.prune("chrome", keep_count=1), 0)
+        self.assertEqual(len(self.store.list_versions("chrome")), 1)
+
+    def backdate(self, paths):
+        old = time.time() - GC_GRACE_SECONDS - 60
+        for path in paths:
+            os.utime(path, (old, old))
+
+    def test_collect_garbage(self):
+        self.commit_small_versions(3)
+        all_chunks = self.chunk_files()
+        self.store.prune("chrome", keep_count=1)
+        kept = {self.store._chunk_path(digest)
+                for entry in self.store.list_versions("chrome")[0]['files'] for digest in entry['chunks']}
+        self.assertLess(len(kept), len(all_chunks))
+
+        # Fresh chunks may belong to a commit that hasn't written its version yet
+        self.assertEqual(self.store.collect_garbage(), 0)
+        self.assertEqual(self.chunk_files(), all_chunks)
+
+        self.backdate(all_chunks)
+        self.assertEqual(self.store.collect_garbage(), len(all_chunks - kept))
+        self.assertEqual(self.chunk_files(), kept)
+
+    def test_collect_garbage_temp_files(self):
+        self.commit_small_versions(1)
+        directory = next(self.store.chunks_dir.iterdir())
+        stale, fresh = directory / "stale.gz.1.tmp", directory / "fresh.gz.2.tmp"
+        stale.write_bytes(b"x")
+        fresh.write_bytes(b"x")
+        self.backdate([stale])
+        self.store.collect_garbage()
+        self.assertFalse(stale.exists())
+        self.assertTrue(fresh.exists())
+
+
+class SharedSnapshotTests(SimpleTestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, self.tmp, ignore_errors=True)
+        self.database = self.tmp / "History"
+        with sqlite3.connect(self.database) as conn:
+            conn.execute("CREATE TABLE urls (url TEXT)")
+            conn.execute("INSERT INTO urls VALUES ('https://example.com/')")
+        conn.close()
+        self.reader = BrowserHistoryReader()
+
+    def read(self):
+        return self.reader._read_sqlite(self.database, "SELECT url FROM urls")
+
+    def test_snapshot_per_read(self):
+        self.read()
+        self.read()
+        self.assertEqual(len(self.reader.snapshot_stats), 2)
+
+    def test_one_snapshot_per_database_in_block(self):
+        with self.reader.shared_snapshots():
+            self.assertEqual(self.read(), [{'url': "https://example.com/"}])
+            snapshot = Path(self.reader._shared_snapshots['snapshots'][self.database]['path'])
+            # Reads in the block see the database as it was when first read
+            with sqlite3.connect(self.database) as conn:
+                conn.execute("INSERT INTO urls VALUES ('https://example.com/new')")
+            conn.close()
+            self.assertEqual(len(self.read()), 1)
+        self.assertEqual(len(self.reader.snapshot_stats), 1)
+        self.assertFalse(snapshot.exists())
+        self.assertEqual(len(self.read()), 2)
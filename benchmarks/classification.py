@@ -0,0 +1,302 @@
+"""
+End-to-end classification benchmark on synthetic history, against the fake
+model server (benchmarks/fake_server.py), so no real model is needed.
+
+Everything runs in a temporary directory with its own database, backups and
+local model; the app's data is never touched.
+
+    python -m benchmarks.classification --entries 5000 --latency 0.1 --jitter 0.05 --error-rate 0.02
+    python -m benchmarks.classification --mode job --save baseline.json
+    python -m benchmarks.classification --baseline baseline.json   # exits with 1 on a regression
+
+--mode history drives HistoryClassifier.iter_classified_batches (what classify_history
+runs) and writes the results with HistoryWriter, like a job does; --mode job runs
+start_classification, with job checkpoints and heartbeats.
+
+Reported: entries/s, p50/p95 latency of model requests, database write time and
+peak memory (process RSS, and Python allocations with --trace-memory).
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+from benchmarks.fake_server import MODEL_ID, FakeModelServer
+
+BENCHMARK_CATEGORIES = ["News", "Technology", "Shopping", "Education", "Entertainment",
+                        "Social Media", "Finance", "Travel", "Other"]
+SECTIONS = ["news", "article", "blog", "docs", "product", "video", "forum", "wiki", "help"]
+WORDS = ["update", "guide", "review", "release", "sale", "tutorial", "report", "weather", "recipe",
+         "market", "season", "launch", "story", "analysis", "tips", "deal", "course", "trailer"]
+TRACKING = ["utm_source=newsletter&utm_medium=email", "fbclid=IwAR0x", "gclid=Cj0KCQ", "ref=home",
+            "utm_campaign=spring&utm_source=social"]
+
+# Lower is worse for these, higher is worse for the others
+HIGHER_IS_BETTER = {'entries_per_second'}
+COMPARED = ('entries_per_second', 'p95_latency', 'db_write_seconds', 'peak_rss_mb')
+
+
+def synthetic_history(count: int, domains: int, days: int, duplicate_rate: float,
+                      seed: int = 0) -> Iterator[Dict]:
+    """
+    Backup rows that look like browsing history: a few domains get most of the
+    visits (Zipf-like), and a share of the rows are earlier pages again with
+    tracking parameters added.
+    """
+    rng = random.Random(seed)
+    weights = [1 / (rank + 1) for rank in range(domains)]
+    now = datetime.now()
+    pages = []
+    for i in range(count):
+        if pages and rng.random() < duplicate_rate:
+            url, title = rng.choice(pages)
+            separator = '&' if '?' in url else '?'
+            url = f"{url}{separator}{rng.choice(TRACKING)}"
+        else:
+            domain = rng.choices(range(domains), weights=weights)[0]
+            section = rng.choice(SECTIONS)
+            words = rng.sample(WORDS, 3)
+            url = f"https://www.site{domain}.example/{section}/{'-'.join(words)}-{i}"
+            title = f"{' '.join(words).title()} - Site {domain}"
+            pages.append((url, title))
+        yield {
+            'url': url,
+            'title': title,
+            'visit_count': max(1, int(rng.paretovariate(1.2))),
+            'last_visit': (now - timedelta(seconds=rng.uniform(0, days * 86400))).strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+
+def setup_django(workdir: Path) -> None:
+    """Point Django at a fresh database in the work directory and create its tables"""
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HistoryApp.settings')
+    from django.conf import settings
+    settings.DATABASES['default']['NAME'] = workdir / "benchmark.sqlite3"
+
+    import django
+    django.setup()
+    from django.core.management import call_command
+    # Checks import the views, which read settings before the tables exist
+    call_command('migrate', verbosity=0, skip_checks=True)
+
+
+def configure(args: argparse.Namespace, workdir: Path, server_url: str) -> None:
+    """Settings, backups and local model path of the benchmark run"""
+    from HistoryApp import app_settings
+    from backupManager.formats import BACKUP_FORMATS, write_backup
+    from frontend.utils.settings import set_setting
+
+    app_settings.BACKUP_DIR = workdir / "history_backups"
+    app_settings.BACKUP_DIR.mkdir()
+    app_settings.LOCAL_MODEL_PATH = workdir / "local_model.npz"
+
+    settings = {
+        'llm_endpoints': [{'url': server_url, 'weight': 1, 'max_concurrency': args.max_concurrency}],
+        'current_model': MODEL_ID,
+        'categories': BENCHMARK_CATEGORIES,
+        'days_to_analyze': args.days,
+        'classification_batch_size': args.batch_size,
+        'classification_short_answers': not args.long_answers,
+        'local_model_enabled': not args.no_local_model,
+        'classification_status': 0,
+    }
+    if args.concurrency:
+        settings['classification_concurrency'] = args.concurrency
+    for name, value in settings.items():
+        set_setting(name, value)
+
+    per_browser = args.entries // len(args.browsers)
+    for i, browser in enumerate(args.browsers):
+        path = app_settings.BACKUP_DIR / f"{browser}_history{BACKUP_FORMATS[args.format]}"
+        write_backup(synthetic_history(per_browser, args.domains, args.days, args.duplicate_rate, seed=args.seed + i),
+                     path)
+
+
+class WriteTimer:
+    """Times the database writes of classified entries, wherever the writer runs"""
+
+    def __init__(self):
+        from frontend.utils import ingestion
+        self.module = ingestion
+        self.upsert_history = ingestion.upsert_history
+        self.seconds = 0.0
+        self.rows = 0
+
+    def __enter__(self) -> "WriteTimer":
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            rows = self.upsert_history(*args, **kwargs)
+            self.seconds += time.perf_counter() - start
+            self.rows += rows
+            return rows
+
+        self.module.upsert_history = timed
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.module.upsert_history = self.upsert_history
+
+
+def run_history(args: argparse.Namespace) -> Dict:
+    """Classify every browser's backup with the classifier and write the results in batches"""
+    from classifier.main import HistoryClassifier
+    from frontend.utils.ingestion import HistoryWriter
+    from frontend.utils.settings import get_setting
+
+    classifier = HistoryClassifier()
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=args.days)
+    counts = {}
+    writer = HistoryWriter(flush_rows=get_setting('classification_write_batch_size', default_value=2000)).start()
+    for browser in args.browsers:
+        for results, _, _ in classifier.iter_classified_batches(browser, start_date, end_date, force=True):
+            writer.put(results, browser)
+        for key in ('total', 'requests', 'prompt_tokens', 'completion_tokens', 'model_entries', 'duplicates'):
+            counts[key] = counts.get(key, 0) + classifier.status.get(key, 0)
+    writer.close()
+    return {'counts': counts, 'pool': classifier.pool}
+
+
+def run_job(args: argparse.Namespace) -> Dict:
+    """Run a classification job, as the classification page does"""
+    from HistoryApp import app_settings
+    from frontend.models import ClassificationJob
+    from frontend.utils import classification
+
+    classification.classifier.backup_dir = app_settings.BACKUP_DIR
+    classification.start_classification(force=True)
+    job = ClassificationJob.objects.order_by('-id').first()
+    if job.status != 'completed':
+        raise RuntimeError(f"Classification job {job.status}: {job.error}")
+    counts = {'total': sum(checkpoint['total'] or 0 for checkpoint in job.checkpoints.values())}
+    for usage in job.usage.values():
+        for key, value in usage.items():
+            counts[key] = counts.get(key, 0) + value
+    return {'counts': counts, 'pool': classification.classifier.pool}
+
+
+def _peak_rss_mb() -> Optional[float]:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict:
+    with tempfile.TemporaryDirectory(prefix="history-benchmark-") as tmp:
+        workdir = Path(tmp)
+        setup_django(workdir)
+        server = FakeModelServer(latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                                 seed=args.seed).start()
+        try:
+            configure(args, workdir, server.url)
+            if args.trace_memory:
+                tracemalloc.start()
+            with WriteTimer() as writes:
+                start = time.perf_counter()
+                run = run_job(args) if args.mode == 'job' else run_history(args)
+                seconds = time.perf_counter() - start
+            traced_peak = tracemalloc.get_traced_memory()[1] if args.trace_memory else None
+            tracemalloc.stop()
+        finally:
+            server.stop()
+            from django.db import connection
+            connection.close()
+
+    counts = run['counts']
+    endpoints = run['pool'].report() if run['pool'] is not None else []
+    return {
+        'mode': args.mode,
+        'entries': counts.get('total', 0),
+        'seconds': round(seconds, 2),
+        'entries_per_second': round(counts.get('total', 0) / max(seconds, 1e-9), 1),
+        'model_requests': counts.get('requests', 0),
+        'retries': run['pool'].retries if run['pool'] is not None else 0,
+        'model_entries': counts.get('model_entries', 0),
+        'duplicates': counts.get('duplicates', 0),
+        'prompt_tokens': counts.get('prompt_tokens', 0),
+        'completion_tokens': counts.get('completion_tokens', 0),
+        'p50_latency': endpoints[0]['p50_latency'] if endpoints else None,
+        'p95_latency': endpoints[0]['p95_latency'] if endpoints else None,
+        'db_write_seconds': round(writes.seconds, 3),
+        'db_rows_written': writes.rows,
+        'peak_rss_mb': _peak_rss_mb(),
+        'traced_peak_mb': round(traced_peak / (1024 * 1024), 1) if traced_peak is not None else None,
+        'server': server.stats,
+    }
+
+
+def compare(report: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """Metrics worse than the baseline by more than `tolerance` (a fraction)"""
+    regressions = []
+    for metric in COMPARED:
+        current, previous = report.get(metric), baseline.get(metric)
+        if not current or not previous:
+            continue
+        change = (current - previous) / previous
+        if (change < -tolerance) if metric in HIGHER_IS_BETTER else (change > tolerance):
+            regressions.append(f"{metric}: {previous} -> {current} ({change:+.0%})")
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark classification against a fake model server")
+    parser.add_argument('--mode', choices=['history', 'job'], default='history')
+    parser.add_argument('--entries', type=int, default=5000, help="Synthetic history entries, split between browsers")
+    parser.add_argument('--browsers', nargs='+', default=['chrome', 'firefox'])
+    parser.add_argument('--domains', type=int, default=500)
+    parser.add_argument('--days', type=int, default=30)
+    parser.add_argument('--duplicate-rate', type=float, default=0.2,
+                        help="Share of entries that repeat a page with tracking parameters")
+    parser.add_argument('--format', choices=['ndjson', 'columnar'], default='ndjson', help="Backup format")
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per model request")
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.0)
+    parser.add_argument('--batch-size', type=int, default=20)
+    parser.add_argument('--concurrency', type=int, default=None, help="Initial requests in flight")
+    parser.add_argument('--max-concurrency', type=int, default=16)
+    parser.add_argument('--long-answers', action='store_true', help="Category names instead of numbers")
+    parser.add_argument('--no-local-model', action='store_true')
+    parser.add_argument('--trace-memory', action='store_true', help="Also measure Python allocations (slower)")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--save', type=Path, help="Write the report to this JSON file")
+    parser.add_argument('--baseline', type=Path, help="Report to compare with; exit code 1 on a regression")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed change against the baseline")
+    parser.add_argument('--verbose', action='store_true', help="Keep the classifier's INFO logs")
+    args = parser.parse_args(argv)
+
+    if not args.verbose:
+        # One log line per entry would dominate the timings
+        logging.getLogger().setLevel(logging.WARNING)
+        for name in ('HistoryApp.app_settings', 'httpx'):
+            logging.getLogger(name).setLevel(logging.WARNING)
+
+    report = run_benchmark(args)
+    print(json.dumps(report, indent=2))
+    if args.save:
+        args.save.write_text(json.dumps(report, indent=2))
+
+    if args.baseline:
+        regressions = compare(report, json.loads(args.baseline.read_text()), args.tolerance)
+        for regression in regressions:
+            print(f"Regression: {regression}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""
+Stand-in for an OpenAI-compatible model server (LM Studio, llama.cpp, ...),
+answering /v1/models and /v1/chat/completions without running a model.
+
+Every prompt format of the classifier is understood (short and JSON batches,
+single entries), and the answer is a category chosen from a hash of the entry's
+host, so a domain always gets the same category. Latency, jitter and an error
+rate (429 and 500 answers) are configurable to see how classification copes
+with a slow or overloaded server.
+
+    python -m benchmarks.fake_server --port 1234 --latency 0.2 --error-rate 0.05
+"""
+import argparse
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional
+from urllib.parse import urlsplit
+
+MODEL_ID = "benchmark-model"
+
+
+def _host(text: str) -> str:
+    """Host of the URL in brackets at the end of an entry line, or the text itself"""
+    match = re.search(r'\((\S+)\)\s*$', text)
+    if match is None:
+        return text
+    try:
+        return urlsplit(match.group(1)).hostname or text
+    except ValueError:
+        return text
+
+
+def _pick(text: str, count: int) -> int:
+    """Index of the category given to an entry"""
+    return int(hashlib.md5(_host(text).encode('utf-8')).hexdigest(), 16) % count
+
+
+def answer(prompt: str) -> str:
+    """What a well-behaved model would answer to one of the classifier's prompts"""
+    short = re.match(r'Categories: (.*)', prompt)
+    if short:
+        count = len(re.findall(r'\d+=', short.group(1)))
+        body = prompt.split('\n\n', 1)[1] if '\n\n' in prompt else prompt
+        items = re.findall(r'^\s*(\d+)\. (.*)$', body, re.MULTILINE)
+        if items:
+            return '\n'.join(f"{number}:{_pick(text, count) + 1}" for number, text in items)
+        entry = re.search(r'Entry: (.*)', prompt)
+        return str(_pick(entry.group(1).strip() if entry else prompt, count) + 1)
+
+    listed = re.search(r'categories:\s*(.*?)\.\s*\n', prompt, re.DOTALL)
+    categories = [c.strip() for c in listed.group(1).split(',')] if listed else ['Other']
+    items = re.findall(r'^\s*(\d+)\. (.*)$', prompt, re.MULTILINE)
+    if items:
+        return json.dumps({number: categories[_pick(text, len(categories))] for number, text in items})
+    entry = re.search(r'Entry: (.*)', prompt)
+    return categories[_pick(entry.group(1).strip() if entry else prompt, len(categories))]
+
+
+class FakeModelServer:
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05, jitter: float = 0.0,
+                 error_rate: float = 0.0, seed: Optional[int] = None):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.stats = {'requests': 0, 'errors': 0, 'max_inflight': 0}
+        self.inflight = 0
+        self._lock = threading.Lock()
+        self._thread = None
+        self.httpd = ThreadingHTTPServer((host, port), self._handler())
+        self.httpd.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self) -> "FakeModelServer":
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _delay(self) -> float:
+        return max(0.0, self.latency + self.random.uniform(-self.jitter, self.jitter))
+
+    def _complete(self, request: Dict) -> Dict:
+        prompt = request['messages'][-1]['content']
+        content = answer(prompt)
+        choice = {'index': 0, 'message': {'role': 'assistant', 'content': content}, 'finish_reason': 'stop'}
+        if request.get('logprobs'):
+            # One token per character, digits slightly less than certain
+            choice['logprobs'] = {'content': [{'token': ch, 'logprob': -0.05 if ch.isdigit() else 0.0,
+                                               'bytes': None, 'top_logprobs': []} for ch in content]}
+        prompt_tokens, completion_tokens = len(prompt) // 4, max(1, len(content) // 4)
+        return {'id': 'benchmark', 'object': 'chat.completion', 'created': int(time.time()),
+                'model': request.get('model', MODEL_ID), 'choices': [choice],
+                'usage': {'prompt_tokens': prompt_tokens, 'completion_tokens': completion_tokens,
+                          'total_tokens': prompt_tokens + completion_tokens}}
+
+    def _handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status: int, body: Dict) -> None:
+                data = json.dumps(body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path.rstrip('/').endswith('/models'):
+                    self._send(200, {'object': 'list', 'data': [{'id': MODEL_ID, 'object': 'model'}]})
+                else:
+                    self._send(404, {'error': {'message': 'Not found'}})
+
+            def do_POST(self):
+                if not self.path.rstrip('/').endswith('/chat/completions'):
+                    self._send(404, {'error': {'message': 'Not found'}})
+                    return
+                request = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                with server._lock:
+                    server.stats['requests'] += 1
+                    server.inflight += 1
+                    server.stats['max_inflight'] = max(server.stats['max_inflight'], server.inflight)
+                    delay = server._delay()
+                    failure = server.random.random() < server.error_rate
+                try:
+                    time.sleep(delay)
+                    if failure:
+                        with server._lock:
+                            server.stats['errors'] += 1
+                        # Overloaded servers answer both ways
+                        if server.random.random() < 0.5:
+                            self._send(429, {'error': {'message': 'Rate limit exceeded', 'type': 'rate_limit'}})
+                        else:
+                            self._send(500, {'error': {'message': 'Internal server error', 'type': 'server_error'}})
+                        return
+                    self._send(200, server._complete(request))
+                finally:
+                    with server._lock:
+                        server.inflight -= 1
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake OpenAI-compatible model server for classification benchmarks")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=1234)
+    parser.add_argument('--latency', type=float, default=0.05, help="Seconds per request")
+    parser.add_argument('--jitter', type=float, default=0.0, help="Random +/- seconds added to the latency")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Share of requests answered with 429 or 500")
+    args = parser.parse_args()
+
+    fake = FakeModelServer(args.host, args.port, args.latency, args.jitter, args.error_rate)
+    print(f"Fake model server on {fake.url} (model '{MODEL_ID}')")
+    try:
+        fake.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
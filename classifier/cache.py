@@ -0,0 +1,78 @@
+import hashlib
+import json
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+from django.db.models import F
+
+from HistoryApp import app_settings
+from frontend.models import ClassificationCache
+
+logger = app_settings.LOGGER
+
+
+def cache_key(url: str) -> str:
+    """
+    Normalised domain of a URL, shared by all its pages: lowercased host
+    without port or leading 'www.'. URLs without a host (file:, about:) keep
+    their scheme so they share one key per scheme.
+    """
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return url
+    host = (parts.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    return host or f"{parts.scheme}:"
+
+
+def category_set_hash(categories: Iterable[str]) -> str:
+    """Fingerprint of a category list, independent of its order"""
+    return hashlib.sha256(json.dumps(sorted(categories)).encode('utf-8')).hexdigest()
+
+
+def classification_key(entry: Dict, model: str, category_hash: str) -> str:
+    """Fingerprint of an entry's classification input; a change in any part means it must be classified again"""
+    return hashlib.sha256(json.dumps([entry['url'], entry.get('title') or '', model, category_hash]).encode('utf-8')).hexdigest()
+
+
+def evict_stale(category_hash: str) -> int:
+    """Drop cached categories that were chosen from another category list, returns the number removed"""
+    removed, _ = ClassificationCache.objects.exclude(category_hash=category_hash).delete()
+    if removed:
+        logger.info(f"Evicted {removed} cached classifications made with a different category list")
+    return removed
+
+
+def lookup(keys: Iterable[str], model: str, category_hash: str,
+           refreshed_since: Optional[datetime] = None) -> Dict[str, str]:
+    """
+    Cached categories for the given keys, counting a hit on each one found.
+    With `refreshed_since`, only categories stored since then are returned.
+    """
+    found = {}
+    key_list = list(set(keys))
+    # Chunked to stay under SQLite's query parameter limit
+    for start in range(0, len(key_list), 500):
+        rows = ClassificationCache.objects.filter(key__in=key_list[start:start + 500], model=model,
+                                                  category_hash=category_hash)
+        if refreshed_since is not None:
+            rows = rows.filter(updated_at__gte=refreshed_since)
+        found.update(rows.values_list('key', 'category'))
+    for start in range(0, len(found), 500):
+        ClassificationCache.objects.filter(key__in=list(found)[start:start + 500], model=model,
+                                           category_hash=category_hash).update(hits=F('hits') + 1)
+    return found
+
+
+def store(categories: Dict[str, str], model: str, category_hash: str) -> None:
+    """Remember the category chosen for each key"""
+    entries: List[ClassificationCache] = [
+        ClassificationCache(key=key, model=model, category_hash=category_hash, category=category)
+        for key, category in categories.items()
+    ]
+    ClassificationCache.objects.bulk_create(entries, batch_size=500, update_conflicts=True,
+                                            unique_fields=['key', 'model', 'category_hash'],
+                                            update_fields=['category', 'updated_at'])
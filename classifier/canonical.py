@@ -0,0 +1,82 @@
+"""
+URL canonicalisation, so near-identical history entries are classified once.
+
+Tracking parameters, session IDs, pagination and fragments turn one page into
+many URLs. canonical_url() drops them and normalises what is left: http and
+https are the same, the host is lowercased without 'www.' or a default port,
+the path loses its trailing slash and the remaining query parameters are
+sorted. URLs other than http(s) (about:, file:, chrome:, ...) are kept as is.
+
+group_entries() groups entries by canonical URL and title; the classifier
+classifies one entry per group and gives its category to the others.
+"""
+import re
+from typing import Dict, Iterable, List, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+# Query parameters that don't change what a page is about
+IGNORED_PARAMS = {
+    # Campaign and click tracking
+    'fbclid', 'gclid', 'gclsrc', 'dclid', 'msclkid', 'yclid', 'twclid', 'ttclid', 'igshid', 'li_fat_id',
+    'mc_cid', 'mc_eid', '_ga', '_gl', '_hsenc', '_hsmi', 'mkt_tok', 'spm', 'ref', 'ref_src', 'ref_url',
+    # Session IDs
+    'sid', 'sessionid', 'session_id', 'jsessionid', 'phpsessid', 'aspsessionid', 'cfid', 'cftoken',
+}
+# Pagination, dropped only with a number: '?page=2' is a page of a list, '?page=contact' a route
+PAGINATION_PARAMS = {'page', 'pg', 'offset', 'start'}
+# Families of tracking parameters (utm_source, utm_medium, ...)
+IGNORED_PREFIXES = ('utm_', 'pk_', 'mtm_', 'hsa_')
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+# ';jsessionid=...' style session IDs in the path, and '/page/2' style pagination at its end
+PATH_SESSION_RE = re.compile(r';(jsessionid|phpsessid|sessionid|sid)=[^/]*', re.IGNORECASE)
+PATH_PAGE_RE = re.compile(r'/page/\d+/?$', re.IGNORECASE)
+
+
+def canonical_url(url: str, extra_params: Iterable[str] = ()) -> str:
+    """Canonical form of a URL; `extra_params` are query parameters to drop besides IGNORED_PARAMS"""
+    try:
+        parts = urlsplit(url.strip())
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.lower().rstrip('.')
+    if host.startswith('www.'):
+        host = host[4:]
+    if ':' in host:
+        host = f"[{host}]"  # IPv6 address
+    if port is not None and port != DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+
+    path = PATH_PAGE_RE.sub('', PATH_SESSION_RE.sub('', parts.path))
+    path = re.sub(r'/{2,}', '/', path).rstrip('/') or '/'
+
+    ignored = IGNORED_PARAMS.union(param.lower() for param in extra_params)
+    params = sorted((key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+                    if key.lower() not in ignored and not key.lower().startswith(IGNORED_PREFIXES)
+                    and not (key.lower() in PAGINATION_PARAMS and value.isdigit()))
+    return urlunsplit(('https', host, path, urlencode(params), ''))
+
+
+def group_entries(entries: List[Dict], extra_params: Iterable[str] = ()) -> Tuple[List[Dict], List[int]]:
+    """
+    Group entries by canonical URL and title (case and spacing aside). Returns one
+    entry per group, the first one with its URL made canonical, and for every
+    entry the index of its group in that list.
+    """
+    extra_params = list(extra_params)
+    representatives = []
+    groups = []
+    index = {}
+    for entry in entries:
+        url = canonical_url(entry['url'], extra_params)
+        key = (url, ' '.join((entry.get('title') or '').split()).casefold())
+        if key not in index:
+            index[key] = len(representatives)
+            representatives.append({**entry, 'url': url})
+        groups.append(index[key])
+    return representatives, groups
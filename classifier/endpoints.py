@@ -0,0 +1,283 @@
+"""
+Pool of OpenAI-compatible model servers (LM Studio, llama.cpp, vLLM, ...).
+
+The servers come from the 'llm_endpoints' setting, a list of
+{'url': 'http://host:1234/v1', 'weight': 1, 'max_concurrency': 16}
+(a plain URL string also works). Each request goes to the endpoint with the
+fewest requests in flight relative to its weight, among those with a free slot.
+Every endpoint has its own AdaptiveLimiter, so its concurrency follows what
+that server copes with, up to its max_concurrency.
+
+An endpoint is ejected for a while when it fails a health check or several
+requests in a row; the ejection doubles each time it fails again after coming
+back. Failed requests are retried on the other endpoints. Per-endpoint
+throughput is available from EndpointPool.report().
+
+Servers don't all have the same models: the health check records the models
+each endpoint lists, and a request for a model only goes to the endpoints that
+list it. An endpoint answering 404 for a model stops getting requests for it.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Dict, List, Optional, Set, TypeVar
+
+import requests
+from openai import APIStatusError, AsyncOpenAI, NotFoundError
+
+from HistoryApp import app_settings
+from classifier.rate_control import TRANSIENT_ERRORS, AdaptiveLimiter, backoff_delay
+from frontend.utils.settings import get_setting
+
+logger = app_settings.LOGGER
+
+T = TypeVar("T")
+
+DEFAULT_ENDPOINTS = [{'url': 'http://localhost:1234/v1', 'weight': 1, 'max_concurrency': 16}]
+# Consecutive failed requests that eject an endpoint
+EJECT_AFTER_FAILURES = 3
+# First ejection, doubled on each repeat up to the maximum
+EJECT_SECONDS = 30
+MAX_EJECT_SECONDS = 300
+# Recent request latencies kept per endpoint for the percentiles in the report
+LATENCY_SAMPLES = 1000
+
+
+def configured_endpoints() -> List[Dict]:
+    """The 'llm_endpoints' setting with defaults filled in"""
+    endpoints = []
+    for endpoint in get_setting('llm_endpoints', default_value=DEFAULT_ENDPOINTS) or DEFAULT_ENDPOINTS:
+        if isinstance(endpoint, str):
+            endpoint = {'url': endpoint}
+        endpoints.append({
+            'url': endpoint['url'].rstrip('/'),
+            'weight': max(float(endpoint.get('weight', 1)), 0.01),
+            'max_concurrency': max(int(endpoint.get('max_concurrency', 16)), 1),
+        })
+    return endpoints
+
+
+def check_endpoint(url: str, timeout: float = 5) -> Dict:
+    """Ask an endpoint for its models: whether it answered, how fast (ms), and the model list"""
+    try:
+        response = requests.get(f"{url}/models", timeout=timeout)
+        response.raise_for_status()
+        models = response.json().get('data', [])
+        return {'url': url, 'ok': True, 'ms': round(response.elapsed.total_seconds() * 1000),
+                'models': models if isinstance(models, list) else [], 'error': None}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        return {'url': url, 'ok': False, 'ms': None, 'models': [], 'error': str(e)}
+
+
+def _percentile(values: List[float], q: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))], 3)
+
+
+class Endpoint:
+    def __init__(self, url: str, weight: float = 1.0, max_concurrency: int = 16, initial_concurrency: int = 4):
+        self.url = url
+        self.weight = weight
+        self.max_concurrency = max_concurrency
+        self.limiter = AdaptiveLimiter(initial=min(initial_concurrency, max_concurrency), max_limit=max_concurrency)
+        self.client: Optional[AsyncOpenAI] = None
+        self.inflight = 0
+        self.failures = 0
+        self.ejected_until = 0.0
+        self.eject_seconds = EJECT_SECONDS
+        self.stats = {'requests': 0, 'errors': 0, 'entries': 0, 'seconds': 0.0, 'ejections': 0}
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        # Models listed by the last health check (None until one answered), and models it answered 404 for
+        self.models: Optional[Set[str]] = None
+        self.missing_models: Set[str] = set()
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.ejected_until
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.inflight < self.limiter.concurrency
+
+    def serves(self, model: Optional[str]) -> bool:
+        """Whether requests for `model` can go here; endpoints that listed no models are tried"""
+        if model is None:
+            return True
+        return model not in self.missing_models and (not self.models or model in self.models)
+
+    def record_success(self, seconds: float, size: int) -> None:
+        self.failures = 0
+        self.eject_seconds = EJECT_SECONDS
+        self.limiter.on_success(seconds, size)
+        self.stats['requests'] += 1
+        self.stats['entries'] += size
+        self.stats['seconds'] += seconds
+        self.latencies.append(seconds)
+
+    def record_failure(self) -> None:
+        self.limiter.on_overload()
+        self.stats['errors'] += 1
+        self.failures += 1
+        if self.failures >= EJECT_AFTER_FAILURES:
+            self.eject(f"{self.failures} failed requests in a row")
+
+    def eject(self, reason: str) -> None:
+        logger.warning(f"Ejecting model endpoint {self.url} for {self.eject_seconds}s: {reason}")
+        self.ejected_until = time.monotonic() + self.eject_seconds
+        self.eject_seconds = min(MAX_EJECT_SECONDS, self.eject_seconds * 2)
+        self.failures = 0
+        self.stats['ejections'] += 1
+
+
+class EndpointPool:
+    def __init__(self, endpoints: List[Dict], initial_concurrency: int = 4):
+        self.endpoints = [Endpoint(e['url'], e.get('weight', 1.0), e.get('max_concurrency', 16), initial_concurrency)
+                          for e in endpoints]
+        self.retries = 0
+        # Time spent in sessions, for throughput figures that don't count idle time
+        self.active_seconds = 0.0
+        self._session_start = None
+        self._condition: Optional[asyncio.Condition] = None
+
+    @classmethod
+    def from_settings(cls, initial_concurrency: int = 4) -> "EndpointPool":
+        return cls(configured_endpoints(), initial_concurrency)
+
+    @property
+    def concurrency(self) -> int:
+        """Requests allowed in flight across the healthy endpoints"""
+        return sum(e.limiter.concurrency for e in self.endpoints if e.healthy)
+
+    def check_health(self) -> List[Dict]:
+        """Health check every endpoint, ejecting the ones that don't answer"""
+        results = []
+        for endpoint in self.endpoints:
+            result = check_endpoint(endpoint.url)
+            if result['ok']:
+                endpoint.models = {model.get('id') for model in result['models'] if isinstance(model, dict)}
+                endpoint.missing_models.clear()
+            elif endpoint.healthy:
+                endpoint.eject(f"health check failed: {result['error']}")
+            results.append(result)
+        return results
+
+    def _candidates(self, model: Optional[str], exclude: Set[Endpoint]) -> List[Endpoint]:
+        """Endpoints a request may go to: serving the model, not yet tried, healthy ones if any"""
+        # When no endpoint lists the model they are all tried, rather than fail without a request
+        serving = [e for e in self.endpoints if e.serves(model)] or self.endpoints
+        serving = [e for e in serving if e not in exclude]
+        # With every endpoint ejected they are all tried anyway, rather than stalling the run
+        return [e for e in serving if e.healthy] or serving
+
+    @asynccontextmanager
+    async def session(self, timeout: float = 120):
+        """Open a client per endpoint for the running event loop"""
+        self._condition = asyncio.Condition()
+        for endpoint in self.endpoints:
+            # The client's own retries are off: the pool has to see every 429/5xx
+            endpoint.client = AsyncOpenAI(base_url=endpoint.url, api_key="not-needed", timeout=timeout, max_retries=0)
+            endpoint.inflight = 0
+        self._session_start = time.monotonic()
+        try:
+            yield self
+        finally:
+            self.active_seconds += time.monotonic() - self._session_start
+            self._session_start = None
+            for endpoint in self.endpoints:
+                await endpoint.client.close()
+                endpoint.client = None
+
+    async def _acquire(self, model: Optional[str] = None, exclude: Set[Endpoint] = frozenset()) -> Optional[Endpoint]:
+        """
+        Slot on the least loaded healthy endpoint serving `model`, waiting for one if all
+        are busy. None when no endpoint outside `exclude` serves the model.
+        """
+        async with self._condition:
+            while True:
+                usable = self._candidates(model, exclude)
+                if not usable:
+                    return None
+                candidates = [e for e in usable if e.has_capacity]
+                if candidates:
+                    endpoint = min(candidates, key=lambda e: (e.inflight + 1) / e.weight)
+                    endpoint.inflight += 1
+                    return endpoint
+                await self._condition.wait()
+
+    async def _release(self, endpoint: Endpoint) -> None:
+        async with self._condition:
+            endpoint.inflight -= 1
+            self._condition.notify_all()
+
+    async def request(self, call: Callable[[AsyncOpenAI], Awaitable[T]], size: int = 1, attempts: int = 4,
+                      model: Optional[str] = None) -> T:
+        """
+        Run `call` with the client of an endpoint serving `model`. Transient failures
+        (429, 5xx, timeouts, connection errors) are retried, on another endpoint when
+        there is one, up to `attempts` tries in total. Other API errors (a 404 for a
+        model the server doesn't have, a rejected request) move on to an endpoint not
+        tried yet, and are raised once there is none; so is the last failure. With no
+        endpoint to send the request to at all, a RuntimeError is raised.
+        """
+        rejected_by = set()
+        error = None
+        for attempt in range(attempts):
+            endpoint = await self._acquire(model, rejected_by)
+            if endpoint is None:
+                # Every endpoint rejected the request, or there is none to send it to
+                raise error or RuntimeError(f"No model endpoint serves {model!r}")
+            start = time.perf_counter()
+            try:
+                result = await call(endpoint.client)
+            except TRANSIENT_ERRORS as e:
+                endpoint.record_failure()
+                error = e
+            except APIStatusError as e:
+                if isinstance(e, NotFoundError) and model is not None:
+                    logger.warning(f"Model endpoint {endpoint.url} doesn't serve model '{model}', sending its requests elsewhere")
+                    endpoint.missing_models.add(model)
+                    endpoint.stats['errors'] += 1
+                else:
+                    endpoint.record_failure()
+                rejected_by.add(endpoint)
+                error = e
+            except Exception:
+                endpoint.stats['errors'] += 1
+                raise
+            else:
+                endpoint.record_success(time.perf_counter() - start, size)
+                return result
+            finally:
+                await self._release(endpoint)
+
+            if attempt == attempts - 1:
+                raise error
+            self.retries += 1
+            # No need to back off when another endpoint can take the retry right away
+            if endpoint in rejected_by:
+                continue
+            if endpoint.healthy or not any(e.healthy for e in self.endpoints):
+                await asyncio.sleep(backoff_delay(error, attempt))
+
+    def report(self) -> List[Dict]:
+        """Per-endpoint state and throughput while classifying"""
+        elapsed = self.active_seconds + (time.monotonic() - self._session_start if self._session_start else 0.0)
+        elapsed = max(elapsed, 1e-9)
+        return [{
+            'url': e.url,
+            'weight': e.weight,
+            'healthy': e.healthy,
+            'concurrency': e.limiter.concurrency,
+            'max_concurrency': e.max_concurrency,
+            'requests': e.stats['requests'],
+            'errors': e.stats['errors'],
+            'ejections': e.stats['ejections'],
+            'entries': e.stats['entries'],
+            'entries_per_second': round(e.stats['entries'] / elapsed, 2),
+            'avg_latency': round(e.stats['seconds'] / e.stats['requests'], 3) if e.stats['requests'] else None,
+            'p50_latency': _percentile(e.latencies, 0.5),
+            'p95_latency': _percentile(e.latencies, 0.95),
+        } for e in self.endpoints]
@@ -0,0 +1,165 @@
+"""
+Local nearest-centroid classifier trained from the model's previous answers.
+
+Entries are turned into hashed bag-of-token vectors (title words and bigrams,
+host and path tokens) weighted by TF-IDF. Every category keeps the sum of its
+training vectors, so training is incremental: new labels are simply added.
+Prediction is a cosine similarity against the category centroids, computed
+for whole batches at once on sparse (entry, token, weight) triples. The gap
+between the best and second best category is the confidence; only confident
+entries are decided locally, the rest still go to the LLM.
+"""
+import os
+import re
+import zlib
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+import numpy as np
+
+from classifier.cache import category_set_hash
+
+HASH_DIM = 1 << 16
+# Entries vectorised at once
+CHUNK_SIZE = 4096
+# Minimum training data before the model is trusted with any entry
+MIN_TRAINING_DOCS = 200
+MIN_CATEGORY_DOCS = 5
+
+
+def entry_tokens(entry: Dict) -> List[str]:
+    """Tokens of an entry: host and its parent domains, path words, title words and bigrams"""
+    tokens = []
+    try:
+        parts = urlsplit(entry.get('url') or '')
+        host = (parts.hostname or '').lower()
+        path = parts.path
+    except ValueError:
+        host, path = '', ''
+    if host.startswith('www.'):
+        host = host[4:]
+    labels = host.split('.') if host else []
+    tokens.extend(f"host:{'.'.join(labels[i:])}" for i in range(max(0, len(labels) - 1)))
+    tokens.extend(f"path:{word}" for word in re.findall(r'[a-z]{3,}', path.lower()))
+    words = re.findall(r'\w{2,}', (entry.get('title') or '').lower())
+    tokens.extend(words)
+    tokens.extend(f"{a} {b}" for a, b in zip(words, words[1:]))
+    return tokens
+
+
+class LocalModel:
+    def __init__(self, categories: Iterable[str], dim: int = HASH_DIM):
+        self.categories = list(categories)
+        self.category_hash = category_set_hash(self.categories)
+        self.index = {category: i for i, category in enumerate(self.categories)}
+        self.dim = dim
+        self.class_sums = np.zeros((len(self.categories), dim), dtype=np.float32)
+        self.class_counts = np.zeros(len(self.categories), dtype=np.int64)
+        self.doc_freq = np.zeros(dim, dtype=np.int64)
+        self.docs = 0
+        self._centroids = None
+
+    def _term_counts(self, entries: List[Dict]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Sublinear term frequencies of a chunk of entries as sparse triples:
+        (entry index, hashed token, weight), one triple per distinct token of an entry.
+        """
+        cells = []
+        for i, entry in enumerate(entries):
+            cells.extend(i * self.dim + zlib.crc32(token.encode('utf-8')) % self.dim for token in entry_tokens(entry))
+        cells, counts = np.unique(np.array(cells, dtype=np.int64), return_counts=True)
+        return cells // self.dim, cells % self.dim, np.log1p(counts).astype(np.float32)
+
+    def _idf(self) -> np.ndarray:
+        return (np.log((1.0 + self.docs) / (1.0 + self.doc_freq)) + 1.0).astype(np.float32)
+
+    @property
+    def ready(self) -> bool:
+        return self.docs >= MIN_TRAINING_DOCS
+
+    def update(self, entries: Iterable[Dict]) -> int:
+        """Add labelled entries (with a 'category' from the category list), returns how many were used"""
+        used = 0
+        chunk = []
+        for entry in entries:
+            if entry.get('category') in self.index:
+                chunk.append(entry)
+            if len(chunk) >= CHUNK_SIZE:
+                used += self._update_chunk(chunk)
+                chunk = []
+        if chunk:
+            used += self._update_chunk(chunk)
+        self._centroids = None
+        return used
+
+    def _update_chunk(self, entries: List[Dict]) -> int:
+        rows, cols, weights = self._term_counts(entries)
+        labels = np.array([self.index[entry['category']] for entry in entries], dtype=np.int64)
+        np.add.at(self.class_sums, (labels[rows], cols), weights)
+        self.class_counts += np.bincount(labels, minlength=len(self.categories))
+        self.doc_freq += np.bincount(cols, minlength=self.dim)
+        self.docs += len(entries)
+        return len(entries)
+
+    def _get_centroids(self) -> np.ndarray:
+        if self._centroids is None:
+            centroids = self.class_sums * self._idf()
+            norms = np.linalg.norm(centroids, axis=1, keepdims=True)
+            self._centroids = centroids / np.maximum(norms, 1e-12)
+        return self._centroids
+
+    def predict(self, entries: List[Dict]) -> List[Tuple[str, float]]:
+        """(best category, confidence) per entry; confidence is the best minus the second best similarity"""
+        if not entries:
+            return []
+        centroids = self._get_centroids()
+        idf = self._idf()
+        # Categories with too few examples can't be predicted
+        unusable = self.class_counts < MIN_CATEGORY_DOCS
+
+        predictions = []
+        for start in range(0, len(entries), CHUNK_SIZE):
+            chunk = entries[start:start + CHUNK_SIZE]
+            rows, cols, weights = self._term_counts(chunk)
+            weights = weights * idf[cols]
+            norms = np.sqrt(np.bincount(rows, weights=weights * weights, minlength=len(chunk)))
+            weights /= np.maximum(norms[rows], 1e-12)
+            # Cosine similarity: per category, sum the centroid weights of each entry's tokens
+            token_scores = centroids[:, cols] * weights
+            scores = np.stack([np.bincount(rows, weights=category_scores, minlength=len(chunk))
+                               for category_scores in token_scores], axis=1)
+            scores[:, unusable] = -1.0
+            if scores.shape[1] > 1:
+                top2 = np.sort(scores, axis=1)[:, -2:]
+                confidence = top2[:, 1] - top2[:, 0]
+            else:
+                confidence = scores[:, 0]
+            best = scores.argmax(axis=1)
+            predictions.extend((self.categories[b], float(c)) for b, c in zip(best, confidence))
+        return predictions
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp.npz")
+        np.savez_compressed(tmp_path, class_sums=self.class_sums, class_counts=self.class_counts,
+                            doc_freq=self.doc_freq, docs=self.docs,
+                            categories=np.array(self.categories), category_hash=self.category_hash)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: Path, categories: Iterable[str]) -> Optional["LocalModel"]:
+        """Saved model, or None if missing or trained for a different category list"""
+        categories = list(categories)
+        if not path.exists():
+            return None
+        with np.load(path) as data:
+            if str(data['category_hash']) != category_set_hash(categories):
+                return None
+            saved_categories = [str(category) for category in data['categories']]
+            model = cls(saved_categories, dim=data['class_sums'].shape[1])
+            model.class_sums = data['class_sums']
+            model.class_counts = data['class_counts']
+            model.doc_freq = data['doc_freq']
+            model.docs = int(data['docs'])
+        return model
@@ -1,49 +1,226 @@
 # classifier.py
+import asyncio
 import json
 import logging
+import math
+import re
 import time
 from pathlib import Path
-from typing import List, Dict, Optional
-from openai import OpenAI
+from typing import Callable, List, Dict, Optional, Iterator, Tuple
+from asgiref.sync import sync_to_async
 from datetime import datetime
 from HistoryApp import app_settings
-from frontend.utils.settings import get_setting
+from backupManager.formats import find_backup_files, iter_backup_entries
+from classifier import cache
+from classifier.cache import cache_key, category_set_hash, classification_key
+from classifier.canonical import group_entries
+from classifier.local_model import LocalModel
+from classifier.endpoints import EndpointPool, configured_endpoints
+from classifier.rules import RuleEngine
+from classifier.sampling import draw_sample
+from django.db.models import Count
+from django.utils import timezone
+from frontend.models import HistoryEvent, VisitEvent
+from frontend.utils.settings import get_setting, set_setting
 
 # AI model name from settings.py
 
 logger = app_settings.LOGGER
 
+# Completion tokens allowed per entry in short answers ("12:3" and a newline)
+SHORT_ANSWER_TOKENS = 6
+
+# Orders entries can be classified in ('classification_order' setting); 'sample' is a sampling job's
+CLASSIFICATION_ORDERS = ('visit_count', 'recent_visits', 'backup', 'sample')
+
+
+def _strip_thinking(content: str) -> Tuple[str, int]:
+    """Answer after a reasoning block, and where it starts in the content"""
+    end = content.rfind("</think>")
+    offset = end + len("</think>") if end != -1 else 0
+    return content[offset:], offset
+
+
+def _short_answer(choice) -> Tuple[Optional[str], int]:
+    """
+    Answer of a short reply, after any reasoning block, and where it starts in the content.
+    None when the reply ran out of tokens or its reasoning block was never closed: numbers
+    in it are part of the reasoning, not category numbers.
+    """
+    content = choice.message.content or ""
+    if getattr(choice, "finish_reason", None) == "length" or content.rfind("<think>") > content.rfind("</think>"):
+        return None, 0
+    return _strip_thinking(content)
+
+
+def _reasons(choice) -> bool:
+    """Whether a reply holds reasoning: a <think> block, or reasoning the server returned separately"""
+    message = choice.message
+    return "<think>" in (message.content or "") or bool(getattr(message, "reasoning_content", None))
+
+
+def _answer_confidence(choice, spans: List[Tuple[int, int]]) -> List[Optional[float]]:
+    """
+    Probability the model gave to each answer span (character ranges of the content),
+    from the token logprobs. None for every span when the server returned no logprobs.
+    """
+    tokens = getattr(getattr(choice, "logprobs", None), "content", None)
+    if not tokens:
+        return [None] * len(spans)
+    offsets = []
+    position = 0
+    for token in tokens:
+        offsets.append((position, position + len(token.token), token.logprob))
+        position += len(token.token)
+    return [math.exp(sum(logprob for start, end, logprob in offsets if start < span_end and end > span_start))
+            for span_start, span_end in spans]
+
 
 class HistoryClassifier:
-    def __init__(self, model_name: str = "local-model", base_url: str = "http://localhost:1234/v1"):
-        self.client = OpenAI(base_url=base_url, api_key="not-needed")
+    def __init__(self, model_name: str = "local-model", base_url: Optional[str] = None):
+        # A single server instead of the 'llm_endpoints' pool
+        self.base_url = base_url
         self.model_name = get_setting('current_model', default_value=model_name)
-        self.model_thinking = False
+        # Reasoning models ('model_thinking' setting) are asked to skip reasoning and get room for it
+        self.model_thinking = get_setting('model_thinking', default_value=False)
+        # Set once a reply shows the model reasons although the setting says it doesn't
+        self.detected_thinking = False
+        # Cleared once the model starts a reply with a stop sequence (e.g. a newline)
+        self.stop_sequences = True
         self.backup_dir = app_settings.BACKUP_DIR
         self.status = {}
+        self.local_model = None
         self.temperature = get_setting('temperature', default_value=0.1)
         self.max_tokens = get_setting('max_tokens', default_value=1000)
         self.current_categories = get_setting('categories', default_value=['Work', 'Personal', 'Other'])
-
-
-    def _load_latest_backup(self, browser: str) -> Optional[List[Dict]]:
-        """Load most recent backup file for a browser"""
+        # Initial requests in flight; the rate controller adapts it to what the server copes with
+        self.concurrency = get_setting('classification_concurrency', default_value=4)
+        self.pool = None
+        self.pool_config = None
+        self.retry_attempts = 4
+        self.short_answers = True
+        self.logprobs = False
+        # Model requests sent by this classifier, and the limits of the current run (see start_budget)
+        self.requests_sent = 0
+        self.budget = None
+
+
+    def _load_latest_backup(self, browser: str, start_date: Optional[datetime] = None,
+                            end_date: Optional[datetime] = None) -> Iterator[Dict]:
+        """
+        Stream the entries of the most recent backup file for a browser,
+        optionally only those last visited within [start_date, end_date]
+        """
         try:
-            backups = list(self.backup_dir.glob(f"{browser.lower()}_history.json"))
+            backups = find_backup_files(self.backup_dir, browser)
             if not backups:
                 logger.warning(f"No backups found for {browser}")
-                return None
+                return
 
             latest_backup = max(backups, key=lambda f: f.stat().st_mtime)
-            with open(latest_backup, 'r', encoding='utf-8') as f:
-                return json.load(f)
+            yield from iter_backup_entries(latest_backup, start_date, end_date)
 
         except Exception as e:
             logger.error(f"Failed to load {browser} backup: {e}")
-            return None
 
-    def _generate_category(self, entry: Dict) -> Dict:
+    async def _is_disabled(self) -> bool:
+        """Whether classification was stopped or ran out of budget (the setting lives in the database, read off the event loop)"""
+        stopped = await sync_to_async(get_setting)('classification_status', 1) == 1
+        return stopped or self.budget_exhausted()
+
+    def start_budget(self, seconds: float = 0, requests: int = 0) -> None:
+        """
+        Limit the classification that follows to `seconds` of run time and `requests`
+        model requests (0 for no limit). Once either is used up, classification stops
+        as if it was stopped from the classification page.
+        """
+        self.budget = {
+            'deadline': time.monotonic() + seconds if seconds else None,
+            'requests': self.requests_sent + int(requests) if requests else None,
+        }
+
+    def budget_exhausted(self) -> bool:
+        if self.budget is None:
+            return False
+        deadline, requests = self.budget['deadline'], self.budget['requests']
+        return (deadline is not None and time.monotonic() >= deadline) \
+            or (requests is not None and self.requests_sent >= requests)
+
+    def _get_pool(self) -> EndpointPool:
+        """
+        Endpoint pool, kept across batches and runs so every endpoint starts from the
+        concurrency it learned; rebuilt when the endpoints or concurrency settings change.
+        """
+        endpoints = [{'url': self.base_url.rstrip('/')}] if self.base_url else configured_endpoints()
+        initial = get_setting('classification_concurrency', default_value=self.concurrency)
+        config = (endpoints, initial)
+        if self.pool is None or self.pool_config != config:
+            self.pool = EndpointPool(endpoints, initial_concurrency=int(initial))
+            self.pool_config = config
+        return self.pool
+
+    async def _complete(self, prompt: str, size: int,
+                        max_tokens: Optional[int] = None, stop: Optional[List[str]] = None):
+        """
+        Send one chat request to the endpoint pool, retrying transient failures.
+        Token usage is added to the status. A reply that opens with a stop sequence
+        is asked again, and stop sequences are no longer sent to the model.
+        """
+        # Counted when sent, so concurrent batches can't all slip past a request budget
+        self.requests_sent += 1
+        options = {"max_tokens": max_tokens or self.max_tokens}
+        if stop and self.stop_sequences and not self.model_thinking:
+            options["stop"] = stop
+        if self.logprobs:
+            options["logprobs"] = True
+        response = await self.pool.request(
+            lambda client: client.chat.completions.create(
+                messages=[{"role": "user", "content": prompt}],
+                model=self.model_name,
+                temperature=self.temperature,
+                **options,
+            ),
+            size=size,
+            attempts=self.retry_attempts,
+            model=self.model_name,
+        )
+        usage = getattr(response, "usage", None)
+        self.status = {
+            **self.status,
+            "requests": self.status.get("requests", 0) + 1,
+            "prompt_tokens": self.status.get("prompt_tokens", 0) + (getattr(usage, "prompt_tokens", 0) or 0),
+            "completion_tokens": self.status.get("completion_tokens", 0) + (getattr(usage, "completion_tokens", 0) or 0),
+        }
+        choice = response.choices[0]
+        if "stop" in options and choice.finish_reason == "stop" and not (choice.message.content or "").strip():
+            # Stopped before answering: the reply opened with a stop sequence
+            logger.warning(f"{self.model_name} starts its replies with a stop sequence, asking without stop sequences")
+            self.stop_sequences = False
+            return await self._complete(prompt, size, max_tokens, stop)
+        return response
+
+    async def _complete_short(self, build_prompt: Callable[[], str], count: int, stop: List[str]):
+        """
+        Short-answer request for `count` entries. A reply with reasoning turns model_thinking
+        on, as the model reasons although the setting says it doesn't; if the reasoning
+        was cut off by the short budget, the request is sent again with room for it.
+        """
+        response = await self._complete(build_prompt(), size=count, max_tokens=self._short_token_budget(count), stop=stop)
+        choice = response.choices[0]
+        if not self.model_thinking and _reasons(choice):
+            logger.warning(f"{self.model_name} replies with reasoning, allowing {self.max_tokens} more tokens "
+                           f"per request for it (see the 'model_thinking' setting)")
+            self.model_thinking = self.detected_thinking = True
+            if _short_answer(choice)[0] is None:
+                response = await self._complete(build_prompt(), size=count,
+                                                max_tokens=self._short_token_budget(count), stop=stop)
+        return response
+
+    async def _generate_category(self, entry: Dict) -> Dict:
         """Classify a single history entry using local model"""
+        if self.short_answers:
+            return await self._generate_short_category(entry)
+
         prompt = f"""Analyze this browsing history entry and classify it into one of these categories: 
                 {', '.join(self.current_categories)}.
 
@@ -53,17 +230,8 @@ class HistoryClassifier:
 
         logger.info(f"Classifying entry: {entry['url']}")
 
-        if get_setting('classification_status', 1) == 1:
-            logger.info(f"Classification is disabled. Skipping entry: {entry['url']}")
-            return {**entry, "category": "Classification Disabled"}
-
         try:
-            response = self.client.chat.completions.create(
-                messages=[{"role": "user", "content": prompt}],
-                model=self.model_name,
-                temperature=self.temperature,
-                max_tokens=self.max_tokens,
-            )
+            response = await self._complete(prompt, size=1)
 
             category = response.choices[0].message.content.strip()
             # Validate category against known categories
@@ -82,14 +250,235 @@ class HistoryClassifier:
             logger.error(f"Classification failed for {entry['url']}: {e}")
             return {**entry, "category": "Classification Failed"}
 
-    def classify_history(self, browser: str, start_date: datetime, end_date: datetime) -> List[Dict]:
-        """Classify history within date range with robust date handling"""
-        history = self._load_latest_backup(browser)
-        if not history:
-            return []
+    def _short_prompt_header(self) -> str:
+        """Numbered category list for short answers; models answer with the number instead of the name"""
+        categories = ", ".join(f"{i}={category}" for i, category in enumerate(self.current_categories, start=1))
+        return f"Categories: {categories}"
+
+    def _short_prompt_footer(self, instruction: str) -> str:
+        other = self.current_categories.index("Other") + 1 if "Other" in self.current_categories else None
+        footer = instruction + (f" Use {other} if nothing fits." if other else "")
+        # Thinking models are asked to skip reasoning, which costs far more than the answer
+        return footer + (" /no_think" if self.model_thinking else "")
+
+    def _short_token_budget(self, count: int) -> int:
+        # A few tokens per answer line ("12:3"); reasoning models also get the full budget,
+        # in case they reason despite /no_think (servers only count the tokens used)
+        budget = SHORT_ANSWER_TOKENS * count + 4
+        return budget + self.max_tokens if self.model_thinking else budget
+
+    def _category_from_index(self, value: str) -> str:
+        index = int(value)
+        if not 1 <= index <= len(self.current_categories):
+            # Not a category the model was offered; failed answers aren't cached and are retried
+            logger.warning(f"Unknown category number {index} in short answer")
+            return "Classification Failed"
+        return self.current_categories[index - 1]
+
+    async def _generate_short_category(self, entry: Dict) -> Dict:
+        """Classify a single entry, answered with a category number"""
+        title = ' '.join((entry.get('title') or '').split())
+        def build_prompt() -> str:
+            # Built per request, as the footer changes once the model turns out to reason
+            return (f"{self._short_prompt_header()}\n\n"
+                    f"Entry: {title} ({entry['url']})\n\n"
+                    + self._short_prompt_footer("Answer with the category number only."))
+        logger.info(f"Classifying entry: {entry['url']}")
+
+        try:
+            response = await self._complete_short(build_prompt, 1, stop=["\n"])
+            choice = response.choices[0]
+            content, offset = _short_answer(choice)
+            # The answer starts with the number; one further in is more likely reasoning than an answer
+            match = re.match(r'\W*(\d+)\b', content) if content is not None else None
+            if match is None:
+                logger.warning(f"No category number in answer '{choice.message.content}' for {entry['url']}")
+                return {**entry, "category": "Classification Failed"}
+            confidence = _answer_confidence(choice, [(offset + match.start(1), offset + match.end(1))])[0]
+            return {**entry, "category": self._category_from_index(match.group(1)), "confidence": confidence}
 
+        except Exception as e:
+            logger.error(f"Classification failed for {entry['url']}: {e}")
+            return {**entry, "category": "Classification Failed"}
+
+    def _build_short_batch_prompt(self, entries: List[Dict]) -> str:
+        lines = "\n".join(f"{i}. {' '.join((entry.get('title') or '').split())} ({entry['url']})"
+                          for i, entry in enumerate(entries, start=1))
+        return (f"{self._short_prompt_header()}\n\n"
+                f"Classify each of these browsing history entries:\n{lines}\n\n"
+                + self._short_prompt_footer('Answer with one line per entry: the entry number, a colon and the '
+                                            'category number, e.g. "1:3", and nothing else.'))
+
+    def _parse_short_response(self, choice, count: int) -> Optional[List[Tuple[str, Optional[float]]]]:
+        """
+        Map a short batch answer ("entry:category" lines) back to (category, confidence)
+        per entry. Returns None if entries are missing, or the answer was cut off or is
+        still reasoning.
+        """
+        content, offset = _short_answer(choice)
+        if content is None:
+            return None
+        answers = {}
+        for match in re.finditer(r'^\s*(\d+)\s*[:=.)-]\s*(\d+)', content, re.MULTILINE):
+            answers.setdefault(int(match.group(1)), match)
+        if any(i not in answers for i in range(1, count + 1)):
+            return None
+        matches = [answers[i] for i in range(1, count + 1)]
+        confidences = _answer_confidence(choice, [(offset + m.start(2), offset + m.end(2)) for m in matches])
+        return [(self._category_from_index(m.group(2)), confidence) for m, confidence in zip(matches, confidences)]
+
+    def _build_batch_prompt(self, entries: List[Dict]) -> str:
+        """One prompt for several entries, numbered so the answer can be mapped back"""
+        # Titles are flattened to one line so each entry stays on its own numbered line
+        lines = "\n".join(f"{i}. {' '.join((entry.get('title') or '').split())} ({entry['url']})"
+                          for i, entry in enumerate(entries, start=1))
+        return (f"Classify each of these browsing history entries into one of these categories: "
+                f"{', '.join(self.current_categories)}.\n\n"
+                f"{lines}\n\n"
+                'Answer with a JSON object mapping each entry number to its category name, '
+                'e.g. {"1": "Other"}, and nothing else. '
+                'If an entry doesn\'t fit any category, use "Other".')
+
+    def _parse_batch_response(self, content: str, count: int) -> Optional[List[str]]:
+        """
+        Map a JSON batch answer back to one category per entry.
+        Returns None if the answer isn't valid JSON or misses entries.
+        """
+        if self.model_thinking or "</think>" in content:
+            content = content.split("</think>")[-1]
+        start, end = content.find("{"), content.rfind("}")
+        if start == -1 or end <= start:
+            return None
+        try:
+            answer = json.loads(content[start:end + 1])
+        except json.JSONDecodeError:
+            return None
+        if not isinstance(answer, dict):
+            return None
+
+        categories = []
+        for i in range(1, count + 1):
+            category = answer.get(str(i))
+            if not isinstance(category, str):
+                return None
+            category = category.strip()
+            if category not in self.current_categories:
+                logger.warning(f"Unknown category '{category}' in batch answer")
+                category = "Other"
+            categories.append(category)
+        return categories
+
+    async def _classify_batch(self, entries: List[Dict]) -> List[Dict]:
+        """
+        Classify several entries with a single request. If the answer can't be
+        parsed, the batch is split in half and retried, down to one request per entry.
+        """
+        if await self._is_disabled():
+            logger.info(f"Classification is disabled. Skipping {len(entries)} entries")
+            return [{**entry, "category": "Classification Disabled"} for entry in entries]
+
+        if len(entries) == 1:
+            return [await self._generate_category(entries[0])]
+
+        logger.info(f"Classifying batch of {len(entries)} entries")
+        try:
+            if self.short_answers:
+                response = await self._complete_short(lambda: self._build_short_batch_prompt(entries), len(entries),
+                                                      stop=["\n\n"])
+                answers = self._parse_short_response(response.choices[0], len(entries))
+                if answers is not None:
+                    return [{**entry, "category": category, "confidence": confidence}
+                            for entry, (category, confidence) in zip(entries, answers)]
+                categories = None
+            else:
+                response = await self._complete(self._build_batch_prompt(entries), size=len(entries))
+                categories = self._parse_batch_response(response.choices[0].message.content or "", len(entries))
+        except Exception as e:
+            logger.error(f"Batch classification failed: {e}")
+            categories = None
+
+        if categories is None:
+            middle = len(entries) // 2
+            logger.warning(f"Unusable answer for a batch of {len(entries)} entries, retrying in batches of {middle}")
+            return await self._classify_batch(entries[:middle]) + await self._classify_batch(entries[middle:])
+
+        return [{**entry, "category": category} for entry, category in zip(entries, categories)]
+
+    def _skip_classified(self, entries: List[Dict]) -> List[Dict]:
+        """Drop entries already stored with a category chosen from the same URL, title, model and category list"""
+        done = set()
+        urls = [entry['url'] for entry in entries]
+        for start in range(0, len(urls), 500):
+            done.update(HistoryEvent.objects.filter(url__in=urls[start:start + 500]).exclude(category='')
+                        .values_list('classification_key', flat=True))
+        remaining = [entry for entry in entries if entry['classification_key'] not in done]
+        logger.info(f"Skipping {len(entries) - len(remaining)} already classified entries")
+        return remaining
+
+    def classify_history(self, browser: str, start_date: datetime, end_date: datetime,
+                         force: bool = False) -> List[Dict]:
+        """
+        Classify history within date range with robust date handling.
+        Entries classified before from the same URL, title, model and category list
+        are skipped unless `force` is set.
+        """
+        return [entry for results, _, _ in self.iter_classified_batches(browser, start_date, end_date, force=force)
+                for entry in results]
+
+    def _prioritise(self, browser: str, entries: List[Dict], order: str,
+                    start_date: datetime, end_date: datetime) -> List[Dict]:
+        """
+        Entries in classification order: most visited first ('visit_count'), most
+        visited within the date range first, counted from the ingested visits
+        ('recent_visits'), or as they are in the backup ('backup'). Ties keep the
+        backup order. The order is worked out again on every run from the latest backup
+        and visits, so it can differ when a job out of budget is resumed after a backup;
+        resuming doesn't depend on it (see iter_classified_batches).
+        'sample' keeps only a stratified sample ('classification_sample_size' entries,
+        see classifier/sampling.py), for an estimate of the category mix.
+        """
+        if order not in CLASSIFICATION_ORDERS:
+            logger.warning(f"Unknown classification order '{order}', ordering by visit count")
+        if order == 'backup':
+            return entries
+        if order == 'sample':
+            sample = draw_sample(entries, int(get_setting('classification_sample_size', default_value=300)))
+            logger.info(f"Sampled {len(sample)} of {len(entries)} {browser} entries")
+            return sample
+        if order == 'recent_visits':
+            visits = dict(VisitEvent.objects.filter(browser=browser.lower(),
+                                                    visit_time__gte=start_date.strftime("%Y-%m-%d %H:%M:%S"),
+                                                    visit_time__lte=end_date.strftime("%Y-%m-%d %H:%M:%S"))
+                          .values('url').annotate(count=Count('id')).values_list('url', 'count'))
+            if visits:
+                return sorted(entries, key=lambda entry: (-visits.get(entry['url'], 0), -(entry.get('visit_count') or 0)))
+            logger.info(f"No ingested {browser} visits in range, ordering by visit count")
+        return sorted(entries, key=lambda entry: -(entry.get('visit_count') or 0))
+
+    def iter_classified_batches(self, browser: str, start_date: datetime, end_date: datetime,
+                                force: bool = False, order: Optional[str] = None,
+                                forced_since: Optional[datetime] = None) -> Iterator[Tuple[List[Dict], int, int]]:
+        """
+        Classify history in checkpoint batches ('classification_checkpoint_size'), yielding
+        (batch results, entries in range done so far, entries in range) after each one.
+        Results aren't kept, so memory stays flat.
+
+        A resumed job starts over rather than from a position: the backup may have changed
+        since (new rows come first, visit counts move the order), so positions don't
+        carry over. Entries it already committed are skipped as classified, or in a
+        forced job answered from the cache it refreshed, without asking the model again.
+
+        Entries go in `order` (default: the 'classification_order' setting), most visited
+        first unless it is 'backup', so a run that is stopped or runs out of budget
+        (start_budget) has covered most of the actual browsing. A resumed run re-sorts
+        with the current visit counts, so it continues with what is now most visited.
+
+        With `force`, entries are classified again even if they already are, and the domain
+        cache and the local classifier only answer for domains the model classified since
+        `forced_since` (the forced job's start, default now).
+        """
         filtered = []
-        for entry in history:
+        for entry in self._load_latest_backup(browser, start_date, end_date):
             # Validate date field
             if not entry.get('last_visit'):
                 logger.warning(f"Skipping entry with missing date: {entry['url']}")
@@ -105,40 +494,257 @@ class HistoryClassifier:
             except ValueError as e:
                 logger.warning(f"Invalid date '{entry['last_visit']}' in {entry['url']}: {e}")
 
+        order = order or get_setting('classification_order', default_value='visit_count')
+        filtered = self._prioritise(browser, filtered, order, start_date, end_date)
+        # Share of the visits in range that belong to entries done so far
+        visits = [entry.get('visit_count') or 0 for entry in filtered]
+        total_visits = max(1, sum(visits))
+        covered_visits = 0
+
+        total = len(filtered)
+        self.status = {"browser": browser.lower(), "total": total, "processed": 0,
+                       "remaining": total, "cache_hits": 0, "cache_misses": 0,
+                       "rule_hits": 0, "local_hits": 0, "duplicates": 0, "model_entries": 0,
+                       "visit_coverage": 0.0}
         if not filtered:
             logger.warning(f"No entries found for {browser} within the specified date range")
-            return []
-
-        # get number of entries
+            yield [], 0, 0
+            return
 
-        num_entries = len(filtered)
-        processed = 0
+        # Endpoints that are down are ejected before any request is sent to them
+        self._get_pool().check_health()
+
+        category_hash = category_set_hash(self.current_categories)
+        rules = RuleEngine.from_settings(self.current_categories)
+        if force:
+            forced_since = forced_since or timezone.now()
+        checkpoint_size = max(1, int(get_setting('classification_checkpoint_size', default_value=500)))
+
+        for start in range(0, total, checkpoint_size):
+            if get_setting('classification_status', default_value=1) == 1 or self.budget_exhausted():
+                reason = "budget used up" if self.budget_exhausted() else "stopped"
+                logger.info(f"Classification {reason} after {start} of {total} {browser} entries, "
+                            f"covering {self.status['visit_coverage']}% of their visits")
+                yield [], start, total
+                return
+            batch = [{**entry, "classification_key": classification_key(entry, self.model_name, category_hash)}
+                     for entry in filtered[start:start + checkpoint_size]]
+            batch_results, stopped = self._classify_checkpoint_batch(browser, batch, rules, force, forced_since)
+            # A stopped batch isn't complete, so it isn't counted as committed
+            committed = start if stopped else start + len(batch)
+            covered_visits += sum(visits[start:committed])
+            self.status = {**self.status, "visit_coverage": round(100 * covered_visits / total_visits, 1)}
+            yield batch_results, committed, total
+            if stopped:
+                return
+
+    def _advance(self, count: int) -> None:
+        """Count entries as done in the progress status"""
+        processed = self.status.get("processed", 0) + count
+        self.status = {**self.status, "processed": processed, "remaining": max(0, self.status.get("total", 0) - processed)}
+
+    def _classify_checkpoint_batch(self, browser: str, entries: List[Dict], rules: RuleEngine,
+                                   force: bool, forced_since: Optional[datetime] = None) -> Tuple[List[Dict], bool]:
+        """Classify one checkpoint batch; returns its results and whether classification was stopped"""
+        if not force:
+            remaining = self._skip_classified(entries)
+            self._advance(len(entries) - len(remaining))
+            entries = remaining
+            if not entries:
+                return [], False
+
+        # Entries differing only by tracking parameters, session IDs, pagination and the like
+        # are classified once, with the canonical URL, and the others get the same category
+        if get_setting('classification_group_duplicates', default_value=True):
+            representatives, groups = group_entries(entries, get_setting('classification_ignored_params',
+                                                                         default_value=[]))
+        else:
+            representatives, groups = entries, list(range(len(entries)))
+        duplicates = len(entries) - len(representatives)
+        logger.info(f"Grouped {len(entries)} entries into {len(representatives)} canonical URLs")
+        self.status = {**self.status, "duplicates": self.status.get("duplicates", 0) + duplicates}
+        self._advance(duplicates)
+
+        # Rules decide the obvious entries; only the rest goes to the cache and the model
+        decisions = [rules.classify(entry) for entry in representatives]
+        to_classify = [entry for entry, decision in zip(representatives, decisions) if decision is None]
+        rule_hits = len(representatives) - len(to_classify)
+        logger.info(f"Rules classified {rule_hits} of {len(representatives)} entries")
+        self.status = {**self.status, "rule_hits": self.status.get("rule_hits", 0) + rule_hits}
+        self._advance(rule_hits)
+        answered = iter(self._classify_with_cache(to_classify, forced_since if force else None) if to_classify else [])
+
+        answers = []
+        for decision in decisions:
+            if decision:
+                answers.append((decision[0], f"rule:{decision[1]}"))
+            else:
+                answer = next(answered)
+                answers.append((answer['category'], answer['classified_by']))
 
-        # Rest of processing remains the same
         results = []
-        for idx, entry in enumerate(filtered):
-            classified_entry = self._generate_category(entry)
-            # Update progress
-            processed += 1
-
+        stopped = False
+        for entry, group in zip(entries, groups):
+            category, classified_by = answers[group]
+            classified_entry = {**entry, "category": category, "classified_by": classified_by}
             logger.info(f"Classified entry: {classified_entry['url']} -> {classified_entry['category']}")
             if classified_entry['category'] == "Classification Disabled":
-                logger.info(f"Classification disabled for {entry['url']}")
+                logger.info(f"Classification disabled for {classified_entry['url']}")
+                stopped = True
                 continue
+            if classified_entry['category'] not in self.current_categories:
+                # Not a real answer (e.g. failed), so the next run tries again
+                classified_entry['classification_key'] = ''
             results.append(classified_entry)
-            if (idx + 1) % 5 == 0:
-                time.sleep(0.1)  # Rate limit to avoid overwhelming the model
-
-            self.status = {
-                "browser": browser.lower(),
-                "total": num_entries,
-                "processed": processed,
-                "remaining": num_entries - processed
-            }
 
+        return results, stopped
 
-
-        return results
+    def _load_local_model(self) -> Optional[LocalModel]:
+        """
+        Local classifier for the current category list. On first use (or after the
+        category list changed) it is trained from the categories the LLM gave before.
+        """
+        if not get_setting('local_model_enabled', default_value=True):
+            return None
+        # Kept between checkpoint batches; it is updated in place as the model answers
+        if self.local_model is not None and self.local_model.category_hash == category_set_hash(self.current_categories):
+            return self.local_model
+        model = LocalModel.load(app_settings.LOCAL_MODEL_PATH, self.current_categories)
+        if model is None:
+            model = LocalModel(self.current_categories)
+            labelled = (HistoryEvent.objects.exclude(category='')
+                        .exclude(classified_by='local').exclude(classified_by__startswith='rule:')
+                        .values('url', 'title', 'category').iterator(chunk_size=2000))
+            trained = model.update(labelled)
+            logger.info(f"Trained local classifier on {trained} earlier model answers")
+            model.save(app_settings.LOCAL_MODEL_PATH)
+        self.local_model = model
+        return model
+
+    def _classify_with_cache(self, entries: List[Dict], forced_since: Optional[datetime] = None) -> List[Dict]:
+        """
+        Answer entries from the persistent domain cache. Only one entry per uncached
+        domain is classified; its category is reused for the domain's other entries.
+        Cached categories chosen from a different category list are evicted first.
+
+        Uncached domains the local classifier is confident about are decided locally,
+        the rest go to the model. Model answers are cached and fed back into the local
+        classifier, and its agreement with them is recorded in 'local_model_stats'.
+
+        A forced reclassification (`forced_since` set) asks the model again: only cache
+        entries refreshed since then are used, and the local classifier decides nothing.
+        """
+        category_hash = category_set_hash(self.current_categories)
+        cache.evict_stale(category_hash)
+
+        keys = [cache_key(entry['url']) for entry in entries]
+        cached = cache.lookup(keys, self.model_name, category_hash, refreshed_since=forced_since)
+        to_classify = {}
+        for key, entry in zip(keys, entries):
+            if key not in cached and key not in to_classify:
+                to_classify[key] = entry
+
+        local_model = self._load_local_model() if to_classify else None
+        predictions, local_answers = {}, {}
+        if local_model is not None and local_model.ready:
+            threshold = get_setting('local_model_threshold', default_value=0.2)
+            audit_every = max(1, round(1 / max(get_setting('local_model_audit_rate', default_value=0.05), 1e-6)))
+            predictions = dict(zip(to_classify, local_model.predict(list(to_classify.values()))))
+            # Forced runs still predict, so the agreement with the model keeps being measured
+            confident = [key for key, (_, confidence) in predictions.items()
+                         if confidence >= threshold and forced_since is None]
+            # A few confident entries still go to the model, to measure how often the local answer is right
+            local_answers = {key: predictions[key][0] for i, key in enumerate(confident) if i % audit_every}
+        to_model = {key: entry for key, entry in to_classify.items() if key not in local_answers}
+
+        hits = sum(1 for key in keys if key in cached)
+        logger.info(f"Classification cache: {hits} hits, {len(entries) - hits} misses, "
+                    f"{len(local_answers)} domains classified locally, {len(to_model)} sent to the model")
+        self.status = {
+            **self.status,
+            "cache_hits": self.status.get("cache_hits", 0) + hits,
+            "cache_misses": self.status.get("cache_misses", 0) + len(entries) - hits,
+            "local_hits": self.status.get("local_hits", 0) + len(local_answers),
+            "model_entries": self.status.get("model_entries", 0) + len(to_model),
+        }
+        # Everything but the model's entries is decided now; those count as their batches complete
+        self._advance(len(entries) - len(to_model))
+
+        classified = asyncio.run(self._classify_entries(list(to_model.values()))) if to_model else []
+        answers = {key: (entry['category'], "model") for key, entry in zip(to_model, classified)}
+        # Failed or stopped classifications aren't cached, so they're retried next run; neither are
+        # answers the model was unsure of (by logprobs), which shouldn't decide the whole domain
+        min_confidence = get_setting('classification_min_confidence', default_value=0.5)
+        labelled = {key: entry['category'] for key, entry in zip(to_model, classified)
+                    if entry['category'] in self.current_categories
+                    and (entry.get('confidence') is None or entry['confidence'] >= min_confidence)}
+        cache.store(labelled, self.model_name, category_hash)
+
+        if local_model is not None and labelled:
+            self._update_local_model(local_model, predictions, labelled, to_model, len(local_answers))
+
+        answers.update((key, (category, "local")) for key, category in local_answers.items())
+        answers.update((key, (category, "cache")) for key, category in cached.items())
+        return [{**entry, "category": answers[key][0], "classified_by": answers[key][1]} for key, entry in zip(keys, entries)]
+
+    def _update_local_model(self, local_model: LocalModel, predictions: Dict[str, Tuple[str, float]],
+                            labelled: Dict[str, str], entries: Dict[str, Dict], local_hits: int) -> None:
+        """Record how often the local classifier agreed with the model, then train it on the new answers"""
+        threshold = get_setting('local_model_threshold', default_value=0.2)
+        compared = [(predictions[key], category) for key, category in labelled.items() if key in predictions]
+        audited = [(prediction, category) for prediction, category in compared if prediction[1] >= threshold]
+        stats = {
+            'trained_docs': local_model.docs + len(labelled),
+            'compared': len(compared),
+            'agreement': round(sum(p[0] == c for p, c in compared) / len(compared), 3) if compared else None,
+            'audited': len(audited),
+            'confident_agreement': round(sum(p[0] == c for p, c in audited) / len(audited), 3) if audited else None,
+            'local_hits': local_hits,
+        }
+        set_setting('local_model_stats', stats)
+        self.status = {**self.status, "local_agreement": stats['agreement']}
+        logger.info(f"Local classifier agreement with the model: {stats['agreement']} on {len(compared)} entries, "
+                    f"{stats['confident_agreement']} on {len(audited)} confident ones")
+
+        local_model.update({**entries[key], "category": category} for key, category in labelled.items())
+        local_model.save(app_settings.LOCAL_MODEL_PATH)
+
+    async def _classify_entries(self, entries: List[Dict]) -> List[Dict]:
+        """
+        Classify entries in batches, spread over the endpoint pool; each endpoint's rate
+        controller decides how many requests it gets at once.
+        Progress in self.status is updated as batches complete; results keep the entries' order.
+        """
+        num_entries = len(entries)
+        # Several entries per request; 1 restores one request per entry
+        batch_size = max(1, int(await sync_to_async(get_setting)('classification_batch_size', default_value=20)))
+        timeout = await sync_to_async(get_setting)('classification_request_timeout', default_value=120)
+        self.retry_attempts = max(1, int(await sync_to_async(get_setting)('classification_retry_attempts', default_value=4)))
+        pool = await sync_to_async(self._get_pool)()
+        # Category numbers instead of names, with a token budget sized for them
+        self.short_answers = await sync_to_async(get_setting)('classification_short_answers', default_value=True)
+        self.logprobs = await sync_to_async(get_setting)('classification_logprobs', default_value=False)
+        self.model_thinking = self.detected_thinking or await sync_to_async(get_setting)('model_thinking', default_value=False)
+
+        async def run_batch(batch: List[Dict]) -> List[Dict]:
+            classified_batch = await self._classify_batch(batch)
+            # Update progress
+            self._advance(len(batch))
+            self.status = {**self.status, "concurrency": pool.concurrency, "retries": pool.retries}
+            return classified_batch
+
+        async with pool.session(timeout=timeout):
+            batches = [entries[start:start + batch_size] for start in range(0, num_entries, batch_size)]
+            classified_batches = await asyncio.gather(*(run_batch(batch) for batch in batches))
+
+        report = pool.report()
+        self.status = {**self.status, "endpoints": report}
+        await sync_to_async(set_setting)('llm_endpoint_stats', report)
+        for endpoint in report:
+            logger.info(f"Endpoint {endpoint['url']}: concurrency {endpoint['concurrency']}, "
+                        f"{endpoint['requests']} requests, {endpoint['errors']} errors, "
+                        f"{endpoint['entries_per_second']} entries/s")
+        return [entry for batch in classified_batches for entry in batch]
 
     def print_results(self, results: List[Dict], save_path: Optional[Path] = None):
         """Display classification results with save location"""
@@ -166,7 +772,6 @@ if __name__ == "__main__":
 
     classifier = HistoryClassifier(
         model_name='gemma-3-4b-it', # granite-3.1-8b-instruct
-        base_url='http://localhost:1234/v1'
     )
 
     print("Classifying Chrome History:")
@@ -0,0 +1,103 @@
+"""
+Adaptive rate control for requests to a model server.
+
+AdaptiveLimiter keeps a limit on the requests in flight with an AIMD rule
+(additive increase, multiplicative decrease), like TCP congestion control:
+- every request answered without extra queueing raises the limit by about one per round trip
+- a 429, 5xx, timeout or connection error halves it
+- so does a latency well above the best seen for requests of the same size, the
+  sign that the server is queueing requests instead of processing them in parallel
+At most one decrease happens per round trip, since requests already in flight
+were sent under the old limit. The endpoint pool (classifier/endpoints.py) keeps
+one limiter per server.
+
+Transient failures are retried with exponential backoff and jitter
+(backoff_delay), honouring the server's Retry-After header, so they don't end
+up as "Classification Failed".
+"""
+import random
+import time
+from typing import Optional
+
+import openai
+
+# Failures worth retrying: the server is overloaded or briefly unreachable
+TRANSIENT_ERRORS = (
+    openai.RateLimitError,
+    openai.InternalServerError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+)
+
+
+class AdaptiveLimiter:
+    def __init__(self, initial: int = 4, min_limit: int = 1, max_limit: int = 32,
+                 latency_tolerance: float = 2.0, decrease_factor: float = 0.5):
+        self.min_limit = max(1, min_limit)
+        self.max_limit = max(self.min_limit, max_limit)
+        self.limit = float(min(max(initial, self.min_limit), self.max_limit))
+        self.latency_tolerance = latency_tolerance
+        self.decrease_factor = decrease_factor
+        # Smoothed latency and the best smoothed value seen (the unloaded server), per request
+        # size class: a batch of 20 entries is slower than one entry without the server being busier
+        self.latency = {}
+        self.baseline = {}
+        # Smoothed duration of a request, the length of a round trip
+        self.round_trip = None
+        self._last_decrease = 0.0
+        self.stats = {'requests': 0, 'overloads': 0, 'slowdowns': 0, 'decreases': 0}
+
+    @property
+    def concurrency(self) -> int:
+        return max(self.min_limit, int(self.limit))
+
+    def on_success(self, seconds: float, size: int = 1) -> None:
+        """Account for a request of `size` entries answered in `seconds`"""
+        self.stats['requests'] += 1
+        self.round_trip = seconds if self.round_trip is None else 0.8 * self.round_trip + 0.2 * seconds
+        size_class = max(1, size).bit_length()
+        latency = self.latency.get(size_class)
+        latency = seconds if latency is None else 0.8 * latency + 0.2 * seconds
+        self.latency[size_class] = latency
+        # The baseline creeps up slowly, so a server that got permanently slower isn't throttled forever
+        baseline = self.baseline.get(size_class)
+        baseline = latency if baseline is None else min(latency, baseline * 1.001)
+        self.baseline[size_class] = baseline
+
+        if latency > baseline * self.latency_tolerance:
+            self.stats['slowdowns'] += 1
+            self._decrease()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_overload(self) -> None:
+        """Account for a request that failed with a 429, 5xx, timeout or connection error"""
+        self.stats['overloads'] += 1
+        self._decrease()
+
+    def _decrease(self) -> None:
+        now = time.monotonic()
+        if now - self._last_decrease < (self.round_trip or 0.0):
+            return
+        self._last_decrease = now
+        self.limit = max(self.min_limit, self.limit * self.decrease_factor)
+        self.stats['decreases'] += 1
+
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Seconds the server asked to wait before retrying, if it said"""
+    response = getattr(error, 'response', None)
+    value = response.headers.get('retry-after') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(error: Exception, attempt: int, base_delay: float = 1.0, max_delay: float = 30.0) -> float:
+    """Seconds to wait before retry number `attempt` (from 0) after a transient failure"""
+    delay = _retry_after(error)
+    if delay is None:
+        # Full jitter, so requests that failed together don't retry together
+        delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+    return min(delay, max_delay)
@@ -0,0 +1,204 @@
+"""
+Rule-based pre-classifier, run before the model.
+
+Entries whose category is obvious from the URL (search engines, mail, video
+sites, localhost, intranet hosts, ...) are answered by rules instead of the LLM.
+Rules map to a list of candidate categories in order of preference; the first
+one present in the configured category list is used, and a rule with no
+candidate in the list is ignored.
+
+Three rule tiers, tried in this order:
+- url_patterns: regular expressions matched against the whole URL
+- domains: host suffixes (e.g. 'youtube.com' also matches 'm.youtube.com')
+- title_keywords: words in the page title
+
+Rules from the 'classification_rules' setting (same structure as DEFAULT_RULES)
+are added to, and take precedence over, the defaults.
+"""
+import ipaddress
+import re
+from typing import Dict, Iterable, List, Optional, Tuple
+from urllib.parse import urlsplit
+
+from frontend.utils.settings import get_setting
+
+DEFAULT_RULES = {
+    'url_patterns': {
+        r'^https?://(www\.)?google\.[a-z.]+/search': ['Utilities', 'Productivity', 'Technology'],
+        r'^https?://(www\.)?bing\.com/search': ['Utilities', 'Productivity', 'Technology'],
+        r'^https?://(www\.)?duckduckgo\.com/\?': ['Utilities', 'Productivity', 'Technology'],
+        r'^https?://(www\.)?google\.[a-z.]+/maps': ['Travel', 'Utilities'],
+        r'^https?://(www\.)?youtube\.com/(watch|shorts)': ['Video', 'Streaming', 'Media'],
+        r'^(chrome|edge|brave|vivaldi|about|moz-extension|chrome-extension|file):': ['Utilities', 'Technology'],
+    },
+    'domains': {
+        'mail.google.com': ['Productivity', 'Utilities', 'Personal'],
+        'outlook.live.com': ['Productivity', 'Utilities', 'Personal'],
+        'outlook.office.com': ['Productivity', 'Utilities', 'Personal'],
+        'mail.yahoo.com': ['Productivity', 'Utilities', 'Personal'],
+        'proton.me': ['Productivity', 'Utilities', 'Personal'],
+        'calendar.google.com': ['Productivity', 'Utilities'],
+        'docs.google.com': ['Productivity', 'Utilities'],
+        'drive.google.com': ['Productivity', 'Utilities'],
+        'notion.so': ['Productivity', 'Utilities'],
+        'youtube.com': ['Video', 'Streaming', 'Media'],
+        'youtu.be': ['Video', 'Streaming', 'Media'],
+        'vimeo.com': ['Video', 'Streaming', 'Media'],
+        'twitch.tv': ['Streaming', 'Video', 'Media'],
+        'netflix.com': ['Streaming', 'Video', 'Media'],
+        'primevideo.com': ['Streaming', 'Video', 'Media'],
+        'disneyplus.com': ['Streaming', 'Video', 'Media'],
+        'spotify.com': ['Music', 'Audio', 'Streaming'],
+        'soundcloud.com': ['Music', 'Audio', 'Streaming'],
+        'facebook.com': ['Social Media'],
+        'instagram.com': ['Social Media'],
+        'twitter.com': ['Social Media'],
+        'x.com': ['Social Media'],
+        'tiktok.com': ['Social Media', 'Video'],
+        'bsky.app': ['Social Media'],
+        'mastodon.social': ['Social Media'],
+        'reddit.com': ['Forums', 'Social Media'],
+        'linkedin.com': ['Career', 'Jobs', 'Social Media'],
+        'stackoverflow.com': ['Q&A', 'Technology'],
+        'stackexchange.com': ['Q&A', 'Forums'],
+        'quora.com': ['Q&A', 'Forums'],
+        'github.com': ['Technology', 'Productivity'],
+        'gitlab.com': ['Technology', 'Productivity'],
+        'pypi.org': ['Technology'],
+        'npmjs.com': ['Technology'],
+        'wikipedia.org': ['Education', 'Learning', 'Research'],
+        'coursera.org': ['Education', 'Learning'],
+        'udemy.com': ['Education', 'Learning'],
+        'khanacademy.org': ['Education', 'Learning'],
+        'arxiv.org': ['Research', 'Science', 'Education'],
+        'scholar.google.com': ['Research', 'Science', 'Education'],
+        'amazon.com': ['Shopping', 'E‑commerce'],
+        'amazon.co.uk': ['Shopping', 'E‑commerce'],
+        'amazon.de': ['Shopping', 'E‑commerce'],
+        'amazon.it': ['Shopping', 'E‑commerce'],
+        'ebay.com': ['Shopping', 'E‑commerce'],
+        'aliexpress.com': ['Shopping', 'E‑commerce'],
+        'etsy.com': ['Shopping', 'E‑commerce'],
+        'paypal.com': ['Finance', 'Banking'],
+        'bbc.co.uk': ['News'],
+        'bbc.com': ['News'],
+        'cnn.com': ['News'],
+        'nytimes.com': ['News'],
+        'theguardian.com': ['News'],
+        'reuters.com': ['News'],
+        'apnews.com': ['News'],
+        'booking.com': ['Travel'],
+        'airbnb.com': ['Travel', 'Real Estate'],
+        'localhost': ['Technology', 'Productivity'],
+        'local': ['Technology', 'Productivity'],
+        'lan': ['Technology', 'Productivity'],
+        'internal': ['Technology', 'Productivity'],
+        'intranet': ['Productivity', 'Technology'],
+    },
+    'title_keywords': {
+        'inbox': ['Productivity', 'Utilities', 'Personal'],
+        'recipe': ['Food', 'Cooking'],
+        'recipes': ['Food', 'Cooking'],
+        'podcast': ['Audio', 'Music', 'Media'],
+    },
+}
+
+# Hosts that are IP addresses in private ranges count as intranet
+PRIVATE_HOST_CATEGORIES = ['Technology', 'Productivity']
+
+
+class DomainTrie:
+    """Host suffix lookup: labels are stored right to left, the longest matching suffix wins"""
+
+    def __init__(self):
+        self.root: Dict = {}
+
+    def insert(self, domain: str, value: str) -> None:
+        node = self.root
+        for label in reversed(domain.lower().strip('.').split('.')):
+            node = node.setdefault(label, {})
+        node[None] = value
+
+    def match(self, host: str) -> Optional[str]:
+        node = self.root
+        found = None
+        for label in reversed(host.split('.')):
+            node = node.get(label)
+            if node is None:
+                break
+            found = node.get(None, found)
+        return found
+
+
+class RuleEngine:
+    def __init__(self, rules: Dict, categories: Iterable[str]):
+        self.categories = list(categories)
+        self.private_category = self._resolve(PRIVATE_HOST_CATEGORIES)
+
+        # All URL patterns compiled once into a single alternation; the named group tells which matched
+        patterns = [(pattern, category) for pattern, candidates in rules.get('url_patterns', {}).items()
+                    if (category := self._resolve(candidates))]
+        self.url_categories = [category for _, category in patterns]
+        self.url_regex = re.compile('|'.join(f"(?P<r{i}>{pattern})" for i, (pattern, _) in enumerate(patterns)),
+                                    re.IGNORECASE) if patterns else None
+
+        self.domains = DomainTrie()
+        for domain, candidates in rules.get('domains', {}).items():
+            category = self._resolve(candidates)
+            if category:
+                self.domains.insert(domain, category)
+
+        self.title_keywords = {}
+        for keyword, candidates in rules.get('title_keywords', {}).items():
+            category = self._resolve(candidates)
+            if category:
+                self.title_keywords[keyword.lower()] = category
+
+    @classmethod
+    def from_settings(cls, categories: Iterable[str]) -> "RuleEngine":
+        """Default rules extended with (and overridden by) the 'classification_rules' setting"""
+        custom = get_setting('classification_rules', default_value={}) or {}
+        rules = {tier: {**DEFAULT_RULES[tier], **(custom.get(tier) or {})} for tier in DEFAULT_RULES}
+        return cls(rules, categories)
+
+    def _resolve(self, candidates) -> Optional[str]:
+        """First candidate category that is in the configured category list"""
+        if isinstance(candidates, str):
+            candidates = [candidates]
+        return next((category for category in candidates if category in self.categories), None)
+
+    def classify(self, entry: Dict) -> Optional[Tuple[str, str]]:
+        """Returns (category, rule tier) for an entry a rule decides, or None"""
+        url = entry.get('url') or ''
+
+        if self.url_regex is not None:
+            match = self.url_regex.search(url)
+            if match:
+                return self.url_categories[int(match.lastgroup[1:])], 'url_pattern'
+
+        try:
+            host = (urlsplit(url).hostname or '').lower()
+        except ValueError:
+            host = ''
+        if host:
+            category = self.domains.match(host)
+            if category:
+                return category, 'domain'
+            if self.private_category and _is_private_ip(host):
+                return self.private_category, 'domain'
+
+        if self.title_keywords:
+            for word in re.findall(r'\w+', (entry.get('title') or '').lower()):
+                category = self.title_keywords.get(word)
+                if category:
+                    return category, 'title_keyword'
+
+        return None
+
+
+def _is_private_ip(host: str) -> bool:
+    try:
+        address = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    return address.is_private or address.is_loopback
@@ -0,0 +1,127 @@
+"""
+Stratified sampling of history, for the category mix of a period without
+classifying every entry.
+
+Entries are put in strata by domain and visit count. Each of the largest
+domains is a stratum of its own: its entries share a category (categories are
+cached per domain), so a few of them are enough. The other domains are pooled
+and split by visit count bucket (1, 2-4, 5-19, 20+ visits), and get the rest
+of the sample in proportion to their size.
+
+draw_sample() picks the entries to classify. estimate_distribution()
+extrapolates the categories of the classified entries of each stratum to all
+of its entries, with a 95% confidence interval from the stratified variance.
+With every entry classified the estimate is the exact count.
+"""
+import bisect
+import math
+import random
+from collections import Counter, defaultdict
+from typing import Dict, Iterable, List, Tuple
+
+from classifier.cache import cache_key
+
+# Lower bounds of the visit count buckets
+VISIT_BUCKETS = (1, 2, 5, 20)
+# Domains with their own stratum: the largest ones, holding at least this share of the entries
+MAX_DOMAIN_STRATA = 50
+MIN_DOMAIN_SHARE = 0.005
+# Entries sampled from a single-domain stratum; more only repeat the domain's cached category
+DOMAIN_STRATUM_SAMPLES = 3
+# Pooled stratum of the smaller domains
+OTHER_DOMAINS = '*'
+Z_95 = 1.96
+
+
+def visit_bucket(visit_count: int) -> int:
+    """Index of the visit count bucket"""
+    return max(0, bisect.bisect_right(VISIT_BUCKETS, visit_count or 0) - 1)
+
+
+def stratify(rows: List[Tuple[str, int]]) -> Dict[Tuple[str, int], List[int]]:
+    """Indexes of (url, visit_count) rows per stratum: (domain, 0) for large domains, ('*', bucket) for the rest"""
+    domains = [cache_key(url) for url, _ in rows]
+    counts = Counter(domains)
+    min_count = max(2, MIN_DOMAIN_SHARE * len(rows))
+    large = {domain for domain, count in counts.most_common(MAX_DOMAIN_STRATA) if count >= min_count}
+
+    strata = defaultdict(list)
+    for i, (domain, (_, visit_count)) in enumerate(zip(domains, rows)):
+        key = (domain, 0) if domain in large else (OTHER_DOMAINS, visit_bucket(visit_count))
+        strata[key].append(i)
+    return strata
+
+
+def draw_sample(entries: List[Dict], size: int, seed: int = 0) -> List[Dict]:
+    """
+    Stratified sample of about `size` entries, in their original order. The same
+    entries and seed always give the same sample, so a sampling job can be resumed.
+    """
+    if size >= len(entries):
+        return entries
+    strata = stratify([(entry['url'], entry.get('visit_count') or 0) for entry in entries])
+    rng = random.Random(seed)
+
+    allocation = {}
+    for key, members in strata.items():
+        if key[0] != OTHER_DOMAINS:
+            allocation[key] = min(len(members), DOMAIN_STRATUM_SAMPLES)
+    pooled = {key: members for key, members in strata.items() if key[0] == OTHER_DOMAINS}
+    pooled_total = sum(len(members) for members in pooled.values())
+    remaining = max(len(pooled), size - sum(allocation.values()))
+    for key, members in pooled.items():
+        allocation[key] = min(len(members), max(1, round(remaining * len(members) / pooled_total)))
+
+    chosen = []
+    for key in sorted(strata):
+        chosen.extend(rng.sample(strata[key], allocation[key]))
+    return [entries[i] for i in sorted(chosen)]
+
+
+def estimate_distribution(rows: Iterable[Tuple[str, int, str]]) -> Dict:
+    """
+    Estimated entries per category from (url, visit_count, category) rows, an
+    empty category meaning not classified. Returns the number of entries, how many
+    are classified, the share of entries in strata with classified entries (the
+    others are assumed to have the same mix), and per category the estimated count
+    with the bounds of its 95% confidence interval, largest first.
+    """
+    rows = list(rows)
+    total = len(rows)
+    result = {'total': total, 'classified': 0, 'coverage': 0.0, 'categories': {}}
+    if not total:
+        return result
+
+    strata = stratify([(url, visit_count) for url, visit_count, _ in rows])
+    observed = {}
+    for key, members in strata.items():
+        labels = Counter(rows[i][2] for i in members if rows[i][2])
+        if labels:
+            observed[key] = (len(members), labels)
+    covered = sum(size for size, _ in observed.values())
+    result['classified'] = sum(sum(labels.values()) for _, labels in observed.values())
+    if not covered:
+        return result
+    result['coverage'] = round(100 * covered / total, 1)
+
+    categories = {category for _, labels in observed.values() for category in labels}
+    estimates = {}
+    for category in categories:
+        share, variance = 0.0, 0.0
+        for size, labels in observed.values():
+            sampled = sum(labels.values())
+            weight = size / covered
+            share += weight * labels[category] / sampled
+            # Smoothed proportion, so a stratum where all or none of the sample had the category
+            # still counts as uncertain; the finite population correction is 0 when all are classified
+            smoothed = (labels[category] + 0.5) / (sampled + 1)
+            variance += weight ** 2 * (1 - sampled / size) * smoothed * (1 - smoothed) / sampled
+        margin = Z_95 * math.sqrt(variance)
+        estimates[category] = {
+            'count': round(share * total),
+            'share': round(100 * share, 2),
+            'low': round(max(0.0, share - margin) * total),
+            'high': round(min(1.0, share + margin) * total),
+        }
+    result['categories'] = dict(sorted(estimates.items(), key=lambda item: item[1]['count'], reverse=True))
+    return result
@@ -0,0 +1,304 @@
+import asyncio
+from types import SimpleNamespace
+
+import httpx
+from django.test import SimpleTestCase, TestCase
+from openai import NotFoundError
+
+from classifier.canonical import canonical_url, group_entries
+from classifier.endpoints import EndpointPool
+from classifier.main import HistoryClassifier
+from classifier.sampling import draw_sample, estimate_distribution, visit_bucket
+
+
+def _choice(content, finish_reason="stop", logprobs=None):
+    """Stand-in for a chat completion choice; `logprobs` is a logprob per character"""
+    tokens = None
+    if logprobs is not None:
+        tokens = SimpleNamespace(content=[SimpleNamespace(token=ch, logprob=lp) for ch, lp in zip(content, logprobs)])
+    return SimpleNamespace(message=SimpleNamespace(content=content), finish_reason=finish_reason, logprobs=tokens)
+
+
+class ShortResponseParsingTests(TestCase):
+    def setUp(self):
+        self.classifier = HistoryClassifier()
+        self.classifier.current_categories = ['News', 'Technology', 'Other']
+
+    def parse(self, content, count, **kwargs):
+        return self.classifier._parse_short_response(_choice(content, **kwargs), count)
+
+    def test_maps_lines_to_categories(self):
+        self.assertEqual(self.parse("1:2\n2:1\n3:3", 3), [('Technology', None), ('News', None), ('Other', None)])
+
+    def test_lines_in_any_order_and_separator(self):
+        self.assertEqual(self.parse("2 = 3\n 1) 1", 2), [('News', None), ('Other', None)])
+
+    def test_first_answer_for_an_entry_wins(self):
+        self.assertEqual(self.parse("1:2\n1:3", 1), [('Technology', None)])
+
+    def test_missing_entry(self):
+        self.assertIsNone(self.parse("1:2\n3:1", 3))
+
+    def test_answer_after_reasoning(self):
+        self.assertEqual(self.parse("<think>Entry 1 is 3</think>\n1:1\n2:2", 2), [('News', None), ('Technology', None)])
+
+    def test_unclosed_reasoning(self):
+        self.assertIsNone(self.parse("<think>\n1: looks like 2\n2:1", 2))
+
+    def test_cut_off_by_token_budget(self):
+        self.assertIsNone(self.parse("1:2\n2:1", 2, finish_reason="length"))
+
+    def test_unknown_category_number(self):
+        self.assertEqual(self.parse("1:4\n2:0", 2), [('Classification Failed', None), ('Classification Failed', None)])
+
+    def test_confidence_of_category_digits(self):
+        answers = self.parse("1:2\n2:1", 2, logprobs=[0, 0, -0.5, 0, 0, 0, -0.1])
+        self.assertAlmostEqual(answers[0][1], 0.6065, places=3)
+        self.assertAlmostEqual(answers[1][1], 0.9048, places=3)
+
+
+class _ScriptedPool:
+    """Endpoint pool whose model replies with the given choices in turn, recording each request"""
+    def __init__(self, *choices):
+        self.choices = list(choices)
+        self.requests = []
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    async def create(self, **options):
+        self.requests.append(options)
+        return SimpleNamespace(choices=[self.choices.pop(0)], usage=None)
+
+    async def request(self, call, size=1, attempts=4, model=None):
+        return await call(self)
+
+
+class ShortAnswerRequestTests(TestCase):
+    ENTRY = {'url': "https://example.com/", 'title': "Example"}
+
+    def setUp(self):
+        self.classifier = HistoryClassifier()
+        self.classifier.current_categories = ['News', 'Technology', 'Other']
+        self.classifier.max_tokens = 1000
+
+    def classify(self, *choices):
+        self.classifier.pool = _ScriptedPool(*choices)
+        return asyncio.run(self.classifier._generate_short_category(self.ENTRY))['category']
+
+    def test_tight_budget_and_stop(self):
+        self.assertEqual(self.classify(_choice("2")), 'Technology')
+        request = self.classifier.pool.requests[0]
+        self.assertEqual((request['max_tokens'], request['stop']), (10, ["\n"]))
+
+    def test_thinking_model_setting(self):
+        self.classifier.model_thinking = True
+        self.assertEqual(self.classify(_choice("<think>\n\n</think>\n\n2")), 'Technology')
+        request = self.classifier.pool.requests[0]
+        self.assertEqual(request['max_tokens'], 1010)
+        self.assertNotIn('stop', request)
+        self.assertTrue(request['messages'][0]['content'].endswith("/no_think"))
+
+    def test_reasoning_cut_off_is_asked_again(self):
+        category = self.classify(_choice("<think>\nEntry 1 looks like", finish_reason="length"),
+                                 _choice("<think>\nA news site.\n</think>\n\n1"))
+        self.assertEqual(category, 'News')
+        retry = self.classifier.pool.requests[1]
+        self.assertEqual(retry['max_tokens'], 1010)
+        self.assertTrue(retry['messages'][0]['content'].endswith("/no_think"))
+        # Later requests leave room for reasoning straight away
+        self.assertEqual(self.classify(_choice("<think></think>3")), 'Other')
+        self.assertEqual(len(self.classifier.pool.requests), 1)
+
+    def test_reasoning_returned_separately(self):
+        cut_off = _choice("", finish_reason="length")
+        cut_off.message.reasoning_content = "The entry is"
+        self.assertEqual(self.classify(cut_off, _choice("2")), 'Technology')
+        self.assertTrue(self.classifier.model_thinking)
+
+    def test_reply_opening_with_a_newline(self):
+        self.assertEqual(self.classify(_choice(""), _choice("\n2")), 'Technology')
+        self.assertNotIn('stop', self.classifier.pool.requests[1])
+        self.assertFalse(self.classifier.stop_sequences)
+
+    def test_unusable_reply_fails(self):
+        self.assertEqual(self.classify(_choice("2", finish_reason="length")), 'Classification Failed')
+        self.assertEqual(len(self.classifier.pool.requests), 1)
+
+
+class CanonicalUrlTests(SimpleTestCase):
+    def test_scheme_host_and_default_port(self):
+        self.assertEqual(canonical_url("http://WWW.Example.com:80/a/"), "https://example.com/a")
+        self.assertEqual(canonical_url("https://example.com:443"), "https://example.com/")
+
+    def test_other_port_kept(self):
+        self.assertEqual(canonical_url("http://example.com:8080/a"), "https://example.com:8080/a")
+        # 443 is only the default for https
+        self.assertEqual(canonical_url("http://example.com:443/a"), "https://example.com:443/a")
+
+    def test_ipv6_host(self):
+        self.assertEqual(canonical_url("http://[::1]:8000/x"), "https://[::1]:8000/x")
+        self.assertEqual(canonical_url("https://[2001:DB8::1]:443/"), "https://[2001:db8::1]/")
+
+    def test_tracking_and_session_params_dropped(self):
+        url = "https://example.com/p?utm_source=x&b=2&fbclid=y&a=1&UTM_Medium=z&sid=3#top"
+        self.assertEqual(canonical_url(url), "https://example.com/p?a=1&b=2")
+
+    def test_extra_params(self):
+        self.assertEqual(canonical_url("https://example.com/p?Lang=en&q=1", extra_params=["lang"]),
+                         "https://example.com/p?q=1")
+
+    def test_pagination(self):
+        self.assertEqual(canonical_url("https://example.com/list?page=3&start=20&q=a"), "https://example.com/list?q=a")
+        self.assertEqual(canonical_url("https://example.com/blog/page/2/"), "https://example.com/blog")
+        # Not a page number: a different page of the site
+        self.assertEqual(canonical_url("https://example.com/index.php?page=contact"),
+                         "https://example.com/index.php?page=contact")
+
+    def test_path_session_ids(self):
+        self.assertEqual(canonical_url("https://example.com/shop;jsessionid=AB12/item//1"),
+                         "https://example.com/shop/item/1")
+
+    def test_other_urls_unchanged(self):
+        for url in ("about:blank", "file:///C:/x.html", "chrome://settings/", "http://example.com:abc/", "http:///x"):
+            self.assertEqual(canonical_url(url), url)
+
+
+class GroupEntriesTests(SimpleTestCase):
+    def test_groups_by_canonical_url_and_title(self):
+        entries = [
+            {'url': "https://example.com/a?utm_source=x", 'title': "A  page"},
+            {'url': "http://www.example.com/a/", 'title': "a page"},
+            {'url': "https://example.com/a", 'title': "Another title"},
+            {'url': "https://example.com/b", 'title': "A page"},
+        ]
+        representatives, groups = group_entries(entries)
+        self.assertEqual(groups, [0, 0, 1, 2])
+        self.assertEqual([r['url'] for r in representatives],
+                         ["https://example.com/a", "https://example.com/a", "https://example.com/b"])
+        # The first entry of a group represents it, with its other fields
+        self.assertEqual(representatives[0]['title'], "A  page")
+        self.assertEqual(entries[0]['url'], "https://example.com/a?utm_source=x")
+
+    def test_missing_title(self):
+        representatives, groups = group_entries([{'url': "https://a.com/x", 'title': None}, {'url': "https://a.com/x/"}])
+        self.assertEqual((len(representatives), groups), (1, [0, 0]))
+
+
+def _history(domain_entries=40, rare_entries=30):
+    """One large domain, plus single-entry domains visited once and ten times"""
+    entries = [{'url': f"https://big.com/{i}", 'visit_count': 1} for i in range(domain_entries)]
+    for i in range(rare_entries):
+        entries.append({'url': f"https://once{i}.com/", 'visit_count': 1})
+        entries.append({'url': f"https://often{i}.com/", 'visit_count': 10})
+    return entries
+
+
+class DrawSampleTests(SimpleTestCase):
+    def test_stratum_allocation(self):
+        sample = draw_sample(_history(), 20)
+        urls = [entry['url'] for entry in sample]
+        # A large domain gets a few entries, the pooled strata share the rest by size
+        self.assertEqual(sum(url.startswith("https://big.com/") for url in urls), 3)
+        self.assertEqual(sum(url.startswith("https://once") for url in urls), 8)
+        self.assertEqual(sum(url.startswith("https://often") for url in urls), 8)
+
+    def test_every_pooled_stratum_sampled(self):
+        entries = _history(rare_entries=30) + [{'url': "https://rare.com/", 'visit_count': 50}]
+        sample = draw_sample(entries, 5)
+        self.assertIn(entries[-1], sample)
+        self.assertEqual(sum(entry['url'].startswith("https://big.com/") for entry in sample), 3)
+
+    def test_deterministic_in_original_order(self):
+        entries = _history()
+        sample = draw_sample(entries, 20)
+        self.assertEqual(sample, draw_sample(entries, 20))
+        positions = [entries.index(entry) for entry in sample]
+        self.assertEqual(positions, sorted(positions))
+        self.assertNotEqual(sample, draw_sample(entries, 20, seed=1))
+
+    def test_size_of_history_or_more(self):
+        entries = _history(domain_entries=5, rare_entries=2)
+        self.assertEqual(draw_sample(entries, len(entries)), entries)
+        self.assertEqual(draw_sample(entries, 100), entries)
+        self.assertEqual(draw_sample([], 10), [])
+
+
+class EstimateDistributionTests(SimpleTestCase):
+    def test_empty(self):
+        self.assertEqual(estimate_distribution([]), {'total': 0, 'classified': 0, 'coverage': 0.0, 'categories': {}})
+
+    def test_nothing_classified(self):
+        estimate = estimate_distribution((entry['url'], entry['visit_count'], '') for entry in _history())
+        self.assertEqual((estimate['total'], estimate['classified'], estimate['coverage']), (100, 0, 0.0))
+        self.assertEqual(estimate['categories'], {})
+
+    def test_all_classified_is_exact(self):
+        rows = [(entry['url'], entry['visit_count'], 'Shopping' if 'big.com' in entry['url'] else 'News')
+                for entry in _history()]
+        estimate = estimate_distribution(rows)
+        self.assertEqual((estimate['classified'], estimate['coverage']), (100, 100.0))
+        self.assertEqual(list(estimate['categories']), ['News', 'Shopping'])
+        for category, count in (('News', 60), ('Shopping', 40)):
+            item = estimate['categories'][category]
+            self.assertEqual((item['count'], item['low'], item['high']), (count, count, count))
+
+    def test_extrapolates_sample(self):
+        entries = _history()
+        sampled = {entry['url'] for entry in draw_sample(entries, 20)}
+        rows = [(entry['url'], entry['visit_count'],
+                 ('Shopping' if 'big.com' in entry['url'] else 'News') if entry['url'] in sampled else '')
+                for entry in entries]
+        estimate = estimate_distribution(rows)
+        self.assertEqual((estimate['classified'], estimate['coverage']), (19, 100.0))
+        news = estimate['categories']['News']
+        self.assertEqual(news['count'], 60)
+        self.assertLessEqual(news['low'], 60)
+        self.assertGreaterEqual(news['high'], 60)
+        self.assertLess(news['low'], news['high'])
+
+    def test_coverage_of_strata_with_classified_entries(self):
+        # Only the large domain's stratum has classified entries: 40 of the 100 entries
+        rows = [(entry['url'], entry['visit_count'], 'Shopping' if entry['url'] == "https://big.com/0" else '')
+                for entry in _history()]
+        estimate = estimate_distribution(rows)
+        self.assertEqual((estimate['classified'], estimate['coverage']), (1, 40.0))
+        self.assertEqual(estimate['categories']['Shopping']['count'], 100)
+
+    def test_visit_buckets(self):
+        self.assertEqual([visit_bucket(count) for count in (None, 0, 1, 2, 4, 5, 19, 20, 1000)],
+                         [0, 0, 0, 1, 1, 2, 2, 3, 3])
+
+
+class EndpointPoolRequestTests(SimpleTestCase):
+    def request(self, pool, call, model="model-a"):
+        async def run():
+            async with pool.session():
+                return await pool.request(call, model=model)
+        return asyncio.run(run())
+
+    def test_no_endpoints(self):
+        async def call(client):
+            return "answer"
+        with self.assertRaisesMessage(RuntimeError, "No model endpoint serves 'model-a'"):
+            self.request(EndpointPool([]), call)
+
+    def test_model_missing_everywhere(self):
+        pool = EndpointPool([{'url': "http://a.invalid/v1"}, {'url': "http://b.invalid/v1"}])
+        tried = []
+
+        async def call(client):
+            tried.append(str(client.base_url))
+            request = httpx.Request("POST", f"{client.base_url}chat/completions")
+            raise NotFoundError("model not found", response=httpx.Response(404, request=request), body=None)
+        with self.assertRaises(NotFoundError):
+            self.request(pool, call)
+        # Each endpoint is asked once, then known not to serve the model
+        self.assertEqual(sorted(tried), ["http://a.invalid/v1/", "http://b.invalid/v1/"])
+        self.assertEqual([endpoint.missing_models for endpoint in pool.endpoints], [{"model-a"}, {"model-a"}])
+
+    def test_sent_to_endpoint_with_model(self):
+        pool = EndpointPool([{'url': "http://a.invalid/v1"}, {'url': "http://b.invalid/v1"}])
+        pool.endpoints[0].models = {"model-b"}
+
+        async def call(client):
+            return str(client.base_url)
+        self.assertEqual(self.request(pool, call), "http://b.invalid/v1/")
@@ -1,7 +1,8 @@
 # frontend/analytics.py
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 from django.db.models import Count, F, Sum, Min, Max
+from django.db.models.functions import Substr
 # If using DateTimeField and PostgreSQL/MySQL, you might use ExtractWeekDay
 # from django.db.models.functions import ExtractWeekDay
 from datetime import datetime, timedelta
@@ -10,6 +11,7 @@ import pandas as pd # Still optional, but useful for complex date handling
 from collections import Counter # Useful for counting days
 
 from backupManager.helpers import get_oldest_entry_in_backups
+from classifier.sampling import estimate_distribution
 from frontend.models import HistoryEvent
 
 
@@ -20,9 +22,57 @@ def get_domain(url):
     except:
         return "Invalid URL"
 
-def calculate_dashboard_analytics(queryset):
+def get_visit_time_activity(visits_queryset):
+    """
+    Aggregates a VisitEvent queryset into per-hour and per-weekday visit counts.
+    Grouping is done in the database on the text timestamp, so only one row per
+    distinct hour/day is loaded regardless of the number of visits.
+    Returns (hourly_counts, day_of_week_counts) Counters (weekday 0=Mon).
+    """
+    hourly_counts = Counter()
+    for item in visits_queryset.annotate(hour=Substr('visit_time', 12, 2)).values('hour').annotate(count=Count('id')):
+        try:
+            hourly_counts[int(item['hour'])] += item['count']
+        except (ValueError, TypeError):
+            continue
+
+    day_of_week_counts = Counter()
+    for item in visits_queryset.annotate(day=Substr('visit_time', 1, 10)).values('day').annotate(count=Count('id')):
+        try:
+            day_of_week_counts[datetime.strptime(item['day'], '%Y-%m-%d').weekday()] += item['count']
+        except (ValueError, TypeError):
+            continue
+
+    return hourly_counts, day_of_week_counts
+
+# Category estimates by sampling job, job progress and dashboard query, so a dashboard
+# render doesn't load every row of the period again (see _estimate_categories)
+_category_estimates: Dict[Tuple, Dict] = {}
+MAX_CACHED_ESTIMATES = 16
+
+
+def _estimate_categories(queryset, job, total: int, classified: int) -> Dict:
+    """
+    Category mix of a period extrapolated from the entries a Quick Estimate job classified,
+    worked out again only when the job, the period's rows or the classified count change.
+    """
+    key = (job.pk, job.processed, total, classified, str(queryset.query))
+    if key not in _category_estimates:
+        if len(_category_estimates) >= MAX_CACHED_ESTIMATES:
+            _category_estimates.pop(next(iter(_category_estimates)))
+        _category_estimates[key] = estimate_distribution(
+            queryset.values_list('url', 'visit_count', 'category').iterator(chunk_size=5000))
+    return _category_estimates[key]
+
+
+def calculate_dashboard_analytics(queryset, visits_queryset=None, sample_job=None):
     """
     Calculates various analytics metrics from a HistoryEvent queryset.
+    If a VisitEvent queryset with visits is given, hour and weekday activity are
+    computed from individual visits instead of each URL's last visit.
+    `sample_job` is the Quick Estimate job behind a partly classified period: its
+    classified entries are a sample, so the category mix is extrapolated from them.
+    Entries classified by other jobs (most visited first) are no sample and are shown as is.
     """
     analytics_data = {
         # --- Existing KPIs ---
@@ -43,7 +93,8 @@ def calculate_dashboard_analytics(queryset):
         'activity_by_day_of_week': [], # List of {'day': 'Mon', 'count': N}
         'most_probable_category': None, # String name of category
         'most_probable_category_perc': 0.0, # Percentage
-        'category_probabilities': [],   # List of {'category': 'Tech', 'perc': P, 'count': N}
+        'category_probabilities': [],   # List of {'category': 'Tech', 'perc': P, 'count': N} (+ 'low'/'high' % when estimated)
+        'category_estimate': None,      # {'classified', 'total', 'coverage'} when categories are estimated
         'dominant_browser': None, # Most common browser
         'dominant_browser_perc' : 0.0, # Percentage of total visits
         # --- Data Coverage ---
@@ -75,8 +126,16 @@ def calculate_dashboard_analytics(queryset):
         analytics_data['last_visit_date'] = None
 
     # --- Distributions ---
-    category_counts = queryset.values('category').annotate(count=Count('id')).order_by('-count')
+    # Rows ingested straight from the browser stay unclassified (empty category) until classified
+    category_counts = queryset.exclude(category='').values('category').annotate(count=Count('id')).order_by('-count')
     analytics_data['category_distribution'] = {item['category']: item['count'] for item in category_counts}
+    classified_count = sum(analytics_data['category_distribution'].values())
+    category_intervals = {}
+    if sample_job is not None and 0 < classified_count < total_visits:
+        estimate = _estimate_categories(queryset, sample_job, total_visits, classified_count)
+        analytics_data['category_distribution'] = {category: item['count'] for category, item in estimate['categories'].items()}
+        category_intervals = estimate['categories']
+        analytics_data['category_estimate'] = {key: estimate[key] for key in ('classified', 'total', 'coverage')}
 
     browser_counts = queryset.values('browser').annotate(count=Count('id')).order_by('-count')
     analytics_data['browser_distribution'] = {item['browser']: item['count'] for item in browser_counts}
@@ -119,6 +178,12 @@ def calculate_dashboard_analytics(queryset):
     sorted_days = sorted(daily_counts.items())
     analytics_data['visit_trend'] = [{'date': day, 'count': count} for day, count in sorted_days]
 
+    # Per-visit data is more accurate than one last visit per URL
+    visit_hourly_counts = None
+    if visits_queryset is not None and visits_queryset.exists():
+        visit_hourly_counts, day_of_week_counts = get_visit_time_activity(visits_queryset)
+        valid_dates_processed = sum(day_of_week_counts.values())
+
     # Format Day of Week & Find Most Active
     if valid_dates_processed > 0:
         # Prepare data for chart (ensure all days are present, even if count is 0)
@@ -138,13 +203,17 @@ def calculate_dashboard_analytics(queryset):
     # --- Activity by Hour ---
     hourly_counts = Counter()
     valid_times_processed = 0
-    for time_str in date_data: # Reuse fetched date strings
-         try:
-             dt = datetime.strptime(time_str[:19], '%Y-%m-%d %H:%M:%S')
-             hourly_counts[dt.hour] += 1
-             valid_times_processed += 1
-         except (ValueError, TypeError):
-             continue
+    if visit_hourly_counts is not None:
+        hourly_counts = visit_hourly_counts
+        valid_times_processed = sum(hourly_counts.values())
+    else:
+        for time_str in date_data: # Reuse fetched date strings
+             try:
+                 dt = datetime.strptime(time_str[:19], '%Y-%m-%d %H:%M:%S')
+                 hourly_counts[dt.hour] += 1
+                 valid_times_processed += 1
+             except (ValueError, TypeError):
+                 continue
     if valid_times_processed > 0:
         analytics_data['activity_by_hour'] = [{'hour': h, 'count': hourly_counts.get(h, 0)} for h in range(24)]
     else:
@@ -152,7 +221,8 @@ def calculate_dashboard_analytics(queryset):
 
 
     # --- Category Probabilities & Most Probable ---
-    if total_visits > 0 and analytics_data['category_distribution']:
+    classified_total = sum(analytics_data['category_distribution'].values())
+    if classified_total > 0:
         category_probs = []
         max_prob = 0.0
         most_prob_cat = None
@@ -162,8 +232,11 @@ def calculate_dashboard_analytics(queryset):
         sorted_categories = sorted(analytics_data['category_distribution'].items(), key=lambda item: item[1], reverse=True)
 
         for category, count in sorted_categories:
-            probability = (count / total_visits) * 100
+            probability = (count / classified_total) * 100
             category_probs.append({'category': category, 'perc': round(probability, 2), 'count': count})
+            if category in category_intervals:
+                category_probs[-1]['low'] = round(category_intervals[category]['low'] / classified_total * 100, 2)
+                category_probs[-1]['high'] = round(category_intervals[category]['high'] / classified_total * 100, 2)
             if probability > max_prob:
                 max_prob = probability
                 most_prob_cat = category
@@ -4,6 +4,7 @@ import logging
 from .models import App_Settings
 from HistoryApp import app_settings # Assuming your logger is configured here
 from .utils.settings import get_setting, set_setting
+from .utils.classification import HEARTBEAT_SECONDS, recover_stale_jobs
 
 logger = app_settings.LOGGER
 
@@ -15,6 +16,10 @@ def classification_status_processor(request):
     db_status = 1    # Default DB status value corresponding to 'complete'
 
     try:
+        # A job whose process died leaves the status at 'running', this clears it
+        # (checked once per heartbeat interval, not on every page)
+        recover_stale_jobs(min_interval=HEARTBEAT_SECONDS)
+
         # Fetch the status from the database
         # Ensure 'classification_status' matches the 'name' field in your App_Settings model
         db_status = get_setting('classification_status', default_value=1)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from frontend.utils.backup import run_backup
+from frontend.utils.settings import get_setting
+
+
+class Command(BaseCommand):
+    help = ("Back up browser history on an interval. Runs where no history changed "
+            "since the last backup are skipped after a few stat calls.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=None,
+                            help="Minutes between runs (default: the 'backup_interval_minutes' setting)")
+        parser.add_argument('--once', action='store_true', help="Run a single backup and exit")
+        parser.add_argument('--force', action='store_true', help="Back up even if no history changed")
+
+    def handle(self, *args, **options):
+        while True:
+            run = run_backup(force=options['force'])
+            if run['status'] == 'skipped':
+                self.stdout.write(f"{run['started_at']}: no history changes, skipped")
+            elif run['status'] == 'busy':
+                self.stdout.write("Another backup is running, skipped")
+            else:
+                rows = ', '.join(f"{browser}: {count}" for browser, count in run['rows'].items()) or "no new rows"
+                self.stdout.write(f"{run['started_at']}: backup {run['status']} in {run['seconds']}s ({rows})")
+                if run['error']:
+                    self.stderr.write(run['error'])
+
+            if options['once']:
+                return
+            interval = options['interval'] or get_setting('backup_interval_minutes', default_value=60)
+            time.sleep(max(1.0, float(interval) * 60))
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0003_alter_app_settings_value'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VisitEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('visit_id', models.IntegerField()),
+                ('url', models.TextField()),
+                ('title', models.TextField(blank=True, default='')),
+                ('visit_time', models.TextField(db_index=True)),
+                ('browser', models.TextField()),
+                ('profile', models.TextField()),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('browser', 'profile', 'visit_id'), name='unique_browser_profile_visit')],
+            },
+        ),
+    ]
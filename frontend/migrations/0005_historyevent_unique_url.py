@@ -0,0 +1,32 @@
+from django.db import migrations, models
+
+
+def remove_duplicate_urls(apps, schema_editor):
+    """Keep only the most recently saved row per URL so the unique constraint can be added"""
+    HistoryEvent = apps.get_model('frontend', 'HistoryEvent')
+    duplicates = (HistoryEvent.objects.values('url')
+                  .annotate(count=models.Count('id'), keep=models.Max('id'))
+                  .filter(count__gt=1))
+    for duplicate in duplicates:
+        HistoryEvent.objects.filter(url=duplicate['url']).exclude(id=duplicate['keep']).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0004_visitevent'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_urls, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='historyevent',
+            name='category',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AlterField(
+            model_name='historyevent',
+            name='url',
+            field=models.TextField(unique=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-18 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0005_historyevent_unique_url'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassificationCache',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.TextField()),
+                ('model', models.TextField()),
+                ('category_hash', models.CharField(max_length=64)),
+                ('category', models.TextField()),
+                ('hits', models.IntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('key', 'model', 'category_hash'), name='unique_classification_cache_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0006_classificationcache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historyevent',
+            name='classification_key',
+            field=models.CharField(blank=True, default='', max_length=64),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0007_historyevent_classification_key'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='historyevent',
+            name='classified_by',
+            field=models.CharField(blank=True, default='', max_length=32),
+        ),
+    ]
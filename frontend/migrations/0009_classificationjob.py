@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-18 08:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0008_historyevent_classified_by'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassificationJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('interrupted', 'Interrupted'), ('cancelled', 'Cancelled'), ('failed', 'Failed')], db_index=True, default='running', max_length=16)),
+                ('force', models.BooleanField(default=False)),
+                ('start_date', models.TextField()),
+                ('end_date', models.TextField()),
+                ('browsers', models.JSONField(default=list)),
+                ('checkpoints', models.JSONField(default=dict)),
+                ('processed', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, default='')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('heartbeat_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 08:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0009_classificationjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificationjob',
+            name='usage',
+            field=models.JSONField(default=dict),
+        ),
+    ]
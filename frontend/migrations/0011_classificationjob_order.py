@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-18 08:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0010_classificationjob_usage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificationjob',
+            name='order',
+            field=models.CharField(default='backup', max_length=16),
+        ),
+        migrations.AlterField(
+            model_name='classificationjob',
+            name='status',
+            field=models.CharField(choices=[('running', 'Running'), ('completed', 'Completed'), ('interrupted', 'Interrupted'), ('cancelled', 'Cancelled'), ('budget', 'Budget used up'), ('failed', 'Failed')], db_index=True, default='running', max_length=16),
+        ),
+    ]
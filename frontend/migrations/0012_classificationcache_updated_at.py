@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('frontend', '0011_classificationjob_order'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classificationcache',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -5,11 +5,14 @@ from django.db import models
 
 class HistoryEvent(models.Model):
 
-    url = models.TextField()
+    url = models.TextField(unique=True)
     last_visit = models.TextField()
     title = models.TextField()
     visit_count = models.IntegerField()
-    category = models.TextField()
+    category = models.TextField(blank=True, default='')  # Empty until classified
+    # Fingerprint of what the category was chosen from (URL, title, model, category list)
+    classification_key = models.CharField(max_length=64, blank=True, default='')
+    classified_by = models.CharField(max_length=32, blank=True, default='')  # Tier that decided: rule:*, cache, model
     browser = models.TextField()
 
     def __str__(self):
@@ -18,6 +21,81 @@ class HistoryEvent(models.Model):
     class Meta:
         app_label = 'frontend'
 
+class VisitEvent(models.Model):
+    """A single visit of a URL, as recorded in the browser's visits table"""
+
+    visit_id = models.IntegerField()
+    url = models.TextField()
+    title = models.TextField(blank=True, default='')
+    visit_time = models.TextField(db_index=True)
+    browser = models.TextField()
+    profile = models.TextField()
+
+    def __str__(self):
+        return f"VisitEvent(url={self.url}, visit_time={self.visit_time}, browser={self.browser}, profile={self.profile})"
+
+    class Meta:
+        app_label = 'frontend'
+        constraints = [
+            models.UniqueConstraint(fields=['browser', 'profile', 'visit_id'], name='unique_browser_profile_visit'),
+        ]
+
+class ClassificationCache(models.Model):
+    """Category the model gave a domain, reused for every URL on it"""
+
+    key = models.TextField()  # Normalised domain, see classifier.cache.cache_key
+    model = models.TextField()
+    category_hash = models.CharField(max_length=64)  # Fingerprint of the category list in use
+    category = models.TextField()
+    hits = models.IntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)  # Last time the model gave this category
+
+    def __str__(self):
+        return f"ClassificationCache(key={self.key}, model={self.model}, category={self.category}, hits={self.hits})"
+
+    class Meta:
+        app_label = 'frontend'
+        constraints = [
+            models.UniqueConstraint(fields=['key', 'model', 'category_hash'], name='unique_classification_cache_key'),
+        ]
+
+class ClassificationJob(models.Model):
+    """A classification run, checkpointed after every committed batch so it can be resumed"""
+
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('interrupted', 'Interrupted'),  # Heartbeat stopped (crash or restart), can be resumed
+        ('cancelled', 'Cancelled'),
+        ('budget', 'Budget used up'),  # Ran out of time or model requests, can be resumed
+        ('failed', 'Failed'),
+    ]
+
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default='running', db_index=True)
+    force = models.BooleanField(default=False)
+    # Date range, kept so a resumed job selects the same entries
+    start_date = models.TextField()
+    end_date = models.TextField()
+    browsers = models.JSONField(default=list)
+    # Order entries are classified in, kept so checkpoints stay valid (jobs before it had backup order)
+    order = models.CharField(max_length=16, default='backup')
+    # Per browser: entries committed so far, entries in range, and whether the browser is done
+    checkpoints = models.JSONField(default=dict)
+    processed = models.IntegerField(default=0)
+    # Per browser: model requests, prompt/completion tokens spent and entries sent to the model or grouped
+    usage = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"ClassificationJob(id={self.id}, status={self.status}, processed={self.processed}, browsers={self.browsers})"
+
+    class Meta:
+        app_label = 'frontend'
+
 class App_Settings(models.Model):
     name = models.CharField(max_length=255, unique=True)
     value = models.JSONField(max_length=255)
@@ -1,3 +1,221 @@
-from django.test import TestCase
+import shutil
+import tempfile
+import threading
+from datetime import datetime, timedelta
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.test import TransactionTestCase
+from django.utils import timezone
+
+from HistoryApp import app_settings
+from backupManager.formats import iter_backup_entries, write_backup
+from frontend.models import ClassificationJob, HistoryEvent
+from frontend.utils import classification
+from frontend.utils.classification import (create_classification_job, get_resumable_job, recover_stale_jobs,
+                                           resume_classification_job, run_classification_job)
+from frontend.utils.ingestion import HistoryWriter
+from frontend.utils.settings import get_setting, set_setting
+
+ENTRIES = 50
+
+
+class ClassificationJobTests(TransactionTestCase):
+    """Jobs run with the real pipeline; only the model is replaced, by one answering 'News'"""
+
+    def setUp(self):
+        backup_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, backup_dir, ignore_errors=True)
+        now = datetime.now()
+        # One domain per entry, so the domain cache doesn't answer for entries the model hasn't seen
+        write_backup([{'url': f"https://site{i}.com/page", 'title': f"Page {i}", 'visit_count': ENTRIES - i,
+                       'last_visit': (now - timedelta(minutes=i)).strftime("%Y-%m-%d %H:%M:%S")}
+                      for i in range(ENTRIES)], backup_dir / "chrome_history.ndjson")
+
+        classifier = classification.classifier
+        for name, value in (('backup_dir', backup_dir), ('current_categories', ['News', 'Other']),
+                            ('_classify_entries', self.model)):
+            patcher = mock.patch.object(classifier, name, value, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(app_settings, 'BACKUP_DIR', backup_dir)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        classification._last_recovery = 0.0
+
+        set_setting('local_model_enabled', False)
+        set_setting('classification_checkpoint_size', 10)
+        set_setting('classification_write_batch_size', 1)
+        set_setting('classification_status', 0)
+        self.sent = []
+        self.on_request = None
+
+    async def model(self, entries):
+        """Stand-in for HistoryClassifier._classify_entries: one request per checkpoint batch"""
+        classification.classifier.requests_sent += 1
+        if self.on_request is not None:
+            await sync_to_async(self.on_request)(len(self.sent) // 10 + 1)
+        self.sent.extend(entry['url'] for entry in entries)
+        return [{**entry, 'category': 'News'} for entry in entries]
+
+    def run_job(self, job):
+        set_setting('classification_status', 0)
+        run_classification_job(job)
+        job.refresh_from_db()
+        return job
+
+    def assert_completed_once(self, job):
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.processed, ENTRIES)
+        self.assertEqual(job.checkpoints['chrome'], {'committed': ENTRIES, 'total': ENTRIES, 'done': True})
+        self.assertEqual(HistoryEvent.objects.filter(category='News').count(), ENTRIES)
+        # Nothing committed before was sent to the model again
+        self.assertEqual(sorted(self.sent), sorted(set(self.sent)))
+        self.assertEqual(len(self.sent), ENTRIES)
+
+    def crash(self, request):
+        if request == 3:
+            # Not an Exception: nothing in the job catches it, as when the process dies
+            raise SystemExit
+
+    def test_interrupted_job_resumes(self):
+        job = create_classification_job()
+        self.on_request = self.crash
+        with self.assertRaises(SystemExit):
+            run_classification_job(job)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.checkpoints['chrome']['committed'], 20)
+
+        # Its heartbeat stops with the process
+        ClassificationJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(recover_stale_jobs(), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'interrupted')
+        self.assertEqual(get_resumable_job(), job)
+
+        self.on_request = None
+        resume_classification_job(job)
+        self.assert_completed_once(self.run_job(job))
+        self.assertIsNone(get_resumable_job())
+
+    def test_resume_after_backup_changed(self):
+        job = create_classification_job()
+        self.on_request = self.crash
+        with self.assertRaises(SystemExit):
+            run_classification_job(job)
+        committed = set(self.sent)
+
+        # The next backup has new, more visited entries, which move every position
+        backup = classification.classifier.backup_dir / "chrome_history.ndjson"
+        entries = list(iter_backup_entries(backup))
+        new = [{'url': f"https://new{i}.com/", 'title': f"New {i}", 'visit_count': 100 + i,
+                'last_visit': entries[0]['last_visit']} for i in range(5)]
+        write_backup(new + entries, backup)
+
+        self.on_request = None
+        self.sent = []
+        resume_classification_job(job)
+        job = self.run_job(job)
+        self.assertEqual(job.status, 'completed')
+        self.assertEqual(job.processed, ENTRIES + 5)
+        self.assertFalse(committed & set(self.sent))
+        self.assertEqual(len(self.sent), ENTRIES + 5 - len(committed))
+
+    def test_cancelled_job_resumes(self):
+        def stop(request):
+            if request == 2:
+                set_setting('classification_status', 1)
+        self.on_request = stop
+        job = self.run_job(create_classification_job())
+        self.assertEqual((job.status, job.processed), ('cancelled', 20))
+        self.assertEqual(get_resumable_job(), job)
+
+        self.on_request = None
+        resume_classification_job(job)
+        self.assert_completed_once(self.run_job(job))
+
+    def test_budget_job_resumes(self):
+        set_setting('classification_request_budget', 2)
+        job = create_classification_job()
+        for processed in (20, 40):
+            job = self.run_job(job)
+            self.assertEqual((job.status, job.processed), ('budget', processed))
+            self.assertEqual(get_resumable_job(), job)
+            resume_classification_job(job)
+        self.assert_completed_once(self.run_job(job))
+
+    def test_recover_stale_jobs(self):
+        stale = create_classification_job()
+        fresh = create_classification_job()
+        ClassificationJob.objects.filter(pk=stale.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(recover_stale_jobs(), 1)
+        stale.refresh_from_db()
+        fresh.refresh_from_db()
+        self.assertEqual((stale.status, fresh.status), ('interrupted', 'running'))
+
+        ClassificationJob.objects.filter(pk=fresh.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        # Checked at most once per interval
+        self.assertEqual(recover_stale_jobs(min_interval=60), 0)
+        self.assertEqual(recover_stale_jobs(), 1)
+
+    def test_recovery_clears_running_status(self):
+        job = create_classification_job()
+        ClassificationJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - timedelta(hours=1))
+        recover_stale_jobs()
+        self.assertEqual(get_setting('classification_status', default_value=1), 1)
+
+
+def _rows(batch: int, count: int = 3):
+    return [{'url': f"https://example.com/{batch}/{i}", 'title': "", 'last_visit': "2025-01-01 00:00:00",
+             'category': "News"} for i in range(count)]
+
+
+class HistoryWriterTests(TransactionTestCase):
+    def test_markers_follow_their_rows(self):
+        reported = []
+
+        def on_flush(markers):
+            # Called in the writer thread, once the rows are in the database
+            for marker in markers:
+                urls = [row['url'] for row in _rows(marker)]
+                reported.append((marker, HistoryEvent.objects.filter(url__in=urls, category="News").count()))
+
+        writer = HistoryWriter(flush_rows=5, on_flush=on_flush).start()
+        for batch in range(6):
+            writer.put(_rows(batch), "chrome", marker=batch)
+        writer.close()
+        self.assertEqual(reported, [(batch, 3) for batch in range(6)])
+        self.assertEqual(writer.rows_written, 18)
+        self.assertFalse(writer.is_alive())
+
+    def test_full_queue_blocks_put(self):
+        release = threading.Event()
+        writer = HistoryWriter(flush_rows=1, max_pending=1, on_flush=lambda markers: release.wait()).start()
+        # The writer takes the first batch and waits in on_flush, the second fills the queue
+        writer.put(_rows(0), "chrome", marker=0)
+        writer.put(_rows(1), "chrome", marker=1)
+        producer = threading.Thread(target=writer.put, args=(_rows(2), "chrome", 2))
+        producer.start()
+        producer.join(0.3)
+        self.assertTrue(producer.is_alive())
+
+        release.set()
+        producer.join(5)
+        self.assertFalse(producer.is_alive())
+        writer.close()
+        self.assertEqual(HistoryEvent.objects.count(), 9)
+
+    def test_failed_write(self):
+        reported = []
+        writer = HistoryWriter(flush_rows=1, on_flush=reported.extend).start()
+        writer.put(_rows(0), "chrome", marker=0)
+        # Rows without a URL can't be written
+        writer.put([{'title': "no url"}], "chrome", marker=1)
+        with self.assertRaises(KeyError):
+            writer.close()
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(reported, [0])
+        with self.assertRaises(KeyError):
+            writer.put(_rows(2), "chrome", marker=2)
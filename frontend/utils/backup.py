@@ -0,0 +1,183 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Optional
+
+from backupManager.main import BrowserHistoryReader
+from HistoryApp import app_settings
+from frontend.utils.ingestion import ingest_history, ingest_visits
+from frontend.utils.settings import get_setting, set_setting
+
+logger = app_settings.LOGGER
+
+# Only one backup runs at a time, across processes (the backup_scheduler command and the web
+# server): whoever creates the lock file runs, it holds the owner's pid and start time
+BACKUP_LOCK_FILE = app_settings.BACKUP_DIR / "backup.lock"
+# A lock this old was left behind by a backup that died
+BACKUP_LOCK_STALE_SECONDS = 3 * 3600
+
+
+def _read_lock() -> Optional[Dict]:
+    """Contents of the lock file, None without one ({} while it is being written)"""
+    try:
+        with open(BACKUP_LOCK_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError):
+        return {}
+
+
+def _lock_is_stale(lock: Dict) -> bool:
+    """Whether a lock is too old, or (where it can be checked) its process is gone"""
+    try:
+        age = time.time() - BACKUP_LOCK_FILE.stat().st_mtime
+    except FileNotFoundError:
+        return False
+    if age > BACKUP_LOCK_STALE_SECONDS:
+        return True
+    # Signal 0 only checks the process exists on POSIX; on Windows os.kill would end it
+    if os.name == 'posix' and lock.get('pid'):
+        try:
+            os.kill(lock['pid'], 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            pass
+    return False
+
+
+def acquire_backup_lock() -> bool:
+    """Take the backup lock, replacing a stale one. Returns False if a backup is running"""
+    BACKUP_LOCK_FILE.parent.mkdir(parents=True, exist_ok=True)
+    for _ in range(2):
+        try:
+            fd = os.open(BACKUP_LOCK_FILE, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            lock = _read_lock()
+            if lock is not None:
+                if not _lock_is_stale(lock):
+                    return False
+                logger.warning(f"Removing stale backup lock of pid {lock.get('pid')} "
+                               f"started at {lock.get('started_at')}")
+                BACKUP_LOCK_FILE.unlink(missing_ok=True)
+            continue
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump({'pid': os.getpid(), 'started_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}, f)
+        return True
+    return False
+
+
+def release_backup_lock() -> None:
+    """Remove the lock file if this process holds it"""
+    lock = _read_lock()
+    if lock and lock.get('pid') == os.getpid():
+        BACKUP_LOCK_FILE.unlink(missing_ok=True)
+
+
+def backup_in_progress() -> bool:
+    """Whether a backup is running in any process"""
+    lock = _read_lock()
+    return lock is not None and not _lock_is_stale(lock)
+
+
+def make_reader() -> BrowserHistoryReader:
+    """BrowserHistoryReader configured from the app settings"""
+    return BrowserHistoryReader(
+        backup_format=get_setting('backup_format', default_value='ndjson'),
+        retention_count=get_setting('backup_retention_count', default_value=10),
+        retention_days=get_setting('backup_retention_days', default_value=30),
+    )
+
+
+def _source_key(source: Dict) -> str:
+    """Same key as the backup watermarks: browser and profile directory"""
+    return f"{source['browser']}:{source['profile_dir']}"
+
+
+def run_backup(force: bool = False) -> Dict:
+    """
+    Back up, then ingest, every browser whose history changed since the last run.
+
+    A browser is skipped when none of its profiles' database fingerprints
+    (mtime/size of the database and its WAL/journal) changed, so a run with no
+    new history costs a few stat calls. `force` backs up every browser regardless.
+
+    The outcome (duration, rows per browser, failures) is stored in the
+    'last_backup_run' setting for the home page backup card, and returned;
+    skipped runs only update 'last_backup_check'.
+    """
+    if not acquire_backup_lock():
+        logger.info("A backup is already running, skipping this run")
+        return {'status': 'busy'}
+
+    start = time.perf_counter()
+    run = {
+        'started_at': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'status': 'ok',
+        'seconds': 0.0,
+        'sources': 0,
+        'rows': {},
+        'history_rows': 0,
+        'visits': 0,
+        'error': None,
+    }
+    try:
+        reader = make_reader()
+        known = get_setting('backup_source_fingerprints', default_value={})
+        sources = reader.discover_sources()
+        fingerprints = {_source_key(s): reader.source_fingerprint(s) for s in sources}
+
+        # A changed profile re-backs up its whole browser, since one backup covers all of its profiles
+        changed = {s['browser'] for s in sources if force or known.get(_source_key(s)) != fingerprints[_source_key(s)]}
+        sources = [s for s in sources if s['browser'] in changed]
+        if not sources:
+            run['status'] = 'skipped'
+            logger.info("Browser history unchanged since the last backup, skipping")
+            return run
+
+        # Backup and ingestion of the changed sources read one snapshot of each database
+        with reader.shared_snapshots():
+            summary = reader.backup_sources(sources=sources, incremental=get_setting('incremental_backup', default_value=True))
+            run['sources'] = len(summary['sources'])
+            run['rows'] = summary['browsers']
+
+            # Raw history and individual visits are queryable right after the backup
+            run['history_rows'] = sum(ingest_history(reader, sources=sources).values())
+            run['visits'] = sum(ingest_visits(reader, sources=sources).values())
+
+        # Failed profiles keep their old fingerprint so the next run retries them
+        failed = {r['key'] for r in summary['sources'] if r['error']}
+        for source in sources:
+            if _source_key(source) not in failed:
+                known[_source_key(source)] = fingerprints[_source_key(source)]
+        set_setting('backup_source_fingerprints', known)
+        if failed:
+            run['status'] = 'partial'
+            run['error'] = f"{len(failed)} profile(s) failed"
+        return run
+
+    except Exception as e:
+        logger.error(f"Backup run failed: {e}")
+        run['status'] = 'failed'
+        run['error'] = str(e)
+        return run
+
+    finally:
+        run['seconds'] = round(time.perf_counter() - start, 3)
+        if run['status'] == 'skipped':
+            # Keep the stats of the last real run for the backup card
+            set_setting('last_backup_check', run['started_at'])
+        else:
+            set_setting('last_backup_run', run)
+        release_backup_lock()
+
+
+def start_backup_in_background(force: bool = True) -> bool:
+    """Run a backup in a daemon thread, returns False if one is already running"""
+    if backup_in_progress():
+        return False
+    threading.Thread(target=run_backup, kwargs={'force': force}, daemon=True).start()
+    return True
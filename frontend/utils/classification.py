@@ -1,68 +1,230 @@
 import logging
+import threading
+import time
 from datetime import timedelta, datetime
+from typing import Optional
 
+from django.db import connection
+from django.utils import timezone
+
+from HistoryApp import app_settings
+from backupManager.formats import backup_browser, find_backup_files
 from classifier.main import HistoryClassifier
-from frontend.models import HistoryEvent, App_Settings
+from frontend.models import HistoryEvent, App_Settings, ClassificationJob
+from frontend.utils.ingestion import HistoryWriter
 from frontend.utils.settings import set_setting, get_setting
 
 classifier = HistoryClassifier()
 
+DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+# A running job refreshes its heartbeat this often; one silent for 'classification_job_timeout_seconds' is stale
+HEARTBEAT_SECONDS = 15
+# Unfinished jobs that can be continued
+RESUMABLE_STATUSES = ('interrupted', 'cancelled', 'budget', 'failed')
+
+# Model usage counted in the classifier status and saved with the job, with the entries
+# sent to the model and those classified as duplicates of another URL
+USAGE_KEYS = ('requests', 'prompt_tokens', 'completion_tokens', 'model_entries', 'duplicates')
+
+# Only one classification job runs at a time in this process
+_classification_lock = threading.Lock()
+# When recover_stale_jobs() last checked, see its min_interval
+_last_recovery = 0.0
+
 def set_classification_status_complete():
     set_setting('classification_status', 1)
     set_setting('last_classification_date', datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
     return 0
 
-def start_classification_with_callback(request, callback):
-    start_classification()
+def start_classification_with_callback(request, callback, force=False, job=None):
+    start_classification(force=force, job=job)
     callback()
 
-def start_classification():
-    global classifier
+def create_classification_job(force=False, sample=False) -> ClassificationJob:
+    """
+    New running job over the configured date range, for every browser that has a backup.
+    A `sample` job classifies only a stratified sample of a wider range, enough for the
+    dashboard to estimate its category mix.
+    """
     # Date range setup
     end_date = datetime.now()
     # Get the number of days to analyze from settings
-    days_to_analyze = get_setting('days_to_analyze', default_value=7)
+    if sample:
+        days_to_analyze = get_setting('classification_sample_days', default_value=90)
+    else:
+        days_to_analyze = get_setting('days_to_analyze', default_value=7)
     start_date = end_date - timedelta(days= days_to_analyze)
 
+    # Classify every browser that has a backup (Chrome, Firefox, Edge, ...)
+    browsers = sorted({backup_browser(path) for path in find_backup_files(app_settings.BACKUP_DIR)})
+    return ClassificationJob.objects.create(
+        force=force,
+        start_date=start_date.strftime(DATE_FORMAT),
+        end_date=end_date.strftime(DATE_FORMAT),
+        browsers=browsers,
+        order='sample' if sample else get_setting('classification_order', default_value='visit_count'),
+        checkpoints={browser: {'committed': 0, 'total': None, 'done': False} for browser in browsers},
+        heartbeat_at=timezone.now(),
+    )
+
+def start_classification(force=False, job=None):
+    """Classify the history of every backed up browser; `force` reclassifies entries already classified"""
+    if job is None:
+        job = create_classification_job(force=force)
+    run_classification_job(job)
+
+def _heartbeat(job_id: int, stop: threading.Event) -> None:
+    """Keep a job's heartbeat fresh while it runs, so only dead jobs look stale"""
+    try:
+        while not stop.wait(HEARTBEAT_SECONDS):
+            ClassificationJob.objects.filter(pk=job_id, status='running').update(heartbeat_at=timezone.now())
+    finally:
+        connection.close()
+
+def run_classification_job(job: ClassificationJob) -> None:
+    """
+    Run (or continue) a job. The results of every checkpoint batch go to a
+    write-behind writer, and once they are saved the job records how many entries
+    of each browser are committed. A job that is interrupted is continued by running
+    it again: browsers it finished are skipped, and in the others the entries it
+    committed are recognised as classified (see iter_classified_batches).
+    """
+    if not _classification_lock.acquire(blocking=False):
+        logging.error(f"Another classification is running, job {job.id} not started")
+        ClassificationJob.objects.filter(pk=job.pk).update(status='cancelled', error='Another classification was running')
+        return
+
+    stop_heartbeat = threading.Event()
+    threading.Thread(target=_heartbeat, args=(job.id, stop_heartbeat), daemon=True).start()
+
+    # Checkpoints move only once the writer has saved the results before them
+    saved = {browser: dict(job.checkpoints.get(browser) or {'committed': 0, 'total': None, 'done': False})
+             for browser in job.browsers}
+    # Token usage of earlier runs of this job, the classifier status counts this run's
+    previous_usage = {browser: dict(usage) for browser, usage in job.usage.items()}
+    usage = {browser: dict(counts) for browser, counts in previous_usage.items()}
+
+    def save_checkpoints(markers):
+        for browser, committed, total, run_usage in markers:
+            saved[browser].update(committed=committed, total=total, done=committed >= total)
+            earlier = previous_usage.get(browser, {})
+            usage[browser] = {key: earlier.get(key, 0) + value for key, value in run_usage.items()}
+        ClassificationJob.objects.filter(pk=job.pk).update(
+            checkpoints=saved, processed=sum(c['committed'] for c in saved.values()), usage=usage,
+            heartbeat_at=timezone.now())
+
+    writer = HistoryWriter(flush_rows=get_setting('classification_write_batch_size', default_value=2000),
+                           on_flush=save_checkpoints).start()
+    # Each run (a resumed job too) gets the full budget
+    classifier.start_budget(get_setting('classification_time_budget_seconds', default_value=0),
+                            get_setting('classification_request_budget', default_value=0))
+
     # Classification process
-    print("\nClassifying history...")
+    print(f"\nClassifying history (job {job.id})...")
     try:
-        # Chrome classification
-        chrome_results = classifier.classify_history("chrome", start_date, end_date)
-
-        # Firefox classification
-        firefox_results = classifier.classify_history("firefox", start_date, end_date)
-
-        # Save results to database
-        for entry in chrome_results:
-            HistoryEvent.objects.update_or_create(
-                url=entry['url'],
-                defaults={
-                    'last_visit': entry['last_visit'],
-                    'title': entry['title'],
-                    'visit_count': entry['visit_count'],
-                    'category': entry['category'],
-                    'browser': "chrome"
-                }
-            )
-        for entry in firefox_results:
-            HistoryEvent.objects.update_or_create(
-                url=entry['url'],
-                defaults={
-                    'last_visit': entry['last_visit'],
-                    'title': entry['title'],
-                    'visit_count': entry['visit_count'],
-                    'category': entry['category'],
-                    'browser': "firefox"
-                }
-            )
+        start_date = datetime.strptime(job.start_date, DATE_FORMAT)
+        end_date = datetime.strptime(job.end_date, DATE_FORMAT)
+
+        for browser in job.browsers:
+            checkpoint = saved[browser]
+            if checkpoint['done']:
+                continue
 
+            done = False
+            batches = classifier.iter_classified_batches(browser, start_date, end_date, force=job.force,
+                                                         order=job.order, forced_since=job.created_at)
+            for results, committed, total in batches:
+                # Saved to database in the background while the next batch is classified
+                run_usage = {key: classifier.status.get(key, 0) for key in USAGE_KEYS}
+                writer.put(results, browser, marker=(browser, committed, total, run_usage))
+                done = committed >= total
+            if not done:
+                # Stopped from the classification page, or out of budget
+                break
+
+        writer.close()
+        job.checkpoints = saved
+        job.usage = usage
+        job.processed = sum(c['committed'] for c in saved.values())
+        if all(c['done'] for c in saved.values()):
+            job.status = 'completed'
+        else:
+            job.status = 'budget' if classifier.budget_exhausted() else 'cancelled'
+        logging.info(f"Wrote {writer.rows_written} classified entries in {writer.flushes} batches "
+                     f"({writer.write_seconds:.2f}s)")
 
         # Display summary
-        print(f"\nClassification complete! Results saved to database.")
-        print(f"Chrome entries processed: {len(chrome_results)}")
-        print(f"Firefox entries processed: {len(firefox_results)}")
+        print(f"\nClassification {job.status}! Results saved to database.")
+        for browser, checkpoint in saved.items():
+            print(f"{browser.title()} entries processed: {checkpoint['committed']}/{checkpoint['total']}")
+        for browser, counts in usage.items():
+            print(f"{browser.title()} model usage: {counts['requests']} requests, "
+                  f"{counts['prompt_tokens']} prompt + {counts['completion_tokens']} completion tokens, "
+                  f"{counts.get('model_entries', 0)} entries sent to the model, "
+                  f"{counts.get('duplicates', 0)} duplicate URLs classified with their group")
 
     except Exception as e:
         logging.error(f"Classification failed: {e}")
-        return
+        job.status = 'failed'
+        job.error = str(e)
+
+    finally:
+        if writer.is_alive():
+            # Failed mid-run: keep what was classified so far, the checkpoints follow it
+            try:
+                writer.close()
+            except Exception as e:
+                logging.error(f"Saving classification results failed: {e}")
+        stop_heartbeat.set()
+        classifier.budget = None
+        job.finished_at = timezone.now()
+        ClassificationJob.objects.filter(pk=job.pk).update(status=job.status, error=job.error,
+                                                           finished_at=job.finished_at)
+        _classification_lock.release()
+
+def recover_stale_jobs(min_interval: float = 0) -> int:
+    """
+    Mark running jobs whose heartbeat stopped (the process crashed or restarted) as
+    interrupted, and clear a 'classification_status' left running by them.
+    Does nothing if it ran in the last `min_interval` seconds, for callers on every request.
+    Returns the number of jobs marked.
+    """
+    global _last_recovery
+    if min_interval and time.monotonic() - _last_recovery < min_interval:
+        return 0
+    _last_recovery = time.monotonic()
+
+    timeout = get_setting('classification_job_timeout_seconds', default_value=120)
+    cutoff = timezone.now() - timedelta(seconds=timeout)
+    stale = ClassificationJob.objects.filter(status='running', heartbeat_at__lt=cutoff)
+    marked = stale.update(status='interrupted', error='Heartbeat lost')
+    if marked:
+        logging.warning(f"Marked {marked} stale classification job(s) as interrupted")
+
+    if get_setting('classification_status', default_value=1) == 0 \
+            and not ClassificationJob.objects.filter(status='running').exists():
+        set_setting('classification_status', 1)
+    return marked
+
+def get_resumable_job() -> Optional[ClassificationJob]:
+    """The most recent job, if it stopped before finishing"""
+    job = ClassificationJob.objects.order_by('-id').first()
+    if job is not None and job.status in RESUMABLE_STATUSES:
+        return job
+    return None
+
+def get_estimating_job(start_date: str, end_date: str) -> Optional[ClassificationJob]:
+    """
+    The latest job over (part of) the date range, if it is a Quick Estimate job: what it
+    classified is a stratified sample, which the dashboard can extrapolate from.
+    """
+    job = ClassificationJob.objects.filter(start_date__lte=end_date, end_date__gte=start_date).order_by('-id').first()
+    return job if job is not None and job.order == 'sample' else None
+
+def resume_classification_job(job: ClassificationJob) -> None:
+    """Mark an unfinished job running again; run it with start_classification(job=job)"""
+    job.status = 'running'
+    job.error = ''
+    job.finished_at = None
+    job.heartbeat_at = timezone.now()
+    job.save(update_fields=['status', 'error', 'finished_at', 'heartbeat_at'])
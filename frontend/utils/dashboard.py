@@ -2,8 +2,12 @@ import logging
 from datetime import datetime, timedelta
 
 from HistoryApp import app_settings
-from backupManager.helpers import check_backup_freshness, check_backup_existence
+from backupManager.formats import find_backup_files
+from backupManager.helpers import check_backup_freshness, check_backup_existence, get_backup_time
+from classifier.endpoints import check_endpoint, configured_endpoints
 from frontend.analytics import get_category_distribution, get_daily_visits, get_recent_history
+from frontend.utils.backup import backup_in_progress
+from frontend.utils.settings import get_setting
 
 
 def make_backup_card():
@@ -12,8 +16,13 @@ def make_backup_card():
         "has_backup": False,
         "is_fresh": False,
         "last_backup_time": None,  # Formatted string timestamp
-        "tooltip_message": "No backups found."  # Default message
+        "tooltip_message": "No backups found.",  # Default message
+        "is_running": backup_in_progress(),
+        "last_run": get_setting('last_backup_run', default_value=None),  # Duration/rows of the last run
+        "last_check": get_setting('last_backup_check', default_value=None),  # Last run skipped for no changes
     }
+    if backup_card_data["last_run"]:
+        backup_card_data["last_run"]["total_rows"] = sum(backup_card_data["last_run"].get('rows', {}).values())
 
     if backup_files:  # Check if list is not None and not empty
         backup_card_data["has_backup"] = True
@@ -23,7 +32,7 @@ def make_backup_card():
 
         if latest_file:
             try:
-                backup_time = datetime.fromtimestamp(latest_file.stat().st_mtime)
+                backup_time = get_backup_time(latest_file)
                 # Format the time nicely - adjust strftime format as needed
                 backup_card_data["last_backup_time"] = backup_time.strftime("%Y-%m-%d %H:%M")
 
@@ -50,12 +59,9 @@ def make_backup_card():
 def get_latest_backup_date():
     try:
         # Get the last backup date
-        backups = list(app_settings.BACKUP_DIR.glob("*_history.json"))
-        latest_backup = max(backups, key=lambda f: f.stat().st_mtime)
-        # Format the last backup date
-        nf_last_backup_date = latest_backup.stat().st_mtime
-        # Convert to datetime object
-        nf_last_backup_date = datetime.fromtimestamp(nf_last_backup_date)
+        backups = find_backup_files(app_settings.BACKUP_DIR)
+        # Creation times come from the backup manifests
+        nf_last_backup_date = max(get_backup_time(backup) for backup in backups)
         return nf_last_backup_date.strftime("%Y-%m-%d %H:%M:%S")
 
     except ValueError:
@@ -66,22 +72,24 @@ def get_latest_backup_date():
 
 
 def make_lm_studio_ping():
-    # make a request to 127.0.0.1:7860/v1
-    import requests
-    try:
-        response = requests.get('http://127.0.0.1:1234/v1/models')
-    except Exception as e:
-        logging.error(f"Error pinging LM Studio: {e}")
-        return {
-            'ping': False,
-            'ping_time': 0,
-            'model_list': []
-        }
+    """Status of the configured model endpoints, with their throughput in the last classification"""
+    stats = {endpoint['url']: endpoint for endpoint in get_setting('llm_endpoint_stats', default_value=[])}
+    endpoints = []
+    model_list = []
+    for endpoint in configured_endpoints():
+        result = check_endpoint(endpoint['url'])
+        if not result['ok']:
+            logging.error(f"Error pinging LM Studio at {endpoint['url']}: {result['error']}")
+        endpoints.append({**endpoint, 'ping': result['ok'], 'ping_time': result['ms'],
+                          'stats': stats.get(endpoint['url'])})
+        model_list.extend(model for model in result['models'] if model not in model_list)
+
+    reachable = [endpoint['ping_time'] for endpoint in endpoints if endpoint['ping']]
     return {
-        'ping' : True if response.status_code == 200 else False,
-        'ping_time' : response.elapsed.total_seconds(),
-        'model_list' : response.json()['data'],
-
+        'ping': bool(reachable),
+        'ping_time': min(reachable) if reachable else 0,
+        'model_list': model_list,
+        'endpoints': endpoints,
     }
 
 def dashboard_context():
@@ -0,0 +1,222 @@
+import queue
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional
+
+from django.db import connection
+from django.db.models import Max
+
+from HistoryApp import app_settings
+from backupManager.main import BrowserHistoryReader
+from frontend.models import HistoryEvent, VisitEvent
+from frontend.utils.settings import get_setting, set_setting
+
+logger = app_settings.LOGGER
+
+
+def ingest_visits(reader: Optional[BrowserHistoryReader] = None, batch_size: int = 5000,
+                  sources: Optional[List[Dict]] = None) -> Dict[str, int]:
+    """
+    Stream new visit events from every browser profile (or the given sources) into VisitEvent.
+    Only visits newer than the last ingested visit id of each browser/profile are read,
+    and rows are written with bulk_create in batches so memory stays bounded.
+    Returns the number of visits ingested per browser.
+    """
+    reader = reader or BrowserHistoryReader()
+    ingested = {}
+
+    for source in reader.discover_sources() if sources is None else sources:
+        browser, profile, profile_dir = source['browser'], source['profile'], source['profile_dir']
+        last_id = VisitEvent.objects.filter(browser=browser, profile=profile).aggregate(Max('visit_id'))['visit_id__max']
+
+        start = time.perf_counter()
+        count = 0
+        batch = []
+        for row in reader.iter_visits(browser, profile_dir=profile_dir, since_id=last_id, batch_size=batch_size):
+            batch.append(VisitEvent(browser=browser, profile=profile, **row))
+            if len(batch) >= batch_size:
+                VisitEvent.objects.bulk_create(batch, ignore_conflicts=True)
+                count += len(batch)
+                batch = []
+        if batch:
+            VisitEvent.objects.bulk_create(batch, ignore_conflicts=True)
+            count += len(batch)
+
+        ingested[browser] = ingested.get(browser, 0) + count
+        logger.info(f"Ingested {count} {browser}/{profile} visits in {time.perf_counter() - start:.3f}s")
+
+    return ingested
+
+
+HISTORY_UPDATE_FIELDS = ['title', 'visit_count', 'last_visit', 'browser']
+
+
+def _history_events(rows: Iterable[Dict], browser: str, with_category: bool) -> List[HistoryEvent]:
+    """Build HistoryEvent objects for one batch, keeping the most recent row per URL"""
+    events = {}
+    for row in rows:
+        last_visit = row.get('last_visit') or ''
+        current = events.get(row['url'])
+        if current is not None and current.last_visit >= last_visit:
+            continue
+        events[row['url']] = HistoryEvent(
+            url=row['url'],
+            title=row.get('title') or '',
+            visit_count=row.get('visit_count') or 0,
+            last_visit=last_visit,
+            category=row.get('category', '') if with_category else '',
+            classification_key=row.get('classification_key', '') if with_category else '',
+            classified_by=row.get('classified_by', '') if with_category else '',
+            browser=browser,
+        )
+    return list(events.values())
+
+
+def upsert_history(rows: Iterable[Dict], browser: str, batch_size: int = 5000,
+                   with_category: bool = False) -> int:
+    """
+    Write history rows into HistoryEvent in batches, inserting new URLs and
+    refreshing title, visit count and last visit of known ones in the same query.
+    The category of existing rows is only overwritten when `with_category` is set,
+    new rows without one are stored unclassified (empty category).
+    Returns the number of rows written.
+    """
+    update_fields = HISTORY_UPDATE_FIELDS + ['category', 'classification_key', 'classified_by'] if with_category else HISTORY_UPDATE_FIELDS
+    count = 0
+    batch = []
+
+    def flush():
+        events = _history_events(batch, browser, with_category)
+        HistoryEvent.objects.bulk_create(events, update_conflicts=True, unique_fields=['url'],
+                                         update_fields=update_fields)
+        return len(events)
+
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            count += flush()
+            batch = []
+    if batch:
+        count += flush()
+    return count
+
+
+def ingest_history(reader: Optional[BrowserHistoryReader] = None, batch_size: int = 5000,
+                   sources: Optional[List[Dict]] = None) -> Dict[str, int]:
+    """
+    Stream history from every browser profile snapshot (or the given sources') straight
+    into HistoryEvent, independent of classification, so raw history is queryable right away.
+    Only rows visited since the last ingestion of each profile are read; the
+    per-profile watermarks are kept in the 'history_ingest_watermarks' setting.
+    Returns the number of rows ingested per browser.
+    """
+    reader = reader or BrowserHistoryReader()
+    watermarks = get_setting('history_ingest_watermarks', default_value={})
+    ingested = {}
+
+    for source in reader.discover_sources() if sources is None else sources:
+        browser, profile = source['browser'], source['profile']
+        key = f"{browser}:{source['profile_dir']}"
+        newest = {'last_visit': watermarks.get(key)}
+
+        def tracked_rows():
+            for row in reader.iter_source_history(source, since_visit=watermarks.get(key), batch_size=batch_size):
+                if row.get('last_visit') and (newest['last_visit'] is None or row['last_visit'] > newest['last_visit']):
+                    newest['last_visit'] = row['last_visit']
+                yield row
+
+        start = time.perf_counter()
+        try:
+            count = upsert_history(tracked_rows(), browser, batch_size)
+        except Exception as e:
+            logger.error(f"Ingestion of {browser}/{profile} history failed: {e}")
+            continue
+
+        if newest['last_visit']:
+            watermarks[key] = newest['last_visit']
+        ingested[browser] = ingested.get(browser, 0) + count
+        logger.info(f"Ingested {count} {browser}/{profile} history rows in {time.perf_counter() - start:.3f}s")
+
+    set_setting('history_ingest_watermarks', watermarks)
+    return ingested
+
+
+class HistoryWriter:
+    """
+    Write-behind writer for classified history. Producers `put` result batches on a
+    bounded queue and carry on; a background thread merges what is queued and writes
+    it with upsert_history, so the classification loop doesn't wait on the database
+    and results reach HistoryEvent (and the dashboard) while the run goes on.
+
+    Each batch can carry a marker (e.g. a job checkpoint); after a write, `on_flush`
+    is called in the writer thread with the markers of the rows written, in order.
+    A full queue blocks `put`, so a slow database slows producers down instead of
+    letting results pile up in memory.
+    """
+
+    def __init__(self, flush_rows: int = 2000, max_pending: int = 8,
+                 on_flush: Optional[Callable[[List], None]] = None):
+        self.flush_rows = flush_rows
+        self.on_flush = on_flush
+        self.queue = queue.Queue(maxsize=max_pending)
+        self.rows_written = 0
+        self.flushes = 0
+        self.write_seconds = 0.0
+        self.error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> "HistoryWriter":
+        self._thread.start()
+        return self
+
+    def is_alive(self) -> bool:
+        return self._thread.is_alive()
+
+    def put(self, rows: List[Dict], browser: str, marker=None) -> None:
+        """Queue rows for writing; raises the writer's error if a write failed"""
+        if self.error is not None:
+            raise self.error
+        self.queue.put((rows, browser, marker))
+
+    def close(self) -> None:
+        """Write everything still queued and stop the thread; raises the writer's error if a write failed"""
+        self.queue.put(None)
+        self._thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def _run(self) -> None:
+        pending, markers, count = {}, [], 0
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    break
+                if self.error is not None:
+                    # Keep draining so producers aren't blocked on a full queue
+                    continue
+                rows, browser, marker = item
+                pending.setdefault(browser, []).extend(rows)
+                markers.append(marker)
+                count += len(rows)
+                # Merge queued batches into larger writes, but don't hold results back when idle
+                if count >= self.flush_rows or self.queue.empty():
+                    self._flush(pending, markers)
+                    pending, markers, count = {}, [], 0
+            if self.error is None and markers:
+                self._flush(pending, markers)
+        finally:
+            connection.close()
+
+    def _flush(self, pending: Dict[str, List[Dict]], markers: List) -> None:
+        start = time.perf_counter()
+        try:
+            for browser, rows in pending.items():
+                self.rows_written += upsert_history(rows, browser, with_category=True)
+            self.write_seconds += time.perf_counter() - start
+            self.flushes += 1
+            if self.on_flush is not None:
+                self.on_flush(markers)
+        except Exception as e:
+            logger.error(f"Writing classified history failed: {e}")
+            self.error = e
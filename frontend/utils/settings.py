@@ -7,9 +7,8 @@ from frontend.models import App_Settings
 
 logger = app_settings.LOGGER
 
-def fetch_available_models():
-    """Fetches the list of available models from LM Studio API."""
-    api_url = 'http://127.0.0.1:1234/v1/models'
+def _fetch_endpoint_models(api_url):
+    """Fetches the list of available models from one LM Studio (OpenAI-compatible) API."""
     model_list = []
     error_message = None
     try:
@@ -44,6 +43,24 @@ def fetch_available_models():
 
     return model_list, error_message
 
+def fetch_available_models():
+    """Fetches the models available on the configured endpoints ('llm_endpoints' setting)."""
+    # Imported here: classifier.endpoints reads its settings through this module
+    from classifier.endpoints import configured_endpoints
+
+    model_list = []
+    errors = []
+    for endpoint in configured_endpoints():
+        models, error_message = _fetch_endpoint_models(f"{endpoint['url']}/models")
+        if error_message:
+            errors.append(f"{endpoint['url']}: {error_message}")
+        # A model listed by several endpoints appears once
+        model_list.extend(model for model in models if model not in model_list)
+
+    # Endpoints that are down don't matter as long as one lists models
+    error_message = None if model_list else "; ".join(errors) or None
+    return model_list, error_message
+
 def get_setting(name, default_value):
     """Helper function to get a setting value or return a default."""
     try:
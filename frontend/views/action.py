@@ -2,26 +2,16 @@ from django.contrib import messages
 from django.shortcuts import redirect
 
 from HistoryApp import app_settings
-from backupManager.main import BrowserHistoryReader
+from frontend.utils.backup import start_backup_in_background
 
 
 def make_backup(request):
-    reader = BrowserHistoryReader()
-    chrome_history = reader.get_chrome_history()
-    if chrome_history:
-        reader.backup_history(chrome_history, "Chrome")
-
-    firefox_history = reader.get_firefox_history()
-    if firefox_history:
-        reader.backup_history(firefox_history, "Firefox")
-        # Check if backups exist
-
-    backups = list(app_settings.BACKUP_DIR.glob("*_history.json"))
-
-    if not backups:
-        messages.error(request, "Error during Backup")
+    # The extraction runs in a background thread so the request returns right away;
+    # progress and results show up on the home page backup card
+    if start_backup_in_background(force=True):
+        messages.success(request, "Backup started in the background")
     else:
-        messages.success(request, "Backup completed successfully")
+        messages.warning(request, "A backup is already running")
     return redirect('home')
 
 
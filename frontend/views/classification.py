@@ -7,7 +7,10 @@ from django.http import HttpResponse
 from django.shortcuts import render, redirect
 from django.urls import reverse
 
-from frontend.utils.classification import start_classification_with_callback, set_classification_status_complete
+from frontend.utils.classification import (start_classification_with_callback, set_classification_status_complete,
+                                           create_classification_job, get_resumable_job, resume_classification_job,
+                                           recover_stale_jobs)
+from frontend.models import ClassificationJob
 from frontend.utils.settings import get_setting, set_setting
 
 from frontend.utils.classification import classifier
@@ -23,18 +26,30 @@ def classification(request):
             messages.error(request, "No model selected in settings.")
             return redirect('settings')
 
+        # Continue the last unfinished job from its checkpoint, or start a new one
+        job = get_resumable_job() if request.POST.get('resume') == 'on' else None
+        if job is not None:
+            resume_classification_job(job)
+        else:
+            # Already classified entries are skipped unless a full reclassify is requested
+            job = create_classification_job(force=request.POST.get('force') == 'on',
+                                            sample=request.POST.get('sample') == 'on')
+
+        # Set before the thread starts, a stopped status would make its first batches skip
+        set_setting('classification_status', 0)
         # Avvia la classification in background
         threading.Thread(target=start_classification_with_callback,
                          args=(request, set_classification_status_complete),
+                         kwargs={'job': job},
                          daemon=True).start()
 
-        set_setting('classification_status', 0)
         time.sleep(2) # Attendi un attimo per assicurarti che il thread di classificazione sia avviato
         # Torni subito questa risposta JSON
         return redirect('classification')
 
     can_start_classification = None
     try:
+        recover_stale_jobs()
         status = get_setting('classification_status', default_value=1)
         if status == 0:
             can_start_classification = False
@@ -50,6 +65,7 @@ def classification(request):
     context = {
         'can_start_classification': can_start_classification,
         'last_classification_date': last_classification_date,
+        'resumable_job': get_resumable_job() if can_start_classification else None,
     }
 
     return render(request, 'frontend/classification.html', context)
@@ -66,12 +82,18 @@ def get_classification_status(request):
         'remaining': status.get('remaining', 0),
         'progress': int((status.get('processed', 0) / max(1, status.get('total', 1))) * 100) if status.get('total', 0) > 0 else 0,
         'browser': status.get('browser', 'Unknown'),
+        'cache_hits': status.get('cache_hits', 0),
+        'visit_coverage': status.get('visit_coverage', 0),
+        'duplicates': status.get('duplicates', 0),
+        'model_entries': status.get('model_entries', 0),
+        'tokens': status.get('prompt_tokens', 0) + status.get('completion_tokens', 0),
+        'completion_tokens': status.get('completion_tokens', 0),
     }
 
     db_status = get_setting('classification_status', default_value=1)
 
-    if data['remaining'] == 0 and db_status == 1:
-        # Classification is complete
+    # Complete, or ended early (stopped, out of budget, failed) and no longer running
+    if db_status == 1 and (data['remaining'] == 0 or not ClassificationJob.objects.filter(status='running').exists()):
         response = HttpResponse()
         response['HX-Redirect'] = reverse('classification')
         return response
@@ -5,8 +5,10 @@ from django.shortcuts import render
 
 from HistoryApp import app_settings
 from frontend.analytics import calculate_dashboard_analytics
-from frontend.models import HistoryEvent
+from frontend.models import HistoryEvent, VisitEvent
+from frontend.utils.classification import get_estimating_job
 from frontend.utils.dashboard import make_backup_card, dashboard_context, make_lm_studio_ping
+from frontend.utils.settings import get_setting
 
 
 # Create your views here.
@@ -46,6 +48,10 @@ def detailed_dashboard_view(request: HttpRequest) -> HttpResponse:
             last_visit__gte=start_date,
             last_visit__lte=end_date
         )
+        visits_queryset = VisitEvent.objects.filter(
+            visit_time__gte=start_date,
+            visit_time__lte=end_date
+        )
     except ValueError:
         # Handle invalid date format input, fallback to default
         start_date = (today - timedelta(days=30)).strftime('%Y-%m-%d 00:00:00')
@@ -54,10 +60,17 @@ def detailed_dashboard_view(request: HttpRequest) -> HttpResponse:
             last_visit__gte=start_date,
             last_visit__lte=end_date
         )
+        visits_queryset = VisitEvent.objects.filter(
+            visit_time__gte=start_date,
+            visit_time__lte=end_date
+        )
         # Optionally add a message to the user about the date format error
 
     # Calculate analytics using the filtered data
-    analytics_results = calculate_dashboard_analytics(base_queryset)
+    # Partly classified periods are only extrapolated from a Quick Estimate's sample
+    sample_job = get_estimating_job(start_date, end_date) \
+        if get_setting('dashboard_estimate_categories', default_value=True) else None
+    analytics_results = calculate_dashboard_analytics(base_queryset, visits_queryset, sample_job=sample_job)
     day_of_week_data = sorted(analytics_results['activity_by_day_of_week'],
                               key=lambda x: ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"].index(x['day']))
 
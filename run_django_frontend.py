@@ -45,6 +45,10 @@ def main():
 
     print(App_Settings.objects)
 
+    # Jobs left running by a previous server are marked interrupted, so they can be resumed
+    from frontend.utils.classification import recover_stale_jobs
+    recover_stale_jobs()
+
     call_command('runserver' , '9876')
 
 